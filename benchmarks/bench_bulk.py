@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Compare making resources one at a time with making them in bulk
+
+Data-driven pyplates make thousands of near-identical resources (queues,
+alarms, DNS records) from rows of data. This reads rows of queue settings
+from CSV and adds a queue for each row to a template, first with a loop
+calling Resource and cfn.resources.add for each row, then with
+Resource.from_rows and cft.resources.extend. It reports the best time of
+each, and checks that both made the same template.
+
+Usage:
+  bench_bulk.py [--resources=<n>] [--runs=<n>] [--json=<file>]
+  bench_bulk.py (-h|--help)
+
+Options:
+  --resources=<n>
+    Number of resources in the template [default: 20000]
+
+  --runs=<n>
+    Number of timed runs of each, the best is reported [default: 5]
+
+  --json=<file>
+    Also write the results to a JSON file
+
+"""
+import csv
+import gc
+import json
+import sys
+import time
+from cStringIO import StringIO
+
+from docopt import docopt
+
+from cfn_pyplates.core import CloudFormationTemplate, DependsOn, Resource
+
+
+def make_csv(count):
+    'CSV of queue settings, one row per queue'
+    out = StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['QueueName', 'DelaySeconds', 'MessageRetentionPeriod', 'VisibilityTimeout'])
+    for i in range(count):
+        writer.writerow(['queue{0}'.format(i), i % 10, 1209600, 30 + i % 5 * 30])
+    return out.getvalue()
+
+
+def queue_name(row):
+    return row['QueueName'].capitalize()
+
+
+def per_item(source):
+    'Make and add each resource in turn, the way pyplates usually do'
+    cft = CloudFormationTemplate('Bulk benchmark')
+    for row in csv.DictReader(StringIO(source)):
+        cft.resources.add(Resource(queue_name(row), 'AWS::SQS::Queue', row,
+            DependsOn('DeadLetterQueue')))
+    return cft
+
+
+def bulk(source):
+    'Make every resource with from_rows, and add them with extend'
+    cft = CloudFormationTemplate('Bulk benchmark')
+    cft.resources.extend(Resource.from_rows('AWS::SQS::Queue', csv.DictReader(StringIO(source)),
+        queue_name, attributes=DependsOn('DeadLetterQueue')))
+    return cft
+
+
+def best_time(build, source, runs):
+    'The best of several runs, collecting garbage between them'
+    times = []
+    for _ in range(runs):
+        gc.collect()
+        start = time.time()
+        build(source)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    args = docopt(__doc__)
+    count = int(args['--resources'])
+    runs = int(args['--runs'])
+    source = make_csv(count)
+
+    results = {'resources': count}
+    for build in (per_item, bulk):
+        results[build.__name__ + '_s'] = best_time(build, source, runs)
+        print '{0:<9} {1:>8.3f}s {2:>8.1f}us/resource'.format(build.__name__,
+            results[build.__name__ + '_s'], results[build.__name__ + '_s'] / count * 1e6)
+    results['speedup'] = results['per_item_s'] / results['bulk_s']
+    results['identical_output'] = per_item(source).json == bulk(source).json
+    print 'speedup: {0:.2f}x'.format(results['speedup'])
+    print 'identical output: {0}'.format(results['identical_output'])
+
+    if args['--json']:
+        with open(args['--json'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Compare pyplate generation with a cold and a warm bytecode cache
+
+Usage:
+  bench_bytecode_cache.py [--functions=<n>] [--runs=<n>]
+  bench_bytecode_cache.py (-h|--help)
+
+Options:
+  --functions=<n>
+    Number of helper functions in the synthetic pyplate [default: 2000]
+
+  --runs=<n>
+    Number of timed generations for each case [default: 10]
+
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from docopt import docopt
+
+from cfn_pyplates import cache, core
+
+helper_template = '''
+def make_bucket_{0}(name, tags=None):
+    properties = {{
+        'BucketName': join('-', ref('AWS::StackName'), name, '{0}'),
+        'AccessControl': 'Private' if {0} % 2 else 'PublicRead',
+        'Tags': ec2_tags(tags or {{'Index': '{0}'}}),
+    }}
+    if name.startswith('log'):
+        properties['LoggingConfiguration'] = {{'DestinationBucketName': ref('LogBucket')}}
+    return Resource('Bucket{0}', 'AWS::S3::Bucket', properties)
+'''
+
+
+def make_pyplate(path, functions):
+    with open(path, 'w') as pyplate:
+        pyplate.write("cft = CloudFormationTemplate('Bytecode cache benchmark')\n")
+        for i in range(functions):
+            pyplate.write(helper_template.format(i))
+        # Only call a few of the helpers; a big pyplate is mostly definitions
+        pyplate.write('for i in range(10):\n')
+        pyplate.write("    cft.resources.add(globals()['make_bucket_%d' % i]('bucket'))\n")
+
+
+def time_generate(path, runs, cold):
+    timings = []
+    for i in range(runs):
+        if cold and os.path.exists(cache.bytecode_path(path)):
+            os.unlink(cache.bytecode_path(path))
+        start = time.time()
+        core.generate_pyplate(path)
+        timings.append(time.time() - start)
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    args = docopt(__doc__)
+    functions, runs = int(args['--functions']), int(args['--runs'])
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'pyplate.py')
+        make_pyplate(path, functions)
+        print 'pyplate: {0} helper functions, {1} bytes'.format(
+            functions, os.path.getsize(path))
+
+        cold = time_generate(path, runs, cold=True)
+        # The last cold run left a cache entry behind, so every run here is warm
+        warm = time_generate(path, runs, cold=False)
+    finally:
+        shutil.rmtree(workdir)
+
+    print '{0:<6} {1:>10} {2:>10}'.format('cache', 'best (s)', 'mean (s)')
+    for label, (best, mean) in (('cold', cold), ('warm', warm)):
+        print '{0:<6} {1:>10.4f} {2:>10.4f}'.format(label, best, mean)
+    print 'speedup: {0:.1f}x'.format(cold[0] / warm[0])
+
+
+if __name__ == '__main__':
+    main()
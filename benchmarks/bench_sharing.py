@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""Compare memory use of a template with and without shared subtrees
+
+Builds a template of load balancer target groups, security groups and
+instances, which repeat the same health checks, ingress rules and tags the
+way real templates do. It's built once normally and once with sharing turned
+on (see cfn_pyplates.sharing), each in a fresh interpreter. For each, this
+reports the growth in peak RSS, the number of objects tracked by the garbage
+collector, and the time taken to build and render the template.
+
+Usage:
+  bench_sharing.py [--resources=<n>] [--json=<file>]
+  bench_sharing.py --child=<mode> [--resources=<n>]
+  bench_sharing.py (-h|--help)
+
+Options:
+  --resources=<n>
+    Number of resources in the template [default: 10000]
+
+  --json=<file>
+    Also write the results to a JSON file
+
+  --child=<mode>
+    Measure a single mode ("plain" or "shared"), and print the results as
+    JSON (used internally, each mode is run in its own interpreter)
+
+"""
+import gc
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from docopt import docopt
+
+from bench_templates import peak_rss
+from cfn_pyplates.core import CloudFormationTemplate, Resource, ec2_tags, json_options
+from cfn_pyplates.functions import get_att, ref
+
+
+def make_resource(i):
+    'Make the i-th resource: a target group, security group or instance, in turn'
+    kind = i % 3
+    tags = ec2_tags({'Environment': ref('Environment'), 'Team': 'platform', 'Service': 'web'})
+    if kind == 0:
+        return Resource('TargetGroup{0}'.format(i), 'AWS::ElasticLoadBalancingV2::TargetGroup', {
+            'Port': 80,
+            'Protocol': 'HTTP',
+            'VpcId': ref('VPC'),
+            'HealthCheckPath': '/health',
+            'HealthCheckIntervalSeconds': 30,
+            'HealthCheckTimeoutSeconds': 5,
+            'HealthyThresholdCount': 3,
+            'UnhealthyThresholdCount': 5,
+            'Matcher': {'HttpCode': '200-299'},
+            'TargetGroupAttributes': [
+                {'Key': 'deregistration_delay.timeout_seconds', 'Value': '30'},
+                {'Key': 'stickiness.enabled', 'Value': 'false'},
+            ],
+            'Tags': tags,
+        })
+    elif kind == 1:
+        return Resource('SecurityGroup{0}'.format(i), 'AWS::EC2::SecurityGroup', {
+            'GroupDescription': 'Web servers',
+            'VpcId': ref('VPC'),
+            'SecurityGroupIngress': [
+                {'IpProtocol': 'tcp', 'FromPort': port, 'ToPort': port, 'CidrIp': '10.0.0.0/8'}
+                for port in (22, 80, 443)
+            ],
+            'Tags': tags,
+        })
+    else:
+        return Resource('Instance{0}'.format(i), 'AWS::EC2::Instance', {
+            'ImageId': 'ami-00000001',
+            'InstanceType': 'm3.medium',
+            'SecurityGroupIds': [get_att('SecurityGroup{0}'.format(i - 1), 'GroupId')],
+            'BlockDeviceMappings': [{
+                'DeviceName': '/dev/xvda',
+                'Ebs': {'VolumeSize': 20, 'VolumeType': 'gp2', 'DeleteOnTermination': True},
+            }],
+            'Tags': tags,
+        })
+
+
+def measure(mode, count):
+    'Build and render the template in this process'
+    rss_before = peak_rss()
+    gc.collect()
+    objects_before = len(gc.get_objects())
+
+    start = time.time()
+    cft = CloudFormationTemplate('Sharing benchmark', share=(mode == 'shared'))
+    for i in range(count):
+        cft.resources.add(make_resource(i))
+    build = time.time() - start
+    gc.collect()
+    objects = len(gc.get_objects()) - objects_before
+
+    start = time.time()
+    output = cft.to_json(**json_options())
+    render = time.time() - start
+
+    return {
+        'mode': mode,
+        'resources': count,
+        'build_s': build,
+        'to_json_s': render,
+        'peak_rss_growth_bytes': peak_rss() - rss_before,
+        'objects': objects,
+        'output_sha1': hashlib.sha1(output).hexdigest(),
+    }
+
+
+def main():
+    args = docopt(__doc__)
+    count = int(args['--resources'])
+
+    if args['--child']:
+        json.dump(measure(args['--child'], count), sys.stdout)
+        return 0
+
+    results = {}
+    print '{0:<7} {1:>10} {2:>10} {3:>10} {4:>10}'.format(
+        'mode', 'build (s)', 'to_json', 'RSS (MB)', 'objects')
+    for mode in ('plain', 'shared'):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+            '--child', mode, '--resources', str(count)])
+        result = results[mode] = json.loads(output)
+        print '{0:<7} {1:>10.3f} {2:>10.3f} {3:>10.1f} {4:>10}'.format(
+            mode, result['build_s'], result['to_json_s'],
+            result['peak_rss_growth_bytes'] / 1024.0 / 1024, result['objects'])
+
+    plain, shared = results['plain'], results['shared']
+    print 'peak RSS saved: {0:.1%}, objects saved: {1:.1%}'.format(
+        1 - float(shared['peak_rss_growth_bytes']) / plain['peak_rss_growth_bytes'],
+        1 - float(shared['objects']) / plain['objects'])
+    print 'identical output: {0}'.format(plain['output_sha1'] == shared['output_sha1'])
+
+    if args['--json']:
+        with open(args['--json'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
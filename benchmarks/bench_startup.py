@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Measure the startup cost of cfn_pyplates and cfn_py_generate
+
+Each case is run in a fresh interpreter, several times over, and the best
+wall time is reported. For "import cfn_pyplates", the slowest imports are
+also listed, measured by wrapping __import__ much like python 3's
+``-X importtime`` does.
+
+Usage:
+  bench_startup.py [--runs=<n>] [--top=<n>] [--json=<file>]
+  bench_startup.py (-h|--help)
+
+Options:
+  --runs=<n>
+    Number of runs of each case [default: 20]
+
+  --top=<n>
+    Number of slowest imports to list [default: 10]
+
+  --json=<file>
+    Also write the results to a JSON file, for tracking over time
+
+"""
+import json
+import subprocess
+import sys
+import time
+
+from docopt import docopt
+
+cases = [
+    ('python -c pass', 'pass'),
+    ('import cfn_pyplates', 'import cfn_pyplates'),
+    ('cfn_py_generate --version', (
+        'import sys\n'
+        'from cfn_pyplates import cli\n'
+        "sys.argv = ['cfn_py_generate', '--version']\n"
+        'cli.generate()\n'
+    )),
+]
+
+# Run in a child interpreter: time every import, and report the cumulative
+# time spent in each one, including the imports it triggered itself
+importtime_script = '''
+import __builtin__, json, sys, time
+timings = {}
+_import = __builtin__.__import__
+def timed_import(name, *args, **kwargs):
+    start = time.time()
+    try:
+        return _import(name, *args, **kwargs)
+    finally:
+        timings[name] = timings.get(name, 0) + time.time() - start
+__builtin__.__import__ = timed_import
+import cfn_pyplates
+__builtin__.__import__ = _import
+heavy = ['yaml', 'docopt', 'schema', 'pkg_resources', 'multiprocessing', 'ctypes']
+json.dump({'timings': timings, 'loaded': [m for m in heavy if m in sys.modules]}, sys.stdout)
+'''
+
+
+def time_case(script, runs):
+    timings = []
+    for i in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', script], stdout=open('/dev/null', 'w'))
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def main():
+    args = docopt(__doc__)
+    runs, top = int(args['--runs']), int(args['--top'])
+
+    results = {'cases': {}}
+    print '{0:<28} {1:>10}'.format('case', 'best (ms)')
+    for label, script in cases:
+        best = time_case(script, runs)
+        results['cases'][label] = best
+        print '{0:<28} {1:>10.1f}'.format(label, best * 1000)
+
+    importtime = json.loads(subprocess.check_output([sys.executable, '-c', importtime_script]))
+    results['imports'] = importtime['timings']
+    results['heavy_modules_loaded'] = importtime['loaded']
+
+    print
+    print 'slowest imports during "import cfn_pyplates" (cumulative ms):'
+    slowest = sorted(importtime['timings'].items(), key=lambda item: item[1], reverse=True)
+    for name, elapsed in slowest[:top]:
+        print '  {0:<26} {1:>10.2f}'.format(name, elapsed * 1000)
+    print 'heavy modules loaded: {0}'.format(', '.join(importtime['loaded']) or 'none')
+
+    if args['--json']:
+        with open(args['--json'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
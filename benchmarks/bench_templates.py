@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+"""Measure how building and serializing templates scales with their size
+
+Synthetic templates are built with a range of resource counts. Each resource
+has nested properties, tags made with ec2_tags, and a handful of intrinsic
+functions. For each size, this reports:
+
+- construction: time to build the template
+- serialization: time to render it with to_json, and with write_json
+- peak RSS: growth of the process's peak resident set while building and
+  rendering the template
+- objects: python objects created per resource. Python 2 has no tracemalloc,
+  so this counts the objects tracked by the garbage collector (dicts, lists,
+  instances and so on); strings and numbers aren't included.
+
+Every size is measured in a fresh interpreter, so that peak RSS is measured
+for that size alone.
+
+Results can be written to a JSON file, and compared against a previous
+results file. Any per-resource figure that's worse than the baseline by more
+than the tolerance is reported as a regression, and the exit status is 1.
+Timings shorter than 10ms aren't compared, they're too noisy.
+
+Usage:
+  bench_templates.py [--sizes=<sizes>] [--runs=<n>] [--json=<file>]
+                     [--baseline=<file>] [--tolerance=<percent>]
+  bench_templates.py --child=<size> [--runs=<n>]
+  bench_templates.py (-h|--help)
+
+Options:
+  --sizes=<sizes>
+    Comma-separated resource counts to measure [default: 10,1000,10000,100000]
+
+  --runs=<n>
+    Number of timed runs for each size, the best is reported [default: 3]
+
+  --json=<file>
+    Write the results to a JSON file
+
+  --baseline=<file>
+    Compare the results with those in a JSON file written by --json
+
+  --tolerance=<percent>
+    How much worse than the baseline a figure can be before it's
+    reported as a regression [default: 20]
+
+  --child=<size>
+    Measure a single size, and print the results as JSON
+    (used internally, each size is run in its own interpreter)
+
+"""
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from docopt import docopt
+
+from cfn_pyplates.core import CloudFormationTemplate, DependsOn, Mapping, Parameter, Resource
+from cfn_pyplates.core import ec2_tags
+from cfn_pyplates.functions import base64, find_in_map, get_att, join, ref
+
+# Per-resource figures compared against a baseline, and whether they're timings
+compared = [
+    ('construction_us', True),
+    ('to_json_us', True),
+    ('write_json_us', True),
+    ('peak_rss_bytes', False),
+    ('objects', False),
+]
+
+
+def make_resource(i):
+    'Make a synthetic instance resource, the i-th in its template'
+    name = 'Instance{0}'.format(i)
+    properties = {
+        'ImageId': find_in_map('AMIs', ref('AWS::Region'), 'HVM'),
+        'InstanceType': 'm3.medium',
+        'SubnetId': ref('Subnet{0}'.format(i % 4)),
+        'SecurityGroupIds': [get_att('SecurityGroup', 'GroupId')],
+        'BlockDeviceMappings': [{
+            'DeviceName': '/dev/xvda',
+            'Ebs': {'VolumeSize': 20 + i % 5, 'VolumeType': 'gp2', 'DeleteOnTermination': True},
+        }],
+        'UserData': base64(join('', '#!/bin/bash\n', 'echo ', ref('AWS::StackName'), '\n')),
+        'Tags': ec2_tags({
+            'Name': join('-', ref('AWS::StackName'), name),
+            'Environment': ref('Environment'),
+            'Index': str(i),
+        }),
+    }
+    attributes = [DependsOn('Instance{0}'.format(i - 1))] if i else []
+    return Resource(name, 'AWS::EC2::Instance', properties, attributes)
+
+
+def make_template(count):
+    'Make a synthetic template with count instance resources'
+    cft = CloudFormationTemplate('Benchmark template with {0} resources'.format(count))
+    cft.parameters.add(Parameter('Environment', 'String', {'Default': 'benchmark'}))
+    cft.mappings.add(Mapping('AMIs', {
+        'us-east-1': {'HVM': 'ami-00000001'},
+        'us-west-2': {'HVM': 'ami-00000002'},
+    }))
+    for i in range(count):
+        cft.resources.add(make_resource(i))
+    return cft
+
+
+def best_of(runs, function):
+    'Call function runs times, returning the best time and the last result'
+    best = None
+    for i in range(runs):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def peak_rss():
+    'Peak resident set size of this process, in bytes'
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X reports bytes
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def measure(size, runs):
+    'Measure a single template size in this process'
+    rss_before = peak_rss()
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    cft = make_template(size)
+    objects = len(gc.get_objects()) - objects_before
+    output = cft.to_json(indent=2, separators=(',', ': '))
+    rss = peak_rss() - rss_before
+    del output
+
+    construction, cft = best_of(runs, lambda: make_template(size))
+    to_json, output = best_of(runs, lambda: cft.to_json(indent=2, separators=(',', ': ')))
+    with open(os.devnull, 'w') as devnull:
+        write_json, _ = best_of(runs, lambda: cft.write_json(
+            devnull, indent=2, separators=(',', ': ')))
+
+    return {
+        'resources': size,
+        'output_bytes': len(output),
+        'construction_s': construction,
+        'to_json_s': to_json,
+        'write_json_s': write_json,
+        'peak_rss_growth_bytes': rss,
+        'per_resource': {
+            'construction_us': construction * 1e6 / size,
+            'to_json_us': to_json * 1e6 / size,
+            'write_json_us': write_json * 1e6 / size,
+            'peak_rss_bytes': float(rss) / size,
+            'objects': float(objects) / size,
+        },
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Compare results with a baseline, printing each change
+
+    Returns the number of regressions
+
+    """
+    regressions = 0
+    print
+    print 'compared with baseline (tolerance {0:.0f}%):'.format(tolerance * 100)
+    for size, result in sorted(results['sizes'].items(), key=lambda item: int(item[0])):
+        if size not in baseline['sizes']:
+            continue
+        old = baseline['sizes'][size]
+        for metric, timing in compared:
+            if timing:
+                total = metric.replace('_us', '_s')
+                if min(result[total], old[total]) < 0.01:
+                    continue
+            before, after = old['per_resource'][metric], result['per_resource'][metric]
+            if not before:
+                continue
+            change = (after - before) / before
+            flag = ''
+            if change > tolerance:
+                flag = '  REGRESSION'
+                regressions += 1
+            print '  {0:>7} {1:<16} {2:>12.2f} -> {3:>12.2f} {4:>+8.1%}{5}'.format(
+                size, metric, before, after, change, flag)
+    return regressions
+
+
+def main():
+    args = docopt(__doc__)
+    runs = int(args['--runs'])
+
+    if args['--child']:
+        json.dump(measure(int(args['--child']), runs), sys.stdout)
+        return 0
+
+    results = {'python': sys.version, 'sizes': {}}
+    print '{0:>7} {1:>12} {2:>10} {3:>10} {4:>10} {5:>10} {6:>8}'.format(
+        'size', 'bytes', 'build (s)', 'to_json', 'write_json', 'RSS (MB)', 'objects')
+    for size in args['--sizes'].split(','):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+            '--child', size, '--runs', str(runs)])
+        result = json.loads(output)
+        results['sizes'][size] = result
+        print '{0:>7} {1:>12} {2:>10.4f} {3:>10.4f} {4:>10.4f} {5:>10.1f} {6:>8.1f}'.format(
+            result['resources'], result['output_bytes'], result['construction_s'],
+            result['to_json_s'], result['write_json_s'],
+            result['peak_rss_growth_bytes'] / 1024.0 / 1024, result['per_resource']['objects'])
+
+    if args['--json']:
+        with open(args['--json'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args['--baseline']:
+        with open(args['--baseline']) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, float(args['--tolerance']) / 100):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
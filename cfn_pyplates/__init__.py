@@ -18,5 +18,99 @@ See also:
 - https://cfn-pyplates.readthedocs.org/ (you might already be here)
 - https://github.com/seandst/cfn-pyplates/
 '''
-# inject modules into the cfn_pyplates namespace
-from cfn_pyplates import cli, core, exceptions, functions, options  # NOQA
+import glob
+import os
+import sys
+import types
+
+# Modules in the cfn_pyplates namespace. They're imported when they're first
+# used, rather than here, so that importing cfn_pyplates (which the
+# command-line tools and the cache do for version()) stays cheap.
+# (batch and watch aren't in it, they're only imported when used)
+_SUBMODULES = frozenset(['cli', 'core', 'exceptions', 'functions', 'options'])
+
+_version = None
+
+
+def version():
+    """Return the installed version of cfn_pyplates
+
+    The version is read straight from the package metadata installed next to
+    cfn_pyplates, which is much cheaper than asking pkg_resources, since that
+    scans every installed distribution. pkg_resources is still used if the
+    metadata can't be found.
+
+    """
+    # Looked up on the package in sys.modules, which is a _Package rather
+    # than the module these functions were defined in
+    package = sys.modules[__name__]
+    if package._version is None:
+        package._version = (package._read_metadata_version() or
+            package._pkg_resources_version())
+    return package._version
+
+
+def _read_metadata_version():
+    # Find PKG-INFO (eggs, develop installs) or METADATA (wheels) for
+    # cfn_pyplates next to the package directory, and read its Version
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    base_dir = os.path.dirname(package_dir)
+    candidates = []
+    for pattern in ('cfn_pyplates*.egg-info', 'cfn_pyplates-*.dist-info', 'EGG-INFO'):
+        for info in glob.glob(os.path.join(base_dir, pattern)):
+            for name in ('PKG-INFO', 'METADATA'):
+                if os.path.isfile(os.path.join(info, name)):
+                    candidates.append(os.path.join(info, name))
+            if os.path.isfile(info):
+                # distutils installs a single egg-info file
+                candidates.append(info)
+
+    # More than one set of metadata means leftovers from an old install are
+    # lying around; let pkg_resources work out which one is real
+    if len(candidates) != 1:
+        return None
+
+    with open(candidates[0]) as metadata:
+        for line in metadata:
+            if line.startswith('Version:'):
+                return line.split(':', 1)[1].strip()
+            elif not line.strip():
+                # End of the headers
+                break
+    return None
+
+
+def _pkg_resources_version():
+    try:
+        from pkg_resources import get_distribution
+        return get_distribution('cfn-pyplates').version
+    except Exception:
+        return 'unknown'
+
+
+class _Package(types.ModuleType):
+    """The cfn_pyplates package, importing its submodules when they're first used
+
+    Args:
+        module: The package's module, whose contents it takes over
+
+    """
+    def __init__(self, module):
+        super(_Package, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(vars(module))
+        # The module's functions still use its namespace, which python
+        # empties once the module itself is gone
+        self.__dict__['_module'] = module
+
+    def __getattr__(self, name):
+        if name not in _SUBMODULES:
+            raise AttributeError('\'module\' object has no attribute {0!r}'.format(name))
+        full_name = '{0}.{1}'.format(self.__name__, name)
+        __import__(full_name)
+        return sys.modules[full_name]
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | _SUBMODULES)
+
+
+sys.modules[__name__] = _Package(sys.modules[__name__])
@@ -0,0 +1,241 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Generate many pyplates in one run, spread across a pool of worker processes
+
+A batch is described by a manifest, a YAML (or JSON) list of jobs::
+
+    - pyplate: stacks/web.py
+      options: options/production.yaml
+      outfile: build/web.json
+    - pyplate: stacks/db.py
+      outfile: build/db.json
+
+Relative paths are taken relative to the directory containing the manifest.
+``options`` is optional, the other two keys are not. It can also be a list of
+options files, each overriding the ones before it, and ``define`` can be a
+list of ``key=value`` options that override them all (see
+:func:`cfn_pyplates.options.load_options`). A job can also set
+``cache: false`` to always run its pyplate, ``minify: true`` or
+``sort_keys: true`` to change how its template is formatted (see
+:func:`cfn_pyplates.core.json_options`), and ``check_refs: true`` to fail if
+its template refers to anything it doesn't define. ``spec`` is the path of
+a CloudFormation resource specification to check its resources against
+(see :mod:`cfn_pyplates.spec`). ``profile: true`` times
+the phases of generating its template (see :mod:`cfn_pyplates.timing`), and
+``count_objects: true`` counts the objects each phase leaves behind too.
+
+Workers are started once and then reused, so the cost of starting python and
+importing cfn_pyplates is paid once per worker rather than once per pyplate.
+Bear in mind that pyplates sharing a worker also share its ``sys.modules``
+and ``sys.path``.
+
+"""
+import multiprocessing
+import os
+import time
+import traceback
+from collections import namedtuple
+from cStringIO import StringIO
+
+from cfn_pyplates import cache, core, exceptions, spec, timing
+from cfn_pyplates.options import load_options, load_yaml
+
+JobResult = namedtuple('JobResult', ['job', 'ok', 'elapsed', 'error', 'profile'])
+JobResult.__new__.__defaults__ = (None,)
+"""The outcome of a single batch job
+
+- job: The job dict, as found in the manifest
+- ok: True if the template was written, False otherwise
+- elapsed: Wall time spent on the job, in seconds
+- error: The formatted traceback of a failed job, otherwise None
+- profile: The job's :class:`cfn_pyplates.timing.Profile`, if it was profiled
+"""
+
+
+def load_manifest(manifest):
+    """Load a list of batch jobs from a manifest file
+
+    Args:
+        manifest: Path to the manifest file
+
+    Returns a list of job dicts, with all paths resolved
+
+    Raises:
+        ManifestError: :exc:`cfn_pyplates.exceptions.ManifestError`
+
+    """
+    with open(manifest) as manifest_file:
+        jobs = load_yaml(manifest_file)
+
+    if not isinstance(jobs, list):
+        raise exceptions.ManifestError
+
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    resolved = []
+    for index, job in enumerate(jobs):
+        if not isinstance(job, dict) or not job.get('pyplate') or not job.get('outfile'):
+            raise exceptions.ManifestError(
+                'Manifest entry {0} needs at least a pyplate and an outfile'.format(index))
+        job = dict(job)
+        for key in ('pyplate', 'outfile'):
+            job[key] = os.path.join(base_dir, job[key])
+        if job.get('options'):
+            job['options'] = [os.path.join(base_dir, path) for path in job_options_files(job)]
+        if job.get('spec'):
+            job['spec'] = os.path.join(base_dir, job['spec'])
+        resolved.append(job)
+
+    return resolved
+
+
+def job_options_files(job):
+    'The options files of a job, which can be given as a path or a list of them'
+    options = job.get('options') or []
+    return [options] if isinstance(options, basestring) else list(options)
+
+
+def load_job_options(job):
+    """Load the options mapping for a job
+
+    An options file of ``-`` stands for the job's ``options_text``, the
+    contents of an options file given some other way, like a server's
+    clients piping them in.
+
+    Returns an :class:`cfn_pyplates.options.OptionsMapping`
+
+    """
+    sources = [StringIO(job.get('options_text') or '') if path == '-' else path
+        for path in job_options_files(job)]
+    return load_options(sources, job.get('define', ()))
+
+
+def run_job(job):
+    """Generate the template for a single batch job
+
+    Exceptions are caught and reported in the returned result, so that one
+    broken pyplate doesn't take down the rest of the batch.
+
+    Args:
+        job: A job dict, as returned by :func:`load_manifest`
+
+    Returns a :data:`JobResult`
+
+    """
+    start = time.time()
+    profile = timing.Profile(job.get('count_objects', False)) if job.get('profile') else None
+    try:
+        with timing.phase(profile, 'options'):
+            options = load_job_options(job)
+        use_cache = job.get('cache', True)
+        output_cache = cache.OutputCache() if use_cache else None
+        resource_spec = spec.ResourceSpec.load(job['spec']) if job.get('spec') else None
+
+        def write(outfile):
+            return core._generate_pyplate(job['pyplate'], options, outfile,
+                use_cache, output_cache, job.get('minify', False), job.get('sort_keys', False),
+                job.get('check_refs', False), profile, spec=resource_spec)
+        cache.write_if_changed(job['outfile'], write)
+    except Exception:
+        return JobResult(job, False, time.time() - start, traceback.format_exc(), profile)
+
+    return JobResult(job, True, time.time() - start, None, profile)
+
+
+def run_batch(jobs, processes=None):
+    """Run batch jobs, yielding a result for each one as it finishes
+
+    Args:
+        jobs: A list of job dicts, as returned by :func:`load_manifest`
+        processes: The number of worker processes to use, defaults to the
+            number of CPUs. If 1, jobs are run one at a time in this process.
+
+    Results are yielded in the order jobs finish, not the order they were given.
+
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(jobs)))
+
+    if processes == 1:
+        for job in jobs:
+            yield run_job(job)
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(run_job, jobs):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def generate_batch(manifest, processes=None, use_cache=True, minify=False, sort_keys=False,
+        check_refs=False, definitions=(), profile=None, spec_path=None):
+    """Run all the jobs in a manifest, reporting the result of each job
+
+    Args:
+        manifest: Path to the manifest file
+        processes: The number of worker processes to use, see :func:`run_batch`
+        use_cache: If False, no job uses the output or bytecode caches
+        minify: If True, every job's template is minified
+        sort_keys: If True, every job's template has its keys sorted
+        check_refs: If True, every job's template has its references checked
+        definitions: ``key=value`` options overriding every job's options
+        profile: An optional :class:`cfn_pyplates.timing.Profile`; if given,
+            every job is profiled, and their phases are merged into it
+        spec_path: The path of a resource specification to check every
+            job's resources against, see :mod:`cfn_pyplates.spec`
+
+    Returns the number of jobs that failed
+
+    """
+    jobs = load_manifest(manifest)
+    for job in jobs:
+        if not use_cache:
+            job['cache'] = False
+        if minify:
+            job['minify'] = True
+        if sort_keys:
+            job['sort_keys'] = True
+        if check_refs:
+            job['check_refs'] = True
+        if definitions:
+            job['define'] = list(job.get('define') or ()) + list(definitions)
+        if spec_path:
+            job['spec'] = spec_path
+        if profile is not None:
+            job['profile'] = True
+            job['count_objects'] = profile.count_objects
+    failures = 0
+    for result in run_batch(jobs, processes):
+        report_result(result)
+        if profile is not None and result.profile is not None:
+            profile.merge(result.profile, pyplate=result.job['pyplate'],
+                outfile=result.job['outfile'], ok=result.ok)
+        if not result.ok:
+            failures += 1
+
+    print '{0} of {1} pyplates generated'.format(len(jobs) - failures, len(jobs))
+    return failures
+
+
+def report_result(result):
+    'Print the outcome of a batch job'
+    if result.ok:
+        print 'ok     {0} -> {1} ({2:.2f}s)'.format(
+            result.job['pyplate'], result.job['outfile'], result.elapsed)
+    else:
+        print 'FAILED {0} ({1:.2f}s)'.format(result.job['pyplate'], result.elapsed)
+        print result.error
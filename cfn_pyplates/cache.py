@@ -0,0 +1,321 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Caches that let cfn_pyplates skip work it has already done
+
+Compiled pyplates are cached on disk much like python caches compiled
+modules: in a ``__pycache__`` directory next to the pyplate, as a marshalled
+code object behind a small header. The header records the interpreter's
+magic number, the pyplate's mtime and size, and a hash of its source.
+
+A cached code object is used without reading the pyplate at all if the mtime
+and size still match. If they don't, the pyplate's source is hashed, and the
+cached code is still used (and the header refreshed) if the source hasn't
+actually changed, e.g. after a fresh checkout or a ``touch``.
+
+Generated templates are cached by :class:`OutputCache`, in a per-user cache
+directory (see :func:`cache_dir`) rather than next to the pyplate.
+
+"""
+import glob
+import hashlib
+import imp
+import json
+import marshal
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import cfn_pyplates
+
+_bytecode_header = struct.Struct('<4sqq20s')
+_bytecode_suffix = '.pyplate.pyc'
+
+
+def bytecode_path(path):
+    """Return the bytecode cache path for a pyplate path
+
+    ``/path/to/template.py`` is cached as
+    ``/path/to/__pycache__/template.py.pyplate.pyc``.
+
+    """
+    directory, filename = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, '__pycache__', filename + _bytecode_suffix)
+
+
+def compile_pyplate(pyplate, use_cache=True):
+    """Compile a pyplate file object into a code object
+
+    Args:
+        pyplate: A pyplate file object
+        use_cache: If True (the default), the bytecode cache is consulted
+            and updated. If the pyplate doesn't come from a regular file, e.g.
+            it was piped in, it's always compiled.
+
+    Returns a code object ready to be exec'd
+
+    """
+    path = getattr(pyplate, 'name', '<pyplate>')
+    if not use_cache or not os.path.isfile(path):
+        return compile(pyplate.read(), path, 'exec')
+
+    stat = os.stat(path)
+    mtime, size = int(stat.st_mtime * 1000000), stat.st_size
+    cache_path = bytecode_path(path)
+    header, code = _read_bytecode(cache_path)
+
+    if header is not None and header[1:3] == (mtime, size):
+        return code
+
+    source = pyplate.read()
+    digest = hashlib.sha1(source).digest()
+    if header is None or header[3] != digest:
+        code = compile(source, path, 'exec')
+
+    # Either the code is freshly compiled, or the header is stale and needs
+    # its mtime and size refreshed. Both ways, write it back.
+    _write_bytecode(cache_path, (imp.get_magic(), mtime, size, digest), code)
+    return code
+
+
+def _read_bytecode(cache_path):
+    # Returns (header, code), or (None, None) if there's no usable cache entry
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            header = _bytecode_header.unpack(cache_file.read(_bytecode_header.size))
+            if header[0] != imp.get_magic():
+                return None, None
+            return header, marshal.load(cache_file)
+    except (IOError, OSError, EOFError, ValueError, TypeError, struct.error):
+        # Missing, unreadable, truncated or otherwise corrupt; all misses
+        return None, None
+
+
+def _write_bytecode(cache_path, header, code):
+    # Write to a temp file and move it into place, so that concurrent readers
+    # never see a partially written cache entry. Failing to write the cache
+    # (read-only checkout, etc.) is never an error.
+    try:
+        cache_dir = os.path.dirname(cache_path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as cache_file:
+                cache_file.write(_bytecode_header.pack(*header))
+                marshal.dump(code, cache_file)
+            os.rename(temp_path, cache_path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+    except (IOError, OSError):
+        pass
+
+
+def cache_dir():
+    """Return the root directory of the per-user cfn_pyplates cache
+
+    This is ``$CFN_PYPLATES_CACHE_DIR`` if that's set, otherwise
+    ``cfn-pyplates`` in ``$XDG_CACHE_HOME``, or ``~/.cache`` by default.
+
+    """
+    if os.environ.get('CFN_PYPLATES_CACHE_DIR'):
+        return os.environ['CFN_PYPLATES_CACHE_DIR']
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(xdg_cache_home, 'cfn-pyplates')
+
+
+class OutputCache(object):
+    """A content-addressed cache of generated templates
+
+    Templates are stored under a key derived from everything that went into
+    generating them: the pyplate source, the options mapping, the version
+    of cfn_pyplates and python, and the working directory the pyplate ran in.
+    Alongside each template, the modules the pyplate imported are recorded,
+    and a change to any of them is also treated as a miss.
+
+    .. note::
+
+        Files a pyplate reads by itself (a user-data script, for example)
+        aren't tracked. If a pyplate depends on files like that, turn the
+        output cache off (``cfn_py_generate --no-cache``) while editing them.
+
+    The least recently used entries are evicted once the cache grows past
+    either of its limits.
+
+    Args:
+        directory: Where to keep cached templates, defaults to
+            ``output`` in :func:`cache_dir`
+        max_size: The most bytes of templates to keep
+        max_entries: The most templates to keep
+
+    """
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024, max_entries=1024):
+        if directory is None:
+            directory = os.path.join(cache_dir(), 'output')
+        self.directory = directory
+        self.max_size = max_size
+        self.max_entries = max_entries
+
+    def key(self, pyplate, options=None, *extra):
+        """Compute the cache key for generating a pyplate
+
+        Args:
+            pyplate: A pyplate file object, which is read and rewound
+            options: The options mapping the pyplate will be given
+            extra: Anything else that affects the generated output,
+                such as JSON formatting options
+
+        Returns a hex digest
+
+        """
+        digest = hashlib.sha1()
+        digest.update(pyplate.read())
+        pyplate.seek(0)
+        # repr as a fallback makes any option value hashable; a value whose
+        # repr isn't stable just turns into a cache miss
+        digest.update(json.dumps([options or {}, extra], sort_keys=True, default=repr))
+        digest.update(cfn_pyplates.version())
+        digest.update(sys.version)
+        digest.update(os.getcwd())
+        return digest.hexdigest()
+
+    def _entry_path(self, key, suffix='.json'):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key):
+        """Look up a cached template
+
+        Returns the path of the cached template, or None on a miss
+
+        """
+        path = self._entry_path(key)
+        try:
+            with open(self._entry_path(key, '.deps')) as deps_file:
+                dependencies = json.load(deps_file)
+            for dependency, mtime, size in dependencies:
+                stat = os.stat(dependency)
+                if (stat.st_mtime, stat.st_size) != (mtime, size):
+                    return None
+            # Mark this entry as recently used
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        return path
+
+    @contextmanager
+    def store(self, key, dependencies=()):
+        """Store a template in the cache
+
+        Used as a context manager, which gives a file object to write the
+        template into. The entry is only added to the cache if the block
+        finishes without an exception.
+
+        Args:
+            key: The key to store the template under, see :meth:`key`
+            dependencies: Paths to files the template depends on
+
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        dependencies = [
+            (path, stat.st_mtime, stat.st_size)
+            for path, stat in ((path, os.stat(path)) for path in dependencies)
+        ]
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as cache_file:
+                yield cache_file
+            with open(self._entry_path(key, '.deps'), 'w') as deps_file:
+                json.dump(dependencies, deps_file)
+            os.rename(temp_path, self._entry_path(key))
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        'Drop least recently used entries until the cache is within its limits'
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_size = sum(size for mtime, size, path in entries)
+        while entries and (total_size > self.max_size or len(entries) > self.max_entries):
+            mtime, size, path = entries.pop(0)
+            total_size -= size
+            for entry_path in (path, path[:-len('.json')] + '.deps'):
+                try:
+                    os.unlink(entry_path)
+                except OSError:
+                    pass
+
+
+def write_if_changed(path, write):
+    """Write a file, leaving it untouched if its contents wouldn't change
+
+    The new contents are written to a temporary file alongside ``path``,
+    and only copied over ``path`` if the two differ. An unchanged file
+    keeps its mtime, so make-style tools further down the line stay idle.
+
+    Args:
+        path: The path of the file to write
+        write: A callable that takes a file object and writes the new
+            contents into it. If it returns something falsey, ``path`` is
+            left alone.
+
+    Returns whatever ``write`` returned
+
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w+b') as temp_file:
+            result = write(temp_file)
+            temp_file.flush()
+            if result and not _same_contents(temp_path, path):
+                # Copy rather than rename, so that path keeps its inode,
+                # permissions and ownership, just like opening it for writing
+                temp_file.seek(0)
+                with open(path, 'wb') as outfile:
+                    shutil.copyfileobj(temp_file, outfile)
+    finally:
+        os.unlink(temp_path)
+
+    return result
+
+
+def _same_contents(path, other_path, chunk_size=64 * 1024):
+    try:
+        if os.path.getsize(path) != os.path.getsize(other_path):
+            return False
+        with open(path, 'rb') as f, open(other_path, 'rb') as other:
+            while True:
+                chunk = f.read(chunk_size)
+                if chunk != other.read(chunk_size):
+                    return False
+                if not chunk:
+                    return True
+    except (IOError, OSError):
+        return False
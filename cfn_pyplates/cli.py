@@ -16,22 +16,14 @@ Documentation for CLI methods defined in this file will be that method's
 usage information as seen on the command-line.
 
 """
+import os
+import re
+import signal
 import sys
 
-import yaml
-from docopt import docopt
-from schema import Schema, Use, Or
-
-from cfn_pyplates import core
-from cfn_pyplates.options import OptionsMapping
-
-
-def _open_outfile(outfile_name):
-    'Helper function for Schema to open the outfile'
-    if outfile_name == '-':
-        return sys.stdout
-    else:
-        return open(outfile_name, 'w')
+import cfn_pyplates
+from cfn_pyplates import exceptions
+from cfn_pyplates.options import load_options
 
 
 def _open_optionfile(optionfile_name):
@@ -46,7 +38,17 @@ def generate():
     """Generate CloudFormation JSON Template based on a Pyplate
 
 Usage:
-  cfn_py_generate <pyplate> [<outfile>] [-o/--options=<options_mapping>]
+  cfn_py_generate <pyplate> [<outfile>] [-o/--options=<options_mapping>]...
+                  [-D/--define=<option>]...
+                  [--no-cache] [--minify] [--sort-keys] [--check-refs] [--spec=<file>]
+                  [--watch] [--split] [--server=<socket>]
+                  [--profile] [--profile-json=<file>] [--profile-objects]
+                  [--trace=<stacks>] [--trace-metric=<metric>] [--memory-report]
+  cfn_py_generate --batch=<manifest> [-j/--jobs=<jobs>] [-D/--define=<option>]...
+                  [--no-cache] [--minify] [--sort-keys] [--check-refs] [--spec=<file>]
+                  [--watch] [--server=<socket>]
+                  [--profile] [--profile-json=<file>] [--profile-objects]
+  cfn_py_generate --serve=<socket> [-j/--jobs=<jobs>]
   cfn_py_generate (-h|--help)
   cfn_py_generate --version
 
@@ -63,6 +65,97 @@ Options:
     Input JSON or YAML file for options mapping
     exposed in the pyplate as "options_mapping"
     (if '-', accepts input from stdin)
+    Can be given more than once, with each file overriding
+    the options of the files before it, key by key
+
+  -D --define=<option>
+    An option, as key=value, overriding the options files;
+    the value is YAML, and dots in the key set nested options
+    (e.g. -D Network.Cidr=10.0.0.0/16)
+    Can be given more than once
+
+  --batch=<manifest>
+    Generate every pyplate listed in a JSON or YAML manifest,
+    a list of jobs with "pyplate", "outfile" and optional "options" keys
+    (relative paths are relative to the manifest)
+
+  -j --jobs=<jobs>
+    Number of worker processes used by --batch or --serve
+    (defaults to the number of CPUs)
+
+  --no-cache
+    Always run the pyplate, rather than reusing a previously generated
+    template or compiled pyplate when nothing has changed
+
+  --minify
+    Output the template without indentation or spaces, making it
+    as small as possible, and report how many bytes that saved
+
+  --sort-keys
+    Output keys in sorted order, so that the same template always
+    produces the same output, however it was put together
+
+  --check-refs
+    Fail, listing the culprits, if the template refers to a parameter,
+    resource, mapping or condition that it doesn't define, or if its
+    resources depend on each other in a cycle
+
+  --spec=<file>
+    Fail, listing the culprits, if the template's resources don't
+    match this CloudFormation resource specification: unknown
+    resource types or properties, missing required properties,
+    values of the wrong type, or attributes resources don't have
+    (always generates locally, ignoring CFN_PYPLATES_SERVER)
+
+  --watch
+    Keep running, and regenerate templates whenever their pyplates,
+    options files, or the modules the pyplates import are changed
+    (needs an outfile, or --batch)
+
+  --split
+    If the template has too many resources, or is too big, for
+    CloudFormation, split its resources into nested stacks, written
+    alongside the outfile as <outfile>-NestedStack1.json and so on
+    (needs an outfile)
+
+  --serve=<socket>
+    Keep running as a server, generating pyplates for clients that
+    connect to this Unix socket
+
+  --server=<socket>
+    Have the server listening on this socket generate the templates,
+    rather than starting from scratch (defaults to the socket named by
+    the CFN_PYPLATES_SERVER environment variable, if it's set)
+
+  --profile
+    Print the wall and CPU time spent in each phase of generating
+    the templates, like loading options, running the pyplate and
+    serializing the template, to stderr (always generates locally,
+    ignoring CFN_PYPLATES_SERVER)
+
+  --profile-json=<file>
+    Profile, and also write the times to this JSON file, including
+    the times of each job of a batch
+
+  --profile-objects
+    Profile, counting the objects each phase leaves behind as well
+
+  --trace=<stacks>
+    Trace the pyplate as it runs, print the lines and functions that
+    took the most time to stderr, and write the time taken by each
+    stack of lines to this file, in the collapsed format read by
+    flame graph tools (always runs the pyplate, and ignores
+    CFN_PYPLATES_SERVER)
+
+  --trace-metric=<metric>
+    What the stacks written by --trace count: "time" in microseconds
+    (the default), "dicts" made, or "resources" added to the template
+
+  --memory-report
+    Report memory use after loading options, running the pyplate and
+    serializing the template, the number and estimated size of the
+    template's resources, properties and so on, and the lines that
+    allocated the most memory (if tracemalloc is installed) to stderr
 
   -h --help
     This usage information
@@ -78,33 +171,441 @@ WARNING!
   Be careful.
 
     """
-    from pkg_resources import require
-    version = require("cfn-pyplates")[0].version
+    # Only import what's needed when it's needed; most runs of this
+    # command are short, so startup time matters.
+    from docopt import docopt
+    from schema import Schema, Use, Or
+
+    # docopt only needs the version to print it
+    version = cfn_pyplates.version() if '--version' in sys.argv else None
     args = docopt(generate.__doc__, version=version)
     scheme = Schema({
-        '<pyplate>': Use(open),
-        '<outfile>': Or(None, Use(_open_outfile)),
-        '--options': Or(None, Use(_open_optionfile)),
+        '<pyplate>': Or(None, Use(open)),
+        '<outfile>': Or(None, str),
+        '--options': [Use(_open_optionfile)],
+        '--define': [str],
+        '--batch': Or(None, str),
+        '--jobs': Or(None, Use(int)),
+        '--no-cache': Or(True, False),
+        '--minify': Or(True, False),
+        '--sort-keys': Or(True, False),
+        '--check-refs': Or(True, False),
+        '--spec': Or(None, str),
+        '--watch': Or(True, False),
+        '--split': Or(True, False),
+        '--serve': Or(None, str),
+        '--server': Or(None, str),
+        '--profile': Or(True, False),
+        '--profile-json': Or(None, str),
+        '--profile-objects': Or(True, False),
+        '--trace': Or(None, str),
+        '--trace-metric': Or(None, 'time', 'dicts', 'resources'),
+        '--memory-report': Or(True, False),
         '--help': Or(True, False),
         '--version': Or(True, False),
     })
     args = scheme.validate(args)
 
-    options_file = args['--options']
-    if options_file:
-        options = yaml.load(options_file)
-    else:
-        options = {}
+    if args['--serve']:
+        return _serve(args)
 
-    output = core.generate_pyplate(args['<pyplate>'], OptionsMapping(options))
+    profiling = args['--profile'] or args['--profile-json'] or args['--profile-objects']
+    if profiling or args['--memory-report'] or args['--trace']:
+        return _generate_instrumented(args, profiling)
 
-    if not output:
+    if args['--watch']:
+        return _watch(args)
+
+    if args['--spec']:
+        if args['--server'] or args['--split']:
+            print 'Templates generated with --split or --server can\'t be checked with --spec'
+            return 1
+        return _generate(args)
+
+    from cfn_pyplates.serve import SERVER_ENVIRONMENT_VARIABLE
+    server = args['--server'] or os.environ.get(SERVER_ENVIRONMENT_VARIABLE)
+    if server:
+        return _generate_remotely(args, server)
+
+    return _generate(args)
+
+
+def resources():
+    """Generate typed resource classes from a CloudFormation resource specification
+
+Usage:
+  cfn_py_resources <spec> <package> [--no-cache]
+  cfn_py_resources (-h|--help)
+  cfn_py_resources --version
+
+Arguments:
+  spec
+    The resource specification file (can be gzipped, if its
+    name ends in .gz)
+
+  package
+    The directory of the package to write, with a module for each
+    service namespace; pyplates import the package by this name
+
+Options:
+  --no-cache
+    Always parse the specification, rather than using the index
+    compiled from it the last time
+
+  -h --help
+    This usage information
+
+    """
+    from docopt import docopt
+    from cfn_pyplates import spec, typed
+
+    version = cfn_pyplates.version() if '--version' in sys.argv else None
+    args = docopt(resources.__doc__, version=version)
+    try:
+        resource_spec = spec.ResourceSpec.load(args['<spec>'], not args['--no-cache'])
+    except (IOError, OSError, ValueError) as error:
+        print 'Could not load the resource specification {0}: {1}'.format(args['<spec>'], error)
+        return 1
+    written = typed.write_package(resource_spec, args['<package>'])
+    sys.stderr.write('Wrote {0} module(s) to {1}\n'.format(len(written), args['<package>']))
+    return 0
+
+
+def _generate(args, profile=None, tracer=None):
+    'Run cfn_py_generate in this process, with args already validated'
+    # Imported here rather than at the top, so --help and the other tools
+    # don't pay for loading the template machinery
+    from cfn_pyplates import cache, core, timing
+
+    if args['--batch']:
+        from cfn_pyplates import batch
+        failures = batch.generate_batch(args['--batch'], args['--jobs'],
+            not args['--no-cache'], args['--minify'], args['--sort-keys'], args['--check-refs'],
+            args['--define'], profile, args['--spec'])
+        return 1 if failures else 0
+
+    try:
+        with timing.phase(profile, 'options'):
+            options = load_options(args['--options'], args['--define'])
+    except exceptions.OptionDefinitionError as error:
+        print error.message
         return 1
 
-    if not args['<outfile>'] or args['<outfile>'] == '-':
-        print output
+    use_cache = not args['--no-cache']
+    if args['--split']:
+        return _split(args, options, use_cache)
+    output_cache = cache.OutputCache() if use_cache else None
+    resource_spec = None
+    if args['--spec']:
+        from cfn_pyplates import spec
+        try:
+            resource_spec = spec.ResourceSpec.load(args['--spec'], use_cache)
+        except (IOError, OSError, ValueError) as error:
+            print 'Could not load the resource specification {0}: {1}'.format(
+                args['--spec'], error)
+            return 1
+
+    def write(outfile):
+        return core.generate_pyplate(args['<pyplate>'], options, outfile,
+            use_cache, output_cache, args['--minify'], args['--sort-keys'], args['--check-refs'],
+            profile, tracer, resource_spec)
+
+    if args['<outfile>'] in (None, '-'):
+        # Count minified output as it's streamed, to report its size
+        stdout = _ByteCounter(sys.stdout) if args['--minify'] else sys.stdout
+        output = write(stdout)
+        if output:
+            # Terminate the streamed template like print would have
+            sys.stdout.write('\n')
+            if args['--minify']:
+                _report_size(stdout)
     else:
-        args['<outfile>'].write(output)
+        output = cache.write_if_changed(args['<outfile>'], write)
+        if output and args['--minify']:
+            _report_size(_count_file(args['<outfile>']))
+
+    if not output:
+        return 1
 
     # Explicitly return a posixy "EVERYTHING IS OKAY" 0
     return 0
+
+
+def _generate_instrumented(args, profiling):
+    'Run cfn_py_generate with --profile, --memory-report or --trace, with args already validated'
+    if args['--watch'] or args['--split'] or args['--server']:
+        print 'Only templates generated once, and without --split or --server, can be profiled'
+        return 1
+    if args['--batch'] and (args['--memory-report'] or args['--trace']):
+        print 'Only a single pyplate can be traced or have its memory reported, not a batch'
+        return 1
+
+    from cfn_pyplates import timing
+
+    if args['--memory-report']:
+        from cfn_pyplates import memory
+        profile = memory.MemoryProfile(args['--profile-objects'])
+        profile.start()
+    else:
+        profile = timing.Profile(args['--profile-objects'])
+    tracer = None
+    if args['--trace']:
+        from cfn_pyplates import tracing
+        tracer = tracing.Tracer()
+
+    try:
+        return _generate(args, profile, tracer)
+    finally:
+        if args['--memory-report']:
+            profile.stop()
+            profile.report_memory()
+        if profiling:
+            profile.report()
+            if args['--profile-json']:
+                profile.write_json(args['--profile-json'])
+        if tracer is not None:
+            tracer.report()
+            with open(args['--trace'], 'w') as stacks:
+                tracer.write_collapsed(stacks, args['--trace-metric'] or 'time')
+
+
+def _split(args, options, use_cache):
+    'Run cfn_py_generate --split, with args already validated'
+    from cfn_pyplates import nesting
+
+    if args['<outfile>'] in (None, '-'):
+        print 'An outfile is needed to split a template'
+        return 1
+    paths = nesting.generate_split(args['<pyplate>'], options, args['<outfile>'], use_cache,
+        args['--minify'], args['--sort-keys'], args['--check-refs'])
+    return 0 if paths else 1
+
+
+def _serve(args):
+    'Run cfn_py_generate --serve, with args already validated'
+    from cfn_pyplates import serve
+
+    server = serve.Server(args['--serve'], args['--jobs'])
+    server.listen()
+    # Clean up the socket and workers when stopped, as well as interrupted
+    signal.signal(signal.SIGTERM, _exit)
+    sys.stderr.write('Serving on {0}\n'.format(args['--serve']))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _exit(signum, frame):
+    'A signal handler exiting cleanly'
+    sys.exit(0)
+
+
+def _generate_remotely(args, server):
+    'Run cfn_py_generate with a server, with args already validated'
+    import socket
+    from cfn_pyplates import serve
+
+    message = {'cwd': os.getcwd(), 'environ': serve.client_environ()}
+    if args['--no-cache']:
+        message['cache'] = False
+    for key in ('minify', 'sort_keys', 'check_refs', 'split'):
+        if args['--' + key.replace('_', '-')]:
+            message[key] = True
+    if args['--define']:
+        message['define'] = args['--define']
+
+    outfile = args['<outfile>']
+    if args['--batch']:
+        message['batch'] = os.path.abspath(args['--batch'])
+    else:
+        args['<pyplate>'].close()
+        message['pyplate'] = os.path.abspath(args['<pyplate>'].name)
+        if outfile not in (None, '-'):
+            message['outfile'] = os.path.abspath(outfile)
+        elif args['--split']:
+            print 'An outfile is needed to split a template'
+            return 1
+        message['options'] = []
+        for options_file in args['--options']:
+            if options_file is sys.stdin:
+                message['options'].append('-')
+                message['options_text'] = sys.stdin.read()
+            else:
+                options_file.close()
+                message['options'].append(os.path.abspath(options_file.name))
+
+    try:
+        reply = serve.request(server, message)
+    except socket.error as error:
+        print 'Could not reach the server at {0}: {1}'.format(server, error)
+        return 1
+
+    if args['--batch']:
+        from cfn_pyplates import batch
+        for result in reply['results']:
+            error = result.get('error')
+            batch.report_result(batch.JobResult(result, result['ok'], result['elapsed'],
+                error and error['traceback']))
+        failures = sum(1 for result in reply['results'] if not result['ok'])
+        print '{0} of {1} pyplates generated'.format(len(reply['results']) - failures,
+            len(reply['results']))
+        return 1 if failures else 0
+
+    if not reply['ok']:
+        print 'Error processing the pyplate:'
+        print reply['error']['traceback']
+        return 1
+
+    if 'template' in reply:
+        sys.stdout.write(reply['template'].encode('utf-8'))
+        sys.stdout.write('\n')
+        if args['--minify']:
+            counter = _ByteCounter()
+            counter.write(reply['template'])
+            _report_size(counter)
+    elif args['--split']:
+        if len(reply['outfiles']) > 1:
+            sys.stderr.write('Split the template into {0} nested stacks\n'.format(
+                len(reply['outfiles']) - 1))
+    elif args['--minify']:
+        _report_size(_count_file(outfile))
+    return 0
+
+
+def _watch(args):
+    'Run cfn_py_generate --watch, with args already validated'
+    from cfn_pyplates import batch, watch
+
+    if args['--split']:
+        print 'Split templates cannot be watched'
+        return 1
+    if args['--batch']:
+        jobs = batch.load_manifest(args['--batch'])
+    elif args['<outfile>'] in (None, '-'):
+        print 'An outfile is needed to watch a pyplate'
+        return 1
+    else:
+        args['<pyplate>'].close()
+        job = {'pyplate': args['<pyplate>'].name, 'outfile': args['<outfile>']}
+        if sys.stdin in args['--options']:
+            print 'Options from stdin cannot be watched'
+            return 1
+        job['options'] = [options_file.name for options_file in args['--options']]
+        jobs = [job]
+
+    for job in jobs:
+        if args['--no-cache']:
+            job['cache'] = False
+        if args['--minify']:
+            job['minify'] = True
+        if args['--sort-keys']:
+            job['sort_keys'] = True
+        if args['--check-refs']:
+            job['check_refs'] = True
+        if args['--spec']:
+            job['spec'] = args['--spec']
+        if args['--define']:
+            job['define'] = list(job.get('define') or ()) + args['--define']
+
+    watch.Watch(jobs).run()
+    return 0
+
+
+class _ByteCounter(object):
+    """A file-like object passing minified JSON along to a stream, and counting its bytes
+
+    As well as the bytes written, it counts how many bytes the same JSON
+    would have taken indented, as it goes, so nothing needs keeping.
+
+    """
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.size = 0
+        # Indenting adds a newline and indentation after every opening
+        # bracket (unless the brackets are empty), comma and before every
+        # closing bracket, and a space after every colon
+        self.indented_size = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._opened = False
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.size += len(data)
+        self._count_indentation(data)
+        if self.stream is not None:
+            self.stream.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _count_indentation(self, data):
+        added = 0
+        # Skip the character escaped at the end of the last write
+        skip_to = 1 if self._escaped else 0
+        self._escaped = False
+        for match in _json_tokens.finditer(data):
+            position = match.start()
+            if position < skip_to:
+                continue
+            char = match.group()
+            if self._in_string:
+                if char == '"':
+                    self._in_string = False
+                elif char == '\\':
+                    skip_to = position + 2
+                    self._escaped = skip_to > len(data)
+                continue
+            if self._opened:
+                self._opened = False
+                if char in '}]':
+                    # Empty brackets stay as they are
+                    self._depth -= 1
+                    continue
+                added += 1 + 2 * self._depth
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+                self._opened = True
+            elif char in '}]':
+                self._depth -= 1
+                added += 1 + 2 * self._depth
+            elif char == ',':
+                added += 1 + 2 * self._depth
+            elif char == ':':
+                added += 1
+        self.indented_size += len(data) + added
+
+
+# The characters of minified JSON that matter for indenting it
+_json_tokens = re.compile(r'[{}\[\],:"\\]')
+
+
+def _count_file(path):
+    # Count a minified file's bytes with a _ByteCounter, a piece at a time
+    counter = _ByteCounter()
+    with open(path, 'rb') as minified:
+        for data in iter(lambda: minified.read(65536), ''):
+            counter.write(data)
+    return counter
+
+
+# CloudFormation's limit on templates passed inline, rather than from S3
+INLINE_TEMPLATE_LIMIT = 51200
+
+
+def _report_size(counter):
+    'Report the size of a minified template, what minifying saved, and whether it fits inline'
+    saved = counter.indented_size - counter.size
+    sys.stderr.write('Minified template is {0:,} bytes, {1:,} bytes ({2:.1%}) smaller '
+        'than indented\n'.format(counter.size, saved,
+            float(saved) / counter.indented_size if counter.indented_size else 0))
+    if counter.size > INLINE_TEMPLATE_LIMIT:
+        sys.stderr.write('Template is over the {0:,} byte limit for inline templates, '
+            'upload it to S3 to use it\n'.format(INLINE_TEMPLATE_LIMIT))
@@ -14,17 +14,25 @@
 
 These are all available without preamble in a pyplate's global namespace.
 """
-import inspect
 import json
+import os
+import re
+import shutil
+import sys
 import traceback
+import types
 import warnings
+import weakref
 from collections import OrderedDict
 
-from cfn_pyplates import exceptions
+from cfn_pyplates import cache, encoder, exceptions, graph, hashing, references, sharing, timing
 import functions
 
 aws_template_format_version = '2010-09-09'
 
+# Resources are named with letters and digits only
+_resource_name = re.compile(r'^[A-Za-z0-9]+$')
+
 __all__ = [
     'JSONableDict',
     'CloudFormationTemplate',
@@ -48,7 +56,7 @@ __all__ = [
 ]
 
 
-class JSONableDict(OrderedDict):
+class JSONableDict(functions._CachedFragment, sharing.CopyOnWriteDict):
     """A dictionary that knows how to turn itself into JSON
 
     Args:
@@ -69,8 +77,37 @@ class JSONableDict(OrderedDict):
         JSONableDict({'Key1': 'Value1', 'Key2', 'Value2'}, 'Name'})
 
     Based on :class:`ordereddict.OrderedDict`, the order of keys is significant.
+    If the template shares repeated values (see :mod:`cfn_pyplates.sharing`),
+    getting a shared value by key gives a private copy that's safe to change.
+
+    Every JSONableDict has a :attr:`digest` of its contents, worked out when
+    it's first asked for and then kept until the JSONableDict, or one of the
+    JSONableDicts in it, is changed. See :mod:`cfn_pyplates.hashing`.
+
+    Rendering a template made with ``cache_json=True`` remembers the JSON of
+    each JSONableDict in it in the same way, so rendering it again only
+    encodes the parts that changed. JSON isn't remembered for a JSONableDict
+    with a plain dict or list in it, or in one of the JSONableDicts in it,
+    since those can be changed without it noticing. See
+    :class:`CloudFormationTemplate`.
 
     """
+    # Whether values are shared as children are added, see CloudFormationTemplate
+    _share = False
+    # Whether the JSON of the JSONableDicts in it is remembered, see CloudFormationTemplate
+    _cache_json = False
+    # The digest of the contents and the remembered JSON, or None if they
+    # need working out again, and weak references to the JSONableDicts that
+    # included them in their own. All are kept in __dict__ directly,
+    # skipping __setattr__.
+    _digest = None
+    _fragments = None
+    _parents = ()
+    # Whether a plain dict or list was found in it when it was last encoded
+    _volatile = False
+    # Unlike interned values, JSONableDicts only remember their JSON when asked, see encoder
+    _hash = None
+
     def __init__(self, update_dict=None, name=None):
         super(JSONableDict, self).__init__()
         self._name = name
@@ -101,6 +138,44 @@ class JSONableDict(OrderedDict):
             self.remove(attr)
         super(JSONableDict, self).__delattr__(name)
 
+    def __getitem__(self, key):
+        if (self._digest is not None or self._fragments is not None) and type(
+                dict.__getitem__(self, key)) in sharing._shared_types:
+            # The shared value is swapped for a private copy that might be
+            # changed in place, so this JSONableDict's digest and JSON can't be kept
+            self._changed()
+        return super(JSONableDict, self).__getitem__(key)
+
+    def __setitem__(self, key, value, *args, **kwargs):
+        if self._digest is not None or self._fragments is not None:
+            self._changed()
+        super(JSONableDict, self).__setitem__(key, value, *args, **kwargs)
+
+    def __delitem__(self, key, *args, **kwargs):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, JSONableDict):
+            value._unlink(self)
+        if self._digest is not None or self._fragments is not None:
+            self._changed()
+        super(JSONableDict, self).__delitem__(key, *args, **kwargs)
+
+    def clear(self):
+        if self._digest is not None or self._fragments is not None:
+            self._changed()
+        super(JSONableDict, self).clear()
+
+    def __reduce__(self):
+        # Copies and pickles work out their own digests and JSON, and have no parents
+        reduced = super(JSONableDict, self).__reduce__()
+        if len(reduced) > 2:
+            state = dict(reduced[2])
+            state.pop('_digest', None)
+            state.pop('_fragments', None)
+            state.pop('_parents', None)
+            state.pop('_volatile', None)
+            reduced = reduced[:2] + (state,) + reduced[3:]
+        return reduced
+
     def _get_name(self):
         if self._name is not None:
             return self._name
@@ -123,7 +198,7 @@ class JSONableDict(OrderedDict):
     @property
     def json(self):
         'Accessor to the canonical JSON representation of a JSONableDict'
-        return self.to_json(indent=2, separators=(',', ': '))
+        return self.to_json(**json_options())
 
     def add(self, child):
         """Add a child node
@@ -136,14 +211,41 @@ class JSONableDict(OrderedDict):
 
         """
         if isinstance(child, JSONableDict):
-            self.update(
-                {child.name: child}
-            )
+            if self._share:
+                child._share_contents()
+            self[child.name] = child
         else:
             raise exceptions.AddRemoveError
 
         return child
 
+    def extend(self, children):
+        """Add many child nodes at once
+
+        Every child is checked before any are added, so either all of them
+        are added or none are.
+
+        Args:
+            children: An iterable of JSONableDicts, such as the resources
+                made by :meth:`Resource.from_rows`
+
+        Raises:
+            AddRemoveError: :exc:`cfn_pyplates.exceptions.AddRemoveError`
+
+        Returns a list of the children
+
+        """
+        children = list(children)
+        for child in children:
+            if not isinstance(child, JSONableDict):
+                raise exceptions.AddRemoveError
+        share = self._share
+        for child in children:
+            if share:
+                child._share_contents()
+            self[child.name] = child
+        return children
+
     def remove(self, child):
         """Remove a child node
 
@@ -170,10 +272,173 @@ class JSONableDict(OrderedDict):
         """Thin wrapper around the :func:`json.dumps` method.
 
         Allows for passing any arguments that json.dumps would accept to
-        completely customize the JSON output if desired.
+        completely customize the JSON output if desired. Unless another ``cls``
+        is given, :class:`cfn_pyplates.encoder.TemplateEncoder` is used.
+
+        """
+        self._encoder_options(kwargs)
+        return json.dumps(self._encodable(), *args, **kwargs)
+
+    def iter_json(self, **kwargs):
+        """Incrementally encode this JSONableDict, yielding chunks of JSON
+
+        Accepts the same keyword arguments as :func:`json.dumps`, and the
+        chunks joined together are identical to the output of :meth:`to_json`.
+        Since nothing is joined up front, memory use grows with the nesting
+        depth of the JSONableDict rather than the size of its output, unless
+        its JSON is being remembered (see :class:`CloudFormationTemplate`).
+
+        """
+        self._encoder_options(kwargs)
+        cls = kwargs.pop('cls')
+        return cls(**kwargs).iterencode(self._encodable())
+
+    def write_json(self, fp, **kwargs):
+        """Stream the JSON representation of this JSONableDict into a file object
+
+        Args:
+            fp: A file-like object with a ``writelines`` method, such as an
+                open file or ``sys.stdout``
+
+        Any other keyword arguments are passed along to :meth:`iter_json`.
+
+        """
+        fp.writelines(self.iter_json(**kwargs))
+
+    def _encoder_options(self, kwargs):
+        # Use TemplateEncoder unless told otherwise, remembering JSON if this should
+        kwargs.setdefault('cls', encoder.TemplateEncoder)
+        if self._cache_json and issubclass(kwargs['cls'], encoder.TemplateEncoder):
+            kwargs.setdefault('cache_fragments', True)
+
+    @property
+    def digest(self):
+        """The digest of this JSONableDict's contents, as a hex string
+
+        JSONableDicts with the same digest encode as the same JSON, and it's
+        only worked out again for the parts that changed since it was last
+        asked for. See :mod:`cfn_pyplates.hashing`.
+
+        Changes are noticed when they're made through a JSONableDict. Plain
+        dicts and lists can be changed in place without it noticing, so the
+        digest isn't kept for a JSONableDict with one in it, or in one of the
+        JSONableDicts in it; that part is hashed again each time instead.
+
+        """
+        return self._content_digest().encode('hex')
+
+    def changes(self, other):
+        """The paths of the values that differ between this JSONableDict and another
+
+        Args:
+            other: The JSONableDict, or dict, to compare this one to
+
+        Returns a list of tuples of keys, see :func:`cfn_pyplates.hashing.changes`
 
         """
-        return json.dumps(self, *args, **kwargs)
+        return hashing.changes(other, self)
+
+    def invalidate(self):
+        'Work out the digest and JSON of this JSONableDict, and those it\'s in, again next time'
+        self._changed()
+
+    def _fragment(self, key, level, encode):
+        # Encoded JSON, remembered until this JSONableDict changes, see
+        # functions._CachedFragment. It's only kept once all of it has been
+        # encoded, so what's remembered is always up to date, and only if
+        # nothing in it can be changed without this JSONableDict noticing.
+        fragments = self._fragments
+        try:
+            return fragments[key, level]
+        except (TypeError, KeyError):
+            pass
+        fragment = encode(self, level)
+        volatile = self.__dict__['_volatile'] = self._link_children()
+        if volatile:
+            return fragment
+        fragments = self._fragments
+        if fragments is None:
+            fragments = self.__dict__['_fragments'] = {}
+        fragments[key, level] = fragment
+        return fragment
+
+    def _content_digest(self):
+        # The digest as bytes, see hashing.digest
+        digest = self._digest
+        if digest is None:
+            digest = hashing.dict_digest(self._encodable(), self)
+            # Only kept if nothing in it can change unnoticed, like its JSON
+            volatile = self.__dict__['_volatile'] = self._link_children()
+            if not volatile:
+                self.__dict__['_digest'] = digest
+        return digest
+
+    def _changed(self):
+        # Forget the digests and JSON of this JSONableDict and everything
+        # it's in. A JSONableDict's digest or JSON is only known when its
+        # children's are, so there's no need to go past one that's already
+        # forgotten both.
+        pending = [self]
+        while pending:
+            node = pending.pop()
+            if node._digest is None and node._fragments is None:
+                continue
+            node.__dict__['_digest'] = None
+            node.__dict__['_fragments'] = None
+            for ref in node._parents:
+                parent = ref()
+                if parent is not None:
+                    pending.append(parent)
+
+    def _link(self, parent):
+        # Note a JSONableDict whose digest or JSON includes this one's
+        parents = [ref for ref in self._parents if ref() is not None]
+        if not any(ref() is parent for ref in parents):
+            parents.append(weakref.ref(parent))
+        self.__dict__['_parents'] = parents
+
+    def _link_children(self):
+        # Link the JSONableDicts in this one, including those in its plain
+        # dicts and lists, whose JSON was just encoded as part of this one's.
+        # Returns whether there are any plain dicts or lists in it, or in the
+        # JSONableDicts in it, which could be changed in place unnoticed.
+        volatile = False
+        pending = list(dict.itervalues(self))
+        while pending:
+            value = pending.pop()
+            if isinstance(value, JSONableDict):
+                value._link(self)
+                volatile = volatile or value._volatile
+            elif isinstance(value, functions._CachedFragment):
+                # Interned values can't change, but intrinsics that aren't
+                # interned can hold plain dicts and lists that can
+                if value._hash is None:
+                    pending.extend(dict.itervalues(value))
+            elif isinstance(value, dict):
+                volatile = True
+                pending.extend(dict.itervalues(value))
+            elif isinstance(value, (list, tuple)):
+                volatile = volatile or isinstance(value, list)
+                pending.extend(value)
+        return volatile
+
+    def _unlink(self, parent):
+        # This JSONableDict was taken out of parent
+        self.__dict__['_parents'] = [ref for ref in self._parents
+            if ref() is not None and ref() is not parent]
+
+    def _encodable(self):
+        # The object that actually gets handed to the JSON encoder
+        return self
+
+    def _share_contents(self):
+        # Share this JSONableDict's values, and those of any children added later
+        self._share = True
+        for key in self:
+            value = dict.__getitem__(self, key)
+            shared = sharing.share(value)
+            if shared is not value:
+                dict.__setitem__(self, key, shared)
 
 
 class CloudFormationTemplate(JSONableDict):
@@ -189,11 +454,40 @@ class CloudFormationTemplate(JSONableDict):
     - Outputs
     - Conditions
 
+    Any section that's still empty when the template is rendered is left out
+    of the rendered JSON, but stays attached to the template.
+
+    The template's ``references`` attribute is a
+    :class:`cfn_pyplates.references.ReferenceIndex`, kept up to date as
+    parameters, mappings, resources, outputs and conditions are added and
+    removed. Use it to find what refers to a name, or to check that
+    everything referred to exists.
+
+    Args:
+        description: The template's description
+        options: The pyplate's options mapping
+        share: If True, repeated dicts and lists in the template are only
+            stored once, as they're added to the template. See
+            :mod:`cfn_pyplates.sharing`.
+        cache_json: If True, rendering the template remembers the JSON of
+            each section, resource, properties and so on, until it's changed.
+            Rendering the template again then copies the JSON of anything
+            that hasn't changed since, rather than encoding it again, at the
+            cost of keeping it in memory. Worth it for tools that keep a
+            template around and render it after each change. Anything with
+            a plain dict or list in it is encoded every time, since it could
+            be changed in place, so it's best used with ``share=True``.
+
     For more information, see `the AWS docs <cfn-template_>`_
 
 
     """
-    def __init__(self, description=None, options=None):
+    def __init__(self, description=None, options=None, share=False, cache_json=False):
+        # Keys of the template's sections, see __setitem__
+        self._sections = set()
+        self._share = share
+        self._cache_json = cache_json
+        self.references = references.ReferenceIndex()
         super(CloudFormationTemplate, self).__init__({
             'AWSTemplateFormatVersion': aws_template_format_version,
         })
@@ -211,26 +505,91 @@ class CloudFormationTemplate(JSONableDict):
         self.outputs = Outputs()
         self.conditions = Conditions()
 
-    def __unicode__(self):
-        # Before outputting to json, remove empty elements
-        def predicate(obj):
-            """getmembers predicate to find empty JSONableDict attributes attached to self
+    def __setitem__(self, key, value, *args, **kwargs):
+        # Any JSONableDict at the top level of the template is a section
+        if isinstance(value, JSONableDict):
+            self._sections.add(key)
+        else:
+            self._sections.discard(key)
+        super(CloudFormationTemplate, self).__setitem__(key, value, *args, **kwargs)
+        if isinstance(value, JSONableDict) and key in references.SECTIONS:
+            self.references.attach(key, value)
+        else:
+            self.references.detach(key)
+
+    def __delitem__(self, key, *args, **kwargs):
+        super(CloudFormationTemplate, self).__delitem__(key, *args, **kwargs)
+        self._sections.discard(key)
+        self.references.detach(key)
+
+    def __eq__(self, other):
+        # Templates are equal if they'd render the same JSON
+        if isinstance(other, CloudFormationTemplate):
+            return self._content_digest() == other._content_digest()
+        return super(CloudFormationTemplate, self).__eq__(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def share_subtrees(self):
+        """Store repeated dicts and lists in this template only once
 
-            CloudFormation doesn't like empty mappings for these top-level
-            attributes, so any falsey JSONableDict that's at attribute on
-            the CloudFormationTemplate instance needs to get removed
+        Shares everything already in the template, and anything added to it
+        from now on. See :mod:`cfn_pyplates.sharing`.
 
-            """
-            if isinstance(obj, JSONableDict) and not obj:
-                return True
-        for attr, mapping in inspect.getmembers(self, predicate):
-            delattr(self, attr)
+        """
+        self._share_contents()
+
+    def dependency_graph(self):
+        """The dependencies between this template's resources, as they stand
 
-        return super(CloudFormationTemplate, self).__unicode__()
+        Returns a :class:`cfn_pyplates.graph.DependencyGraph`
+
+        """
+        return graph.DependencyGraph.from_template(self)
+
+    def _content_digest(self):
+        # Empty sections are left out of the digest, but adding to one still
+        # has to change it, so they're linked to the template all the same
+        if self._digest is None:
+            for key in self._sections:
+                section = dict.__getitem__(self, key)
+                section._link(self)
+                section._content_digest()
+        return super(CloudFormationTemplate, self)._content_digest()
+
+    def _encodable(self):
+        # CloudFormation doesn't like empty mappings for the top-level
+        # sections, so leave out any section that's empty. The template itself
+        # is left alone, so rendering has no side effects and can be repeated.
+        return OrderedDict(
+            (key, value) for key, value in self.iteritems()
+            if value or key not in self._sections
+        )
 
 
 # CloudFormationTemplate base elements
-class Parameters(JSONableDict):
+class _Section(JSONableDict):
+    # A section whose entries are indexed by its template's ReferenceIndex,
+    # which attaches itself as _references
+    _references = None
+
+    def __setitem__(self, key, value, *args, **kwargs):
+        super(_Section, self).__setitem__(key, value, *args, **kwargs)
+        if self._references is not None:
+            self._references.added(self.name, key, value)
+
+    def __delitem__(self, key, *args, **kwargs):
+        super(_Section, self).__delitem__(key, *args, **kwargs)
+        if self._references is not None:
+            self._references.removed(self.name, key)
+
+    def clear(self):
+        for key in self.keys():
+            del self[key]
+
+
+class Parameters(_Section):
     """The base Container for parameters used at stack creation
 
     Attached to a :class:`cfn_pyplates.core.CloudFormationTemplate`
@@ -241,7 +600,7 @@ class Parameters(JSONableDict):
     pass
 
 
-class Mappings(JSONableDict):
+class Mappings(_Section):
     """The base Container for stack option mappings
 
     .. note::
@@ -257,7 +616,7 @@ class Mappings(JSONableDict):
     pass
 
 
-class Resources(JSONableDict):
+class Resources(_Section):
     """The base Container for stack resources
 
     Attached to a :class:`cfn_pyplates.core.CloudFormationTemplate`
@@ -268,7 +627,7 @@ class Resources(JSONableDict):
     pass
 
 
-class Outputs(JSONableDict):
+class Outputs(_Section):
     """The base Container for stack outputs
 
     Attached to a :class:`cfn_pyplates.core.CloudFormationTemplate`
@@ -279,7 +638,7 @@ class Outputs(JSONableDict):
     pass
 
 
-class Conditions(JSONableDict):
+class Conditions(_Section):
     """The base Container for stack conditions used at stack creation
 
     Attached to a :class:`cfn_pyplates.core.CloudFormationTemplate`
@@ -336,18 +695,51 @@ class Resource(JSONableDict):
     """
 
     def __init__(self, name, type, properties=None, attributes=[]):
-        update_dict = {'Type': type}
-        super(Resource, self).__init__(update_dict, name)
+        super(Resource, self).__init__(None, name)
+        self['Type'] = type
         if properties:
-            try:
-                # Assume we've got a JSONableDict
-                self.add(properties)
-            except exceptions.AddRemoveError:
-                # If not, coerce it
-                self.add(Properties(properties))
+            if not isinstance(properties, JSONableDict):
+                properties = Properties(properties)
+            self.add(properties)
         if attributes:
             self._add_attributes(attributes)
 
+    @classmethod
+    def from_rows(cls, type, rows, name_fn, properties_fn=None, attributes=[]):
+        """Make a resource of one type from each row of some data
+
+        For templates with many resources that only differ by a few values,
+        like a queue or a DNS record for each line of a CSV file. Every row
+        is checked before any resources are made::
+
+            with open('queues.csv') as queues:
+                cft.resources.extend(Resource.from_rows('AWS::SQS::Queue',
+                    csv.DictReader(queues), lambda row: row['QueueName'] + 'Queue'))
+
+        Args:
+            type: The type of the resources
+            rows: An iterable of dicts, such as a :class:`csv.DictReader`
+            name_fn: A function that takes a row, and returns the name of its
+                resource
+            properties_fn: An optional function that takes a row, and returns
+                its resource's properties. Without one, each row is used as
+                the properties.
+            attributes: Optional attributes for every resource, as for
+                :class:`Resource`
+
+        Raises:
+            ResourceRowError: :exc:`cfn_pyplates.exceptions.ResourceRowError`,
+            if a resource name isn't alphanumeric or is used twice, or a
+            row's properties aren't a dict
+
+        Returns a list of the resources, in the order of the rows
+
+        """
+        rows = _check_rows(rows, name_fn, properties_fn)
+        if cls.__init__.im_func is not Resource.__init__.im_func:
+            return [cls(name, type, properties, attributes) for name, properties in rows]
+        return _bulk_resources(cls, type, rows, attributes)
+
     def _add_attributes(self, attribute):
         """Is the Object a valid Resource Attribute?
         :param attribute: the object under test
@@ -358,7 +750,7 @@ class Resource(JSONableDict):
         elif attribute.__class__.__name__ in ['Metadata', 'UpdatePolicy', 'CreationPolicy']:
             self.add(attribute)
         elif attribute.__class__.__name__ in ['DependsOn', 'DeletionPolicy', 'Condition']:
-            self.update({attribute.__class__.__name__: attribute.value})
+            self[attribute.__class__.__name__] = attribute.value
 
 
 class Parameter(JSONableDict):
@@ -549,6 +941,77 @@ class Condition(JSONableDict):
         self.value = name
 
 
+def _check_rows(rows, name_fn, properties_fn=None):
+    """Check the rows given to :meth:`Resource.from_rows`
+
+    Returns a list of each row's resource name and properties
+
+    """
+    checked = []
+    names = set()
+    for index, row in enumerate(rows):
+        name = name_fn(row)
+        properties = row if properties_fn is None else properties_fn(row)
+        if not isinstance(name, basestring) or _resource_name.match(name) is None:
+            raise exceptions.ResourceRowError('Row {0}: {1!r} isn\'t a resource name, which '
+                'can only have letters and digits'.format(index, name))
+        if name in names:
+            raise exceptions.ResourceRowError('Row {0}: {1} is the name of an earlier '
+                'row\'s resource'.format(index, name))
+        if not isinstance(properties, dict):
+            raise exceptions.ResourceRowError('Row {0}: the properties of {1} should be a '
+                'dict, not {2!r}'.format(index, name, properties))
+        names.add(name)
+        checked.append((name, properties))
+    return checked
+
+
+def _bare(cls, name=None):
+    """A new, empty JSONableDict, made without calling __init__
+
+    Setting up python 2's OrderedDict, which goes through __setattr__, is most
+    of the cost of making a small JSONableDict, and adds up when making
+    thousands. Nothing is done with a bare JSONableDict until its items are
+    set with _ordered_setitem, which skips JSONableDict.__setitem__ since a
+    new JSONableDict has no digest to forget.
+
+    """
+    bare = cls.__new__(cls)
+    # What OrderedDict.__init__ sets up in python 2.7: the sentinel of its
+    # linked list of keys, and the map of keys to links. Calling __init__
+    # instead costs a third of the time saved making resources in bulk
+    # (benchmarks/bench_bulk.py); test_bare_ordered_dict checks that bare
+    # JSONableDicts behave like any other OrderedDict.
+    root = []
+    root[:] = [root, root, None]
+    bare.__dict__.update(_OrderedDict__root=root, _OrderedDict__map={}, _name=name)
+    return bare
+
+_ordered_setitem = OrderedDict.__setitem__
+
+
+def _bulk_resources(cls, resource_type, rows, attributes):
+    # Resources made from checked rows, the same as cls(name, type, properties, attributes)
+    resources = []
+    for name, properties in rows:
+        resource = _bare(cls, name)
+        _ordered_setitem(resource, 'Type', resource_type)
+        if properties:
+            if not isinstance(properties, JSONableDict):
+                if type(properties) is dict or type(properties) is OrderedDict:
+                    items = properties
+                    properties = _bare(Properties)
+                    for key, value in items.iteritems():
+                        _ordered_setitem(properties, key, value)
+                else:
+                    properties = Properties(properties)
+            _ordered_setitem(resource, properties.name, properties)
+        if attributes:
+            resource._add_attributes(attributes)
+        resources.append(resource)
+    return resources
+
+
 def ec2_tags(tags):
     """A container for Tags on EC2 Instances
 
@@ -584,7 +1047,35 @@ def ec2_tags(tags):
     return tags_list
 
 
-def generate_pyplate(pyplate, options=None):
+def json_options(minify=False, sort_keys=False):
+    """Build the keyword arguments for rendering a template as JSON
+
+    The result can be passed to :meth:`JSONableDict.to_json`,
+    :meth:`JSONableDict.iter_json` or :meth:`JSONableDict.write_json`.
+
+    Args:
+        minify: If True, leave out indentation and the spaces after separators.
+            CloudFormation limits the size of templates, and indentation is a
+            good part of a large template.
+        sort_keys: If True, sort the keys of every object, so that the output
+            doesn't depend on the order things were added to the template,
+            and can be compared (or hashed) across runs
+
+    By default, templates are indented by two spaces.
+
+    """
+    if minify:
+        options = {'separators': (',', ':')}
+    else:
+        options = {'indent': 2, 'separators': (',', ': ')}
+    if sort_keys:
+        options['sort_keys'] = True
+    return options
+
+
+def generate_pyplate(pyplate, options=None, outfile=None, bytecode_cache=True,
+        output_cache=None, minify=False, sort_keys=False, check_refs=False, profile=None,
+        tracer=None, spec=None):
     """Generate CloudFormation JSON Template based on a Pyplate
 
     Arguments:
@@ -595,15 +1086,52 @@ def generate_pyplate(pyplate, options=None):
         a mapping of some kind (probably a dict),
         to be used at this pyplate's options mapping
 
-    Returns the output string of the compiled pyplate
+      outfile
+        an optional file object; if given, the compiled template is
+        streamed into it instead of being returned as a string
+
+      bytecode_cache
+        if True (the default), the compiled pyplate is cached on disk next
+        to the pyplate, and reused by later runs until the pyplate changes
+
+      output_cache
+        an optional :class:`cfn_pyplates.cache.OutputCache`; if given, the
+        compiled template is looked up there first, and the pyplate is only
+        run if the pyplate, its options, or this library have changed
+
+      minify
+        if True, the template is output without indentation or spaces,
+        see :func:`json_options`
+
+      sort_keys
+        if True, keys are output in sorted order rather than the order
+        they were added, see :func:`json_options`
+
+      check_refs
+        if True, the template isn't output if it refers to anything it
+        doesn't define, or its resources depend on each other in a cycle,
+        see :func:`check_references`
+
+      profile
+        an optional :class:`cfn_pyplates.timing.Profile`; if given, the time
+        spent in each phase of generating the template is added to it
+
+      tracer
+        an optional :class:`cfn_pyplates.tracing.Tracer`; if given, the
+        pyplate is traced as it runs, and the output cache isn't used
+
+      spec
+        an optional :class:`cfn_pyplates.spec.ResourceSpec`; if given, the
+        template isn't output if its resources don't match it, see
+        :meth:`cfn_pyplates.spec.ResourceSpec.check`
+
+    Returns the output string of the compiled pyplate, or True if the
+    output was written to outfile
 
     """
     try:
-        if not isinstance(pyplate, file):
-            pyplate = open(pyplate)
-        pyplate = _load_pyplate(pyplate, options)
-        cft = _find_cloudformationtemplate(pyplate)
-        output = unicode(cft)
+        output = _generate_pyplate(pyplate, options, outfile, bytecode_cache, output_cache,
+            minify, sort_keys, check_refs, profile, tracer, spec)
     except Exception:
         print 'Error processing the pyplate:'
         print traceback.format_exc()
@@ -612,7 +1140,88 @@ def generate_pyplate(pyplate, options=None):
     return output
 
 
-def _load_pyplate(pyplate, options_mapping=None):
+def _generate_pyplate(pyplate, options=None, outfile=None, bytecode_cache=True,
+        output_cache=None, minify=False, sort_keys=False, check_refs=False, profile=None,
+        tracer=None, spec=None):
+    'generate_pyplate, without the error handling'
+    if tracer is not None:
+        # A traced pyplate has to actually run
+        output_cache = None
+    if not isinstance(pyplate, file):
+        pyplate = open(pyplate)
+    formatting = json_options(minify, sort_keys)
+
+    if output_cache is not None:
+        with timing.phase(profile, 'cache lookup'):
+            extra = (formatting, check_refs) + ((spec.digest,) if spec is not None else ())
+            key = output_cache.key(pyplate, options, *extra)
+            cached = output_cache.get(key)
+            if cached is not None:
+                return _read_output(cached, outfile)
+
+    modules = set(sys.modules)
+    option_count = len(options or ())
+    namespace = _load_pyplate(pyplate, options, bytecode_cache, profile, tracer)
+    with timing.phase(profile, 'find template'):
+        cft = _find_cloudformationtemplate(namespace)
+    if check_refs:
+        with timing.phase(profile, 'check refs'):
+            check_references(cft)
+    if spec is not None:
+        with timing.phase(profile, 'check spec'):
+            spec.check(cft)
+
+    # Only cache output that depends on nothing but the cache key; if the
+    # user was prompted for missing options, the answers aren't in the key.
+    if output_cache is not None and len(options or ()) == option_count:
+        with timing.phase(profile, 'dependencies'):
+            dependencies = _pyplate_dependencies(namespace, modules)
+        with timing.phase(profile, 'serialize'):
+            with output_cache.store(key, dependencies) as cache_file:
+                cft.write_json(cache_file, **formatting)
+            return _read_output(output_cache.get(key), outfile)
+
+    with timing.phase(profile, 'serialize'):
+        if outfile is not None:
+            cft.write_json(outfile, **formatting)
+            return True
+        else:
+            return unicode(cft.to_json(**formatting))
+
+
+def check_references(cft):
+    """Make sure a finished template only refers to things it defines
+
+    Unlike :meth:`cfn_pyplates.references.ReferenceIndex.check`, entries are
+    all looked at again first, in case they were changed after the template's
+    index was last used. Resources mustn't depend on each other in a cycle,
+    either (see :mod:`cfn_pyplates.graph`).
+
+    Args:
+        cft: A :class:`CloudFormationTemplate`
+
+    Raises:
+        DanglingReferenceError: :exc:`cfn_pyplates.exceptions.DanglingReferenceError`
+        DependencyCycleError: :exc:`cfn_pyplates.exceptions.DependencyCycleError`
+
+    """
+    cft.references.rescan()
+    cft.references.check()
+    cft.dependency_graph().check()
+
+
+def _read_output(path, outfile=None):
+    # Hand back generated output stored in a file, the way generate_pyplate would
+    with open(path, 'rb') as output:
+        if outfile is not None:
+            shutil.copyfileobj(output, outfile)
+            return True
+        else:
+            return output.read().decode('utf-8')
+
+
+def _load_pyplate(pyplate, options_mapping=None, bytecode_cache=True, profile=None,
+        tracer=None):
     'Load a pyplate file object, and return a dict of its globals'
     # Inject all the useful stuff into the template namespace
     exec_namespace = {
@@ -623,8 +1232,28 @@ def _load_pyplate(pyplate, options_mapping=None):
     for entry in functions.__all__:
         exec_namespace[entry] = getattr(functions, entry)
 
+    # Options not prompted for are collected while the pyplate runs, and all
+    # reported at the end, even if a placeholder made the pyplate fail.
+    missing = getattr(options_mapping, 'missing', None)
+    if missing is not None:
+        missing.clear()
+
     # Do the needful.
-    exec pyplate in exec_namespace
+    with timing.phase(profile, 'compile'):
+        code = cache.compile_pyplate(pyplate, bytecode_cache)
+    try:
+        with timing.phase(profile, 'run'):
+            if tracer is None:
+                exec code in exec_namespace
+            else:
+                with tracer:
+                    exec code in exec_namespace
+    except Exception:
+        if not missing:
+            raise
+        options_mapping.check_missing(traceback.format_exc().rstrip().splitlines()[-1])
+    if missing:
+        options_mapping.check_missing()
     return exec_namespace
 
 
@@ -641,3 +1270,104 @@ def _find_cloudformationtemplate(pyplate):
 
     # If we haven't returned something, it's an Error
     raise exceptions.Error('No CloudFormationTemplate found in pyplate')
+
+
+def _pyplate_dependencies(namespace, modules=()):
+    """Find the source files of the python modules a loaded pyplate depends on
+
+    Args:
+        namespace: A pyplate namespace dict, as returned by _load_pyplate
+        modules: The names in sys.modules before the pyplate was loaded
+
+    Modules imported while loading the pyplate are dependencies, as are
+    modules that provided anything found in the pyplate namespace, which
+    catches modules that had already been imported before this pyplate ran.
+    The same goes for the modules those modules use (see _used_modules),
+    except for modules that are part of python itself or installed in
+    site-packages, which are recorded but not searched any further.
+    cfn_pyplates itself is left out.
+
+    Returns a sorted list of file paths
+
+    """
+    found = [sys.modules[name] for name in set(sys.modules) - set(modules)]
+    found.extend(_namespace_modules(namespace))
+
+    paths = {}
+    while found:
+        module = found.pop()
+        path = _module_source(module)
+        if path is None or path in paths:
+            continue
+        paths[path] = module
+        if not _is_installed(path):
+            found.extend(_used_modules(module))
+
+    return sorted(paths)
+
+
+def _namespace_modules(namespace):
+    # The modules that provided the values in a namespace dict
+    for value in namespace.itervalues():
+        # Checking types directly, rather than importing inspect, which is
+        # slow enough to import to matter to cfn_py_generate's startup
+        if isinstance(value, types.ModuleType):
+            yield value
+        elif isinstance(value, (type, types.ClassType, types.FunctionType)):
+            yield sys.modules.get(value.__module__)
+
+
+def _used_modules(module):
+    """The loaded modules that a module uses
+
+    That's the modules that provided values in its namespace, and any loaded
+    module named in its code, which catches ``from module import CONSTANT``.
+    Names in the code that aren't imports can find modules that aren't really
+    used; that only ever makes the list of dependencies longer, not wrong.
+
+    """
+    used = list(_namespace_modules(vars(module)))
+    path = _module_source(module)
+    if path is not None:
+        used.extend(sys.modules.get(name) for name in _code_names(path))
+    return [used_module for used_module in used if used_module is not module]
+
+
+def _code_names(path):
+    # All the names used in a module's source, memoized by path, mtime and size
+    try:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime, stat.st_size)
+        if key not in _code_names_cache:
+            with open(path) as source:
+                code = compile(source.read(), path, 'exec')
+            names = set()
+            codes = [code]
+            while codes:
+                code = codes.pop()
+                names.update(code.co_names)
+                codes.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+            _code_names_cache[key] = names
+        return _code_names_cache[key]
+    except (IOError, OSError, SyntaxError, TypeError):
+        # Not python source (an extension module, say) or not readable
+        return set()
+
+_code_names_cache = {}
+
+
+def _module_source(module):
+    # The source file of a module, or None for built-in modules and cfn_pyplates
+    path = getattr(module, '__file__', None)
+    if not path or module.__name__.split('.')[0] == 'cfn_pyplates':
+        return None
+    # Point at the source, not the compiled module, when there is one
+    if path.endswith(('.pyc', '.pyo')) and os.path.exists(path[:-1]):
+        path = path[:-1]
+    return os.path.abspath(path)
+
+
+def _is_installed(path):
+    # Is this file part of python itself, or installed into site-packages?
+    prefixes = set([sys.prefix, sys.exec_prefix, getattr(sys, 'real_prefix', sys.prefix)])
+    return any(path.startswith(os.path.join(prefix, '')) for prefix in prefixes)
@@ -0,0 +1,286 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""The JSON encoder used to render templates
+
+:class:`TemplateEncoder` produces exactly the same output as
+:class:`json.JSONEncoder`, but copies the remembered JSON of interned
+intrinsic functions (see :class:`cfn_pyplates.functions.Intrinsic`) and
+shared subtrees (see :mod:`cfn_pyplates.sharing`) instead of encoding them
+again each time they're used.
+
+Given ``cache_fragments=True``, it also remembers the JSON of each
+:class:`JSONableDict <cfn_pyplates.core.JSONableDict>` it encodes, until the
+JSONableDict is changed, so encoding a template again only encodes the
+resources and other parts of it that changed in the meantime.
+
+"""
+import json
+from json.encoder import FLOAT_REPR, INFINITY, encode_basestring, encode_basestring_ascii
+
+from cfn_pyplates.functions import _CachedFragment
+
+try:
+    from _json import make_encoder as c_make_encoder
+except ImportError:
+    c_make_encoder = None
+
+
+class TemplateEncoder(json.JSONEncoder):
+    """A :class:`json.JSONEncoder` that reuses the encoded JSON of read-only values
+
+    Takes the same arguments as :class:`json.JSONEncoder`, and:
+
+    Args:
+        cache_fragments: If True, remember the JSON of the JSONableDicts
+            encoded, and use what was remembered where they haven't changed
+
+    Compact output without sorted keys is left to the standard library's C
+    encoder when it's available and nothing is being remembered, which is
+    faster still.
+
+    """
+    def __init__(self, *args, **kwargs):
+        self.cache_fragments = kwargs.pop('cache_fragments', False)
+        super(TemplateEncoder, self).__init__(*args, **kwargs)
+
+    def iterencode(self, o, _one_shot=False):
+        if (_one_shot and c_make_encoder is not None and not self.cache_fragments
+                and self.indent is None and not self.sort_keys):
+            return super(TemplateEncoder, self).iterencode(o, _one_shot)
+
+        markers = {} if self.check_circular else None
+        _encoder = encode_basestring_ascii if self.ensure_ascii else encode_basestring
+        if self.encoding != 'utf-8':
+            def _encoder(o, _orig_encoder=_encoder, _encoding=self.encoding):
+                if isinstance(o, str):
+                    o = o.decode(_encoding)
+                return _orig_encoder(o)
+
+        def floatstr(o, allow_nan=self.allow_nan, _repr=FLOAT_REPR, _inf=INFINITY,
+                _neginf=-INFINITY):
+            if o != o:
+                text = 'NaN'
+            elif o == _inf:
+                text = 'Infinity'
+            elif o == _neginf:
+                text = '-Infinity'
+            else:
+                return _repr(o)
+
+            if not allow_nan:
+                raise ValueError('Out of range float values are not JSON compliant: ' + repr(o))
+            return text
+
+        # Everything that changes how a value is encoded, besides its indent level
+        fragment_key = (self.indent, self.key_separator, self.item_separator, self.sort_keys,
+            self.ensure_ascii, self.encoding, self.allow_nan)
+        _iterencode = _make_iterencode(markers, self.default, _encoder, self.indent, floatstr,
+            self.key_separator, self.item_separator, self.sort_keys, self.skipkeys,
+            fragment_key, self.cache_fragments)
+        return _iterencode(o, 0)
+
+
+def _make_iterencode(markers, _default, _encoder, _indent, _floatstr,
+        _key_separator, _item_separator, _sort_keys, _skipkeys, _fragment_key, _cache_fragments,
+        # Look these up as locals rather than globals, like the standard library does
+        ValueError=ValueError,
+        basestring=basestring,
+        dict=dict,
+        float=float,
+        id=id,
+        int=int,
+        isinstance=isinstance,
+        list=list,
+        long=long,
+        str=str,
+        tuple=tuple,
+        _CachedFragment=_CachedFragment,
+    ):
+    # This follows json.encoder._make_iterencode, plus the _CachedFragment
+    # branches. Values that can change, like JSONableDicts, only remember
+    # their JSON when _cache_fragments is set.
+
+    def _encode_fragment(value, _current_indent_level):
+        if isinstance(value, dict):
+            return ''.join(_iterencode_dict(value, _current_indent_level))
+        return ''.join(_iterencode_list(value, _current_indent_level))
+
+    def _iterencode_list(lst, _current_indent_level):
+        if not lst:
+            yield '[]'
+            return
+        if markers is not None:
+            markerid = id(lst)
+            if markerid in markers:
+                raise ValueError('Circular reference detected')
+            markers[markerid] = lst
+        buf = '['
+        if _indent is not None:
+            _current_indent_level += 1
+            newline_indent = '\n' + (' ' * (_indent * _current_indent_level))
+            separator = _item_separator + newline_indent
+            buf += newline_indent
+        else:
+            newline_indent = None
+            separator = _item_separator
+        first = True
+        for value in lst:
+            if first:
+                first = False
+            else:
+                buf = separator
+            if isinstance(value, basestring):
+                yield buf + _encoder(value)
+            elif value is None:
+                yield buf + 'null'
+            elif value is True:
+                yield buf + 'true'
+            elif value is False:
+                yield buf + 'false'
+            elif isinstance(value, (int, long)):
+                yield buf + str(value)
+            elif isinstance(value, float):
+                yield buf + _floatstr(value)
+            elif isinstance(value, _CachedFragment) and (
+                    _cache_fragments or value._hash is not None):
+                yield buf + value._fragment(_fragment_key, _current_indent_level,
+                    _encode_fragment)
+            else:
+                yield buf
+                if isinstance(value, (list, tuple)):
+                    chunks = _iterencode_list(value, _current_indent_level)
+                elif isinstance(value, dict):
+                    chunks = _iterencode_dict(value, _current_indent_level)
+                else:
+                    chunks = _iterencode(value, _current_indent_level)
+                for chunk in chunks:
+                    yield chunk
+        if newline_indent is not None:
+            _current_indent_level -= 1
+            yield '\n' + (' ' * (_indent * _current_indent_level))
+        yield ']'
+        if markers is not None:
+            del markers[markerid]
+
+    def _iterencode_dict(dct, _current_indent_level):
+        if not dct:
+            yield '{}'
+            return
+        if markers is not None:
+            markerid = id(dct)
+            if markerid in markers:
+                raise ValueError('Circular reference detected')
+            markers[markerid] = dct
+        yield '{'
+        if _indent is not None:
+            _current_indent_level += 1
+            newline_indent = '\n' + (' ' * (_indent * _current_indent_level))
+            item_separator = _item_separator + newline_indent
+            yield newline_indent
+        else:
+            newline_indent = None
+            item_separator = _item_separator
+        first = True
+        if _sort_keys:
+            items = sorted(dct.items(), key=lambda kv: kv[0])
+        else:
+            items = dct.iteritems()
+        for key, value in items:
+            if isinstance(key, basestring):
+                pass
+            # Like the standard library, allow keys that JavaScript would coerce to strings
+            elif isinstance(key, float):
+                key = _floatstr(key)
+            elif key is True:
+                key = 'true'
+            elif key is False:
+                key = 'false'
+            elif key is None:
+                key = 'null'
+            elif isinstance(key, (int, long)):
+                key = str(key)
+            elif _skipkeys:
+                continue
+            else:
+                raise TypeError('key ' + repr(key) + ' is not a string')
+            if first:
+                first = False
+            else:
+                yield item_separator
+            yield _encoder(key)
+            yield _key_separator
+            if isinstance(value, basestring):
+                yield _encoder(value)
+            elif value is None:
+                yield 'null'
+            elif value is True:
+                yield 'true'
+            elif value is False:
+                yield 'false'
+            elif isinstance(value, (int, long)):
+                yield str(value)
+            elif isinstance(value, float):
+                yield _floatstr(value)
+            elif isinstance(value, _CachedFragment) and (
+                    _cache_fragments or value._hash is not None):
+                yield value._fragment(_fragment_key, _current_indent_level, _encode_fragment)
+            else:
+                if isinstance(value, (list, tuple)):
+                    chunks = _iterencode_list(value, _current_indent_level)
+                elif isinstance(value, dict):
+                    chunks = _iterencode_dict(value, _current_indent_level)
+                else:
+                    chunks = _iterencode(value, _current_indent_level)
+                for chunk in chunks:
+                    yield chunk
+        if newline_indent is not None:
+            _current_indent_level -= 1
+            yield '\n' + (' ' * (_indent * _current_indent_level))
+        yield '}'
+        if markers is not None:
+            del markers[markerid]
+
+    def _iterencode(o, _current_indent_level):
+        if isinstance(o, basestring):
+            yield _encoder(o)
+        elif o is None:
+            yield 'null'
+        elif o is True:
+            yield 'true'
+        elif o is False:
+            yield 'false'
+        elif isinstance(o, (int, long)):
+            yield str(o)
+        elif isinstance(o, float):
+            yield _floatstr(o)
+        elif isinstance(o, _CachedFragment) and (_cache_fragments or o._hash is not None):
+            yield o._fragment(_fragment_key, _current_indent_level, _encode_fragment)
+        elif isinstance(o, (list, tuple)):
+            for chunk in _iterencode_list(o, _current_indent_level):
+                yield chunk
+        elif isinstance(o, dict):
+            for chunk in _iterencode_dict(o, _current_indent_level):
+                yield chunk
+        else:
+            if markers is not None:
+                markerid = id(o)
+                if markerid in markers:
+                    raise ValueError('Circular reference detected')
+                markers[markerid] = o
+            o = _default(o)
+            for chunk in _iterencode(o, _current_indent_level):
+                yield chunk
+            if markers is not None:
+                del markers[markerid]
+
+    return _iterencode
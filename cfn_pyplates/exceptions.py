@@ -59,3 +59,92 @@ class IntrinsicFuncInputError(Error):
     """
 
     message = 'Invalid arguments passed to intrinsic function'
+
+
+class ManifestError(Error):
+    """Raised when a batch manifest can't be understood
+
+    Args:
+        message: An optional message to package with the Error
+
+    """
+
+    message = 'A batch manifest must be a list of jobs'
+
+
+class DanglingReferenceError(Error):
+    """Raised when a template refers to names it doesn't define
+
+    See :meth:`cfn_pyplates.references.ReferenceIndex.check`
+
+    Args:
+        message: An optional message to package with the Error
+
+    """
+
+    message = 'The template refers to names it does not define'
+
+
+class DependencyCycleError(Error):
+    """Raised when a template's resources depend on each other in a cycle
+
+    See :meth:`cfn_pyplates.graph.DependencyGraph.check`
+
+    Args:
+        message: An optional message to package with the Error
+
+    """
+
+    message = 'Resources depend on each other in a cycle'
+
+
+class OptionDefinitionError(Error):
+    """Raised when an option given on the command line isn't key=value
+
+    See :func:`cfn_pyplates.options.parse_definitions`
+
+    Args:
+        message: An optional message to package with the Error
+
+    """
+
+    message = 'Options are defined as key=value'
+
+
+class MissingOptionsError(Error):
+    """Raised when a pyplate asks for options its options mapping doesn't have
+
+    See :meth:`cfn_pyplates.options.OptionsMapping.check_missing`
+
+    Args:
+        message: An optional message to package with the Error
+
+    """
+
+    message = 'Options are missing from the options mapping'
+
+
+class SpecificationError(Error):
+    """Raised when resources don't match the CloudFormation resource specification
+
+    See :meth:`cfn_pyplates.spec.ResourceSpec.check`
+
+    Args:
+        message: An optional message to package with the Error
+
+    """
+
+    message = 'Resources do not match the resource specification'
+
+
+class ResourceRowError(Error):
+    """Raised when rows of data can't be made into resources
+
+    See :meth:`cfn_pyplates.core.Resource.from_rows`
+
+    Args:
+        message: An optional message to package with the Error
+
+    """
+
+    message = 'Resources could not be made from the rows given'
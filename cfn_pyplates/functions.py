@@ -35,6 +35,10 @@ Notes:
   ignored by the CloudFormation template parser
 * Functions related to conditions tend to overlap with python keywords, so they
   are prefixed with ``c_`` to differentiate them (so, Fn::And become ``c_and``)
+* The functions return :class:`Intrinsic` objects: read-only dicts that can
+  be used as keys and set members. Calling a function twice with the same
+  arguments returns the same object, so a template that calls ``ref('VPC')``
+  thousands of times only holds one of them.
 
 .. note:
     Documentation for the functions is verbatim from the AWS Docs,
@@ -51,6 +55,8 @@ Notes:
 # wrappers to make testing the function failure cases very easy
 
 
+import weakref
+
 from exceptions import IntrinsicFuncInputError
 
 __all__ = [
@@ -70,6 +76,185 @@ __all__ = [
 ]
 
 
+class _CachedFragment(object):
+    """Mixin for read-only values that remember their encoded JSON
+
+    Used by :class:`cfn_pyplates.encoder.TemplateEncoder`. Subclasses need
+    ``_hash`` and ``_fragments`` attributes; nothing is remembered for values
+    whose ``_hash`` is None, since those can still change.
+
+    """
+    __slots__ = ()
+
+    def _fragment(self, key, level, encode):
+        """Encoded JSON for this value, made by encode and then remembered
+
+        Args:
+            key: Identifies the encoder settings used
+            level: The indentation level the value is encoded at
+            encode: A function taking this value and level, and
+                returning its encoded JSON
+
+        """
+        if self._hash is None:
+            return encode(self, level)
+        if self._fragments is None:
+            self._fragments = {}
+        try:
+            return self._fragments[key, level]
+        except KeyError:
+            fragment = self._fragments[key, level] = encode(self, level)
+            return fragment
+
+
+class Intrinsic(_CachedFragment, dict):
+    """A single intrinsic function call, like ``{'Ref': 'VPC'}``
+
+    Intrinsics are dicts with one key, the function name, so they can be used
+    anywhere a dict can, including :func:`json.dumps`. They can't be changed
+    once made; lists in the function's arguments are stored as read-only
+    lists, which still compare equal to lists.
+
+    Intrinsics whose arguments are all strings, numbers, booleans, None,
+    lists of those, or other such intrinsics are interned: making the same
+    call again returns the existing object rather than a new one. They are
+    also hashable, and remember their encoded JSON so that the template
+    encoder can copy it rather than encode it again.
+
+    Intrinsics containing anything else, like a plain dict or a
+    :class:`JSONableDict <cfn_pyplates.core.JSONableDict>`, are neither
+    interned nor hashable, since what they contain can still change.
+
+    Args:
+        name: The name of the function, like ``'Fn::GetAtt'``
+        value: The function's arguments
+
+    """
+    __slots__ = ('_hash', '_fragments', '__weakref__')
+
+    def __new__(cls, name, value):
+        value, key = _freeze(value)
+        if key is None:
+            # Can't be interned, something in value could still change
+            return cls._make(name, value, None)
+        key = (cls, name, key)
+        ref = _interned.get(key)
+        intrinsic = ref() if ref is not None else None
+        if intrinsic is None:
+            intrinsic = cls._make(name, value, hash(key))
+            _interned[key] = weakref.KeyedRef(intrinsic, _forget, key)
+        return intrinsic
+
+    @classmethod
+    def _make(cls, name, value, hash_):
+        intrinsic = dict.__new__(cls)
+        dict.__setitem__(intrinsic, name, value)
+        intrinsic._hash = hash_
+        intrinsic._fragments = None
+        return intrinsic
+
+    def __init__(self, name, value):
+        # Everything was done in __new__
+        pass
+
+    def __hash__(self):
+        if self._hash is None:
+            raise TypeError('unhashable intrinsic function, its arguments can change: '
+                '{0!r}'.format(self))
+        return self._hash
+
+    def __reduce__(self):
+        return type(self), self.items()[0]
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        if self._hash is not None:
+            return self
+        from copy import deepcopy
+        return type(self)(*deepcopy(self.items()[0], memo))
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Intrinsic functions are read-only')
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+class FrozenList(tuple):
+    """A read-only list, as found in the arguments of an :class:`Intrinsic`
+
+    Encodes as a JSON list, and compares equal to lists with the same items.
+
+    """
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if isinstance(other, list):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+# Interned intrinsics, by key; see _freeze
+_interned = {}
+
+
+def _forget(ref):
+    # An interned intrinsic was garbage collected
+    if _interned.get(ref.key) is ref:
+        del _interned[ref.key]
+
+
+_scalar_types = frozenset([str, unicode, int, long, bool, type(None)])
+
+
+def _freeze(value):
+    """Make a read-only copy of an intrinsic's value, and a key for interning it
+
+    Lists (and tuples) become FrozenLists, all the way down.
+
+    The key is only equal for values that encode identically, since 1, 1.0
+    and True are all equal in python but not in JSON. It's None if anything
+    in value could still change.
+
+    """
+    value_type = type(value)
+    if value_type in _scalar_types:
+        return value, (value_type, value)
+    elif value_type in (list, tuple, FrozenList):
+        items = []
+        keys = [FrozenList]
+        for item in value:
+            item_type = type(item)
+            if item_type in _scalar_types:
+                # Inlined to save a call for the most common case
+                key = (item_type, item)
+            else:
+                item, key = _freeze(item)
+            items.append(item)
+            if key is None:
+                keys = None
+            elif keys is not None:
+                keys.append(key)
+        if value_type is not FrozenList:
+            value = FrozenList(items)
+        return value, tuple(keys) if keys is not None else None
+    elif value_type is float:
+        return value, (float, repr(value))
+    elif isinstance(value, Intrinsic) and value._hash is not None:
+        # Interned, so its identity is as good as its contents, and cheaper to hash.
+        # The id can't be reused while the intrinsic containing it is alive.
+        return value, (Intrinsic, id(value))
+    return value, None
+
+
 def base64(value):
     """The intrinsic function Fn::Base64 returns the Base64 representation of \
     the input string.
@@ -82,7 +267,7 @@ def base64(value):
 
     Returns: The original string, in Base64 representation
     """
-    return {'Fn::Base64': value}
+    return Intrinsic('Fn::Base64', value)
 
 
 def find_in_map(map_name, key, value):
@@ -103,7 +288,7 @@ def find_in_map(map_name, key, value):
         easier to both look at and maintain.
 
     """
-    return {'Fn::FindInMap': [map_name, key, value]}
+    return Intrinsic('Fn::FindInMap', [map_name, key, value])
 
 
 def get_att(logical_name, attribute):
@@ -126,7 +311,7 @@ def get_att(logical_name, attribute):
     Returns: The attribute value.
 
     """
-    return {'Fn::GetAtt': [logical_name, attribute]}
+    return Intrinsic('Fn::GetAtt', [logical_name, attribute])
 
 
 def get_azs(region=''):
@@ -148,7 +333,7 @@ def get_azs(region=''):
     Returns: The list of Availability Zones for the region.
 
     """
-    return {'Fn::GetAZs': region}
+    return Intrinsic('Fn::GetAZs', region)
 
 
 def join(sep, *args):
@@ -172,7 +357,7 @@ def join(sep, *args):
     if len(args) < 2:
         raise IntrinsicFuncInputError(join._errmsg_needinput)
 
-    return {'Fn::Join': [sep, list(args)]}
+    return Intrinsic('Fn::Join', [sep, args])
 
 join._errmsg_needinput = 'Unable to join on one or less things!'
 
@@ -216,7 +401,7 @@ def select(index, *args):
     except IndexError:
         raise IntrinsicFuncInputError(select._errmsg_index)
 
-    return {'Fn::Select': [index, list(args)]}
+    return Intrinsic('Fn::Select', [index, args])
 
 select._errmsg_int = 'Index must be a number!'
 select._errmsg_empty = 'Unable to select from an empty list!'
@@ -252,7 +437,7 @@ def ref(logical_name):
     .. note:: You can also use Ref to add values to Output messages.
 
     """
-    return {'Ref': logical_name}
+    return Intrinsic('Ref', logical_name)
 
 
 def c_ref(condition_name):
@@ -269,7 +454,7 @@ def c_ref(condition_name):
         * A reference to the named condition
 
     """
-    return {'Condition': condition_name}
+    return Intrinsic('Condition', condition_name)
 
 
 def _validate_logical_condition_counts(fn, conditions):
@@ -295,7 +480,7 @@ def c_and(*conditions):
 
     """
     _validate_logical_condition_counts(c_and, conditions)
-    return {'Fn::And': list(conditions)}
+    return Intrinsic('Fn::And', conditions)
 c_and._errmsg_min = "Minimum umber of conditions for 'c_and' condition is 2"
 c_and._errmsg_max = "Maximum umber of conditions for 'c_and' condition is 10"
 
@@ -315,7 +500,7 @@ def c_or(*conditions):
 
     """
     _validate_logical_condition_counts(c_or, conditions)
-    return {'Fn::Or': list(conditions)}
+    return Intrinsic('Fn::Or', conditions)
 c_or._errmsg_min = "Minimum umber of conditions for 'c_or' condition is 2"
 c_or._errmsg_max = "Maximum umber of conditions for 'c_or' condition is 10"
 
@@ -329,7 +514,7 @@ def c_not(condition):
     Fn::Not acts as a NOT operator.
 
     """
-    return {'Fn::Not': [condition]}
+    return Intrinsic('Fn::Not', [condition])
 
 
 def c_equals(value_1, value_2):
@@ -340,7 +525,7 @@ def c_equals(value_1, value_2):
     Returns true if the two values are equal or false if they aren't.
 
     """
-    return {'Fn::Equals': [value_1, value_2]}
+    return Intrinsic('Fn::Equals', [value_1, value_2])
 
 
 def c_if(condition_name, value_if_true, value_if_false):
@@ -357,4 +542,4 @@ def c_if(condition_name, value_if_true, value_if_false):
     to remove the corresponding property.
 
     """
-    return {'Fn::If': [condition_name, value_if_true, value_if_false]}
+    return Intrinsic('Fn::If', [condition_name, value_if_true, value_if_false])
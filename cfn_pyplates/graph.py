@@ -0,0 +1,287 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Work out the order CloudFormation will create a template's resources in
+
+A resource depends on another if it names it in its ``DependsOn`` attribute,
+or refers to it with ``Ref``, ``Fn::GetAtt`` or ``Fn::Sub`` (see
+:mod:`cfn_pyplates.references`). CloudFormation creates a resource's
+dependencies before the resource itself, and refuses a template whose
+resources depend on each other in a cycle.
+
+:meth:`cfn_pyplates.core.CloudFormationTemplate.dependency_graph` makes a
+:class:`DependencyGraph` of a template as it stands::
+
+    graph = cft.dependency_graph()
+    graph.find_cycle()
+    # ['Web', 'WebSecurityGroup', 'Web']
+
+    with open('dependencies.dot', 'w') as dot:
+        dot.write(graph.to_dot())
+
+References to names that aren't resources, such as parameters or resources
+that don't exist, aren't dependencies.
+
+"""
+import json
+from collections import deque, OrderedDict
+
+from cfn_pyplates import exceptions
+
+# The kinds of reference that make one resource depend on another
+DEPENDENCY_KINDS = frozenset(['DependsOn', 'Ref', 'Fn::GetAtt'])
+
+
+class DependencyGraph(object):
+    """The dependencies between a template's resources
+
+    Made by :meth:`cfn_pyplates.core.CloudFormationTemplate.dependency_graph`.
+    The graph doesn't change when the template does; make a new one instead.
+
+    Everything here takes time in proportion to the number of resources and
+    dependencies.
+
+    Args:
+        types: An OrderedDict of resource names to their types, in template order
+        dependencies: A dict of resource names to a dict of the resources they
+            depend on, and a sorted tuple of the kinds of reference that make
+            each dependency (see :data:`DEPENDENCY_KINDS`)
+
+    """
+    def __init__(self, types, dependencies):
+        self.types = types
+        self.dependencies = dependencies
+        self._dependents = None
+
+    @classmethod
+    def from_template(cls, cft):
+        """Make the dependency graph of a template
+
+        Args:
+            cft: A :class:`cfn_pyplates.core.CloudFormationTemplate`
+
+        """
+        resources = cft.resources
+        index = cft.references
+        types = OrderedDict()
+        dependencies = {}
+        for name in resources:
+            resource = dict.__getitem__(resources, name)
+            types[name] = dict.get(resource, 'Type') if isinstance(resource, dict) else None
+            kinds = dependencies[name] = {}
+            for kind, target in index.references('Resources', name):
+                if kind in DEPENDENCY_KINDS and target in resources:
+                    target_kinds = kinds.get(target)
+                    if target_kinds is None:
+                        kinds[target] = (kind,)
+                    elif kind not in target_kinds:
+                        kinds[target] = tuple(sorted(target_kinds + (kind,)))
+        return cls(types, dependencies)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __contains__(self, name):
+        return name in self.types
+
+    def depends_on(self, name):
+        """The resources a resource depends on directly
+
+        Args:
+            name: The name of the resource
+
+        Returns a sorted list of resource names
+
+        """
+        return sorted(self.dependencies[name])
+
+    def dependents(self, name):
+        """The resources that depend directly on a resource
+
+        Args:
+            name: The name of the resource
+
+        Returns a sorted list of resource names
+
+        """
+        return sorted(self._dependents_of()[name])
+
+    def _dependents_of(self):
+        # The reverse of dependencies, made when it's first needed
+        if self._dependents is None:
+            dependents = dict((node, []) for node in self.types)
+            for node in self.types:
+                for target in self.dependencies[node]:
+                    dependents[target].append(node)
+            self._dependents = dependents
+        return self._dependents
+
+    def find_cycle(self):
+        """Find resources that depend on each other in a cycle
+
+        Returns a list of resource names, starting and ending with the same
+        resource, each depending on the next. Returns None if there's no
+        cycle.
+
+        """
+        # A depth-first search, which has found a cycle when it gets back to
+        # a resource it's still looking at the dependencies of. The search
+        # keeps its own stack, so deep graphs don't hit the recursion limit.
+        # Dependencies are visited in sorted order, so the same template
+        # always gives the same cycle.
+        unvisited, visiting, visited = 0, 1, 2
+        state = dict.fromkeys(self.types, unvisited)
+        for start in self.types:
+            if state[start] != unvisited:
+                continue
+            state[start] = visiting
+            path = [start]
+            stack = [iter(sorted(self.dependencies[start]))]
+            while stack:
+                for target in stack[-1]:
+                    if state[target] == unvisited:
+                        state[target] = visiting
+                        path.append(target)
+                        stack.append(iter(sorted(self.dependencies[target])))
+                        break
+                    elif state[target] == visiting:
+                        return path[path.index(target):] + [target]
+                else:
+                    state[path.pop()] = visited
+                    stack.pop()
+        return None
+
+    def check(self):
+        """Make sure the resources don't depend on each other in a cycle
+
+        Raises:
+            DependencyCycleError: :exc:`cfn_pyplates.exceptions.DependencyCycleError`,
+            with the cycle (see :meth:`find_cycle`) in its ``cycle`` attribute
+
+        """
+        cycle = self.find_cycle()
+        if cycle is not None:
+            error = exceptions.DependencyCycleError(
+                'Resources depend on each other in a cycle: ' + ' -> '.join(cycle))
+            error.cycle = cycle
+            raise error
+
+    def topological_order(self):
+        """The resources in an order CloudFormation could create them in
+
+        Every resource comes after the resources it depends on, and the
+        same template always gives the same order.
+
+        Raises:
+            DependencyCycleError: :exc:`cfn_pyplates.exceptions.DependencyCycleError`,
+            if there's no such order
+
+        """
+        return self._sort()[0]
+
+    def depths(self):
+        """How deep in the graph each resource is
+
+        Resources that don't depend on anything are at depth 0, and any other
+        resource is one deeper than its deepest dependency. Resources at the
+        same depth can be created at the same time.
+
+        Returns a dict of resource names to depths
+
+        Raises:
+            DependencyCycleError: :exc:`cfn_pyplates.exceptions.DependencyCycleError`,
+            if resources depend on each other in a cycle
+
+        """
+        return self._sort()[1]
+
+    def _sort(self):
+        # Kahn's algorithm: take resources whose dependencies have all been
+        # taken, in template order
+        dependents = self._dependents_of()
+        waiting = {}
+        ready = deque()
+        for node in self.types:
+            waiting[node] = len(self.dependencies[node])
+            if not waiting[node]:
+                ready.append(node)
+
+        order = []
+        depths = {}
+        while ready:
+            node = ready.popleft()
+            order.append(node)
+            depths[node] = max([depths[target] + 1 for target in self.dependencies[node]] or [0])
+            for dependent in dependents[node]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    ready.append(dependent)
+        if len(order) < len(self.types):
+            self.check()
+        return order, depths
+
+    def as_dict(self):
+        """The graph as a dict, ready to be encoded as JSON
+
+        It has a list of ``nodes``, each with the ``name`` and ``type`` of a
+        resource, and a list of ``edges``, each ``from`` a resource ``to``
+        one it depends on, with the ``kinds`` of reference that make the
+        dependency.
+
+        """
+        return {
+            'nodes': [{'name': name, 'type': type} for name, type in self.types.iteritems()],
+            'edges': [{'from': name, 'to': target, 'kinds': list(kinds)}
+                for name, target, kinds in self._edges()],
+        }
+
+    def _edges(self):
+        # (resource, dependency, kinds) for every dependency, in a stable order
+        for name in self.types:
+            dependencies = self.dependencies[name]
+            for target in sorted(dependencies):
+                yield name, target, dependencies[target]
+
+    def to_json(self, **kwargs):
+        """The graph as JSON, see :meth:`as_dict`
+
+        Any keyword arguments are passed along to :func:`json.dumps`.
+
+        """
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def to_dot(self):
+        """The graph in Graphviz's DOT language
+
+        Edges point from each resource to the resources it depends on.
+        Dependencies that are only made by ``DependsOn`` are dashed.
+
+        """
+        lines = ['digraph dependencies {', '    rankdir=BT;', '    node [shape=box];']
+        for name, type in self.types.iteritems():
+            label = name if type is None else u'{0}\\n{1}'.format(name, type)
+            lines.append(u'    {0} [label={1}];'.format(_quote(name), _quote(label, False)))
+        for name, target, kinds in self._edges():
+            style = ' [style=dashed]' if kinds == ('DependsOn',) else ''
+            lines.append(u'    {0} -> {1}{2};'.format(_quote(name), _quote(target), style))
+        lines.append('}')
+        return u'\n'.join(lines) + u'\n'
+
+
+def _quote(text, escape_backslashes=True):
+    # A DOT quoted string; logical names are normally alphanumeric, so
+    # there's rarely anything to escape
+    if escape_backslashes and '\\' in text:
+        text = text.replace('\\', '\\\\')
+    if '"' in text:
+        text = text.replace('"', '\\"')
+    return u'"' + text + u'"'
@@ -0,0 +1,197 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Content hashes of templates and their parts, without encoding them as JSON
+
+Every dict and list in a template gets a digest made from the digests of
+what's in it, like a Merkle tree. Two values have the same digest when they
+would encode as the same JSON, apart from whitespace: dict keys in the same
+order, and the same strings, numbers, booleans and nulls. Comparing digests
+is a quick way to tell whether two templates, or two resources, are the same,
+and :func:`changes` finds what changed between two templates by only looking
+inside the parts whose digests differ.
+
+Digests don't depend on the process they were made in, so they can be kept
+and compared with the digests of a later build.
+
+A :class:`JSONableDict <cfn_pyplates.core.JSONableDict>` keeps its digest
+until it's changed, and changing it makes every JSONableDict it's in forget
+their digests too, so after a change only the changed parts of a template
+are hashed again (see :attr:`cfn_pyplates.core.JSONableDict.digest`). Those
+with plain dicts or lists in them, which can be changed in place unnoticed,
+are hashed every time.
+Interned intrinsic functions and shared subtrees (see
+:mod:`cfn_pyplates.sharing`) can't change, so they keep their digests too.
+
+"""
+import hashlib
+from collections import OrderedDict
+
+from cfn_pyplates.functions import _CachedFragment
+
+# The _CachedFragment key digests are kept under, alongside encoded JSON
+_FRAGMENT_KEY = 'digest'
+
+
+def digest(value):
+    """The digest of a value that could go in a template
+
+    Args:
+        value: A JSONableDict, or any value the template encoder can encode
+
+    Returns the digest, 20 bytes
+
+    Raises:
+        TypeError: If the value, or something in it, can't be encoded as JSON
+
+    """
+    return _digest(value, None)
+
+
+def hexdigest(value):
+    'The digest of a value as a hex string, see :func:`digest`'
+    return digest(value).encode('hex')
+
+
+def _digest(value, owner):
+    # The digest of a dict or list, noting owner, the JSONableDict it's in,
+    # as the parent of any JSONableDicts inside it
+    if hasattr(value, '_content_digest'):
+        if owner is not None:
+            value._link(owner)
+        return value._content_digest()
+    if isinstance(value, _CachedFragment):
+        # Kept if the value is read-only, along with its encoded JSON
+        return value._fragment(_FRAGMENT_KEY, 0, lambda value, level: _hash(value, owner))
+    if isinstance(value, (dict, list, tuple)):
+        return _hash(value, owner)
+    return hashlib.sha1(_scalar(value)).digest()
+
+
+def dict_digest(mapping, owner=None):
+    """The digest of a mapping's items, in the order it gives them
+
+    Used by JSONableDicts to hash themselves; ``owner`` is the JSONableDict
+    being hashed, which becomes the parent of the JSONableDicts in it.
+
+    """
+    return _hash(mapping, owner)
+
+
+def _hash(value, owner):
+    hasher = hashlib.sha1()
+    update = hasher.update
+    if isinstance(value, dict):
+        update('{{{0}:'.format(len(value)))
+        for key, item in value.iteritems():
+            update(_scalar(_json_key(key)))
+            _update(update, item, owner)
+    else:
+        update('[{0}:'.format(len(value)))
+        for item in value:
+            _update(update, item, owner)
+    return hasher.digest()
+
+
+def _update(update, item, owner):
+    # Scalars are hashed as part of their container, and containers by digest
+    if isinstance(item, (dict, list, tuple)):
+        update('#')
+        update(_digest(item, owner))
+    else:
+        update(_scalar(item))
+
+
+def _scalar(value):
+    # An unambiguous encoding of a JSON scalar
+    if isinstance(value, basestring):
+        if isinstance(value, str):
+            value = value.decode('utf-8')
+        value = value.encode('utf-8')
+        return 's{0}:{1}'.format(len(value), value)
+    elif value is None:
+        return 'n'
+    elif value is True:
+        return 't'
+    elif value is False:
+        return 'f'
+    elif isinstance(value, (int, long)):
+        return 'i{0};'.format(int(value))
+    elif isinstance(value, float):
+        return 'd{0!r};'.format(value)
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+def _json_key(key):
+    # Dict keys as JSON has them, which is always a string
+    if isinstance(key, basestring):
+        return key
+    elif key is True:
+        return 'true'
+    elif key is False:
+        return 'false'
+    elif key is None:
+        return 'null'
+    elif isinstance(key, float):
+        return repr(key)
+    elif isinstance(key, (int, long)):
+        return str(key)
+    raise TypeError('key ' + repr(key) + ' is not a string')
+
+
+def changes(before, after):
+    """Find the parts of a template that are different in another
+
+    Only the dicts whose digests differ are looked inside, so with
+    JSONableDicts that already know their digests, this takes time in
+    proportion to what changed rather than the size of the templates.
+
+    Args:
+        before: A template, or any dict, such as one loaded from a template
+            generated earlier
+        after: Another template, or dict, to compare it to
+
+    Returns a list of paths, tuples of keys, of the values that were added,
+    removed or changed. Dicts that are in both are looked inside, so a
+    changed resource property gives a path like
+    ``('Resources', 'Web', 'Properties', 'ImageId')``. The list is empty if
+    nothing changed.
+
+    """
+    found = []
+    _changes(before, after, (), found)
+    return found
+
+
+def _changes(before, after, path, found):
+    if digest(before) == digest(after):
+        return
+    if not (isinstance(before, dict) and isinstance(after, dict)):
+        found.append(path)
+        return
+    before, after = _items(before), _items(after)
+    for key, value in after.iteritems():
+        if key not in before:
+            found.append(path + (key,))
+        else:
+            _changes(before[key], value, path + (key,), found)
+    for key in before:
+        if key not in after:
+            found.append(path + (key,))
+
+
+def _items(mapping):
+    # A dict of what's encoded for a mapping, ordered if the mapping is
+    encodable = getattr(mapping, '_encodable', None)
+    if encodable is not None:
+        mapping = encodable()
+    return OrderedDict(mapping.iteritems())
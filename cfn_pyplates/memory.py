@@ -0,0 +1,278 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""See where the memory goes while generating a template
+
+A :class:`MemoryProfile` is a :class:`cfn_pyplates.timing.Profile` that also
+takes a snapshot of memory use after options are loaded, after the pyplate
+has run, and after the template is serialized. Pass one to
+:func:`cfn_pyplates.core.generate_pyplate`, or use ``cfn_py_generate --memory-report``::
+
+    profile = MemoryProfile()
+    profile.start()
+    try:
+        generate_pyplate('project.py', options, profile=profile)
+    finally:
+        profile.stop()
+    profile.report_memory()
+
+Each snapshot has the process's resident and peak memory, where the platform
+can tell (see :func:`resident_bytes` and :func:`peak_bytes`). Once the
+pyplate has run, the template's JSONableDicts are counted by class
+(:class:`~cfn_pyplates.core.Resource`, :class:`~cfn_pyplates.core.Properties`
+and so on) with an estimate of the bytes each class takes up, see
+:func:`jsonabledict_census`.
+
+Python 2 can't say where memory was allocated by itself. If the
+``tracemalloc`` module is available (it comes with Python 3, and as the
+``pytracemalloc`` backport for Python 2), :meth:`MemoryProfile.start` starts it,
+and the lines that allocated the most memory are reported. Otherwise, the types of
+object taking up the most memory are reported instead.
+
+"""
+import gc
+import os
+import sys
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+
+from cfn_pyplates import core, timing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# The phases a snapshot is taken after
+SNAPSHOT_PHASES = ('options', 'run', 'serialize')
+
+Snapshot = namedtuple('Snapshot', ['phase', 'resident', 'peak', 'traced', 'traced_peak'])
+"""Memory use at the end of a phase
+
+- phase: The name of the phase, see :data:`SNAPSHOT_PHASES`
+- resident: Resident memory, in bytes, or None if it's not known
+- peak: Peak resident memory so far, in bytes, or None if it's not known
+- traced: Memory allocated through tracemalloc, in bytes, or None without it
+- traced_peak: Peak memory allocated through tracemalloc, in bytes, or None without it
+"""
+
+Census = namedtuple('Census', ['name', 'count', 'bytes'])
+"""The number of objects of a kind, and an estimate of the bytes they take up"""
+
+
+class MemoryProfile(timing.Profile):
+    """A profile that takes a snapshot of memory use after some phases
+
+    Args:
+        count_objects: See :class:`cfn_pyplates.timing.Profile`
+        sites: The number of allocation sites, or object types, to keep
+
+    Attributes:
+        snapshots: A :data:`Snapshot` for each phase in :data:`SNAPSHOT_PHASES` that was run
+        census: The :data:`Census` of each JSONableDict class once the pyplate had run,
+            largest first
+        sites: ``(filename, line number, bytes, blocks)`` tuples of the lines that
+            allocated the most memory, if tracemalloc is available, largest first
+        types: If tracemalloc isn't available, the :data:`Census` of the types of
+            object taking up the most memory once the pyplate had run, largest first
+
+    """
+    def __init__(self, count_objects=False, sites=10):
+        super(MemoryProfile, self).__init__(count_objects)
+        self.site_limit = sites
+        self.snapshots = []
+        self.census = []
+        self.sites = []
+        self.types = []
+        self._tracing = False
+
+    def start(self):
+        'Start tracing allocations, if tracemalloc is available'
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+
+    def stop(self):
+        'Stop tracing allocations, if start started it'
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    @contextmanager
+    def phase(self, name):
+        with super(MemoryProfile, self).phase(name):
+            yield
+        if name in SNAPSHOT_PHASES:
+            self.snapshot(name)
+
+    def snapshot(self, phase):
+        """Take a snapshot of memory use
+
+        After the ``run`` phase, the pyplate's template and everything it
+        made are still around, so that's when they're counted.
+
+        Args:
+            phase: The name of the phase that just finished
+
+        """
+        traced = traced_peak = None
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            traced, traced_peak = tracemalloc.get_traced_memory()
+        resident, peak = resident_bytes(), peak_bytes()
+        if resident is not None and peak is not None:
+            # The kernel only updates its peak now and then
+            peak = max(peak, resident)
+        self.snapshots.append(Snapshot(phase, resident, peak, traced, traced_peak))
+
+        if phase == 'run':
+            self.census = jsonabledict_census()
+            if traced is not None:
+                statistics = tracemalloc.take_snapshot().statistics('lineno')
+                self.sites = [(stat.traceback[0].filename, stat.traceback[0].lineno, stat.size,
+                    stat.count) for stat in statistics[:self.site_limit]]
+            else:
+                self.types = type_census()[:self.site_limit]
+
+    def report_memory(self, stream=None):
+        """Write the snapshots and the largest kinds of object
+
+        Args:
+            stream: The file object to write it to, defaults to stderr
+
+        """
+        stream = sys.stderr if stream is None else stream
+        stream.write('{0:<16}{1:>14}{2:>14}{3:>14}\n'.format('after', 'resident', 'peak',
+            'traced'))
+        for snapshot in self.snapshots:
+            stream.write('{0:<16}{1:>14}{2:>14}{3:>14}\n'.format(snapshot.phase,
+                _format_bytes(snapshot.resident), _format_bytes(snapshot.peak),
+                _format_bytes(snapshot.traced)))
+
+        if self.census:
+            stream.write('\n{0:<28}{1:>10}{2:>14}\n'.format('class', 'count', 'bytes'))
+            for census in self.census:
+                stream.write('{0:<28}{1:>10,}{2:>14}\n'.format(census.name, census.count,
+                    _format_bytes(census.bytes)))
+
+        if self.sites:
+            stream.write('\n{0:>14}{1:>10}  {2}\n'.format('bytes', 'blocks', 'allocated at'))
+            for filename, lineno, size, count in self.sites:
+                stream.write('{0:>14}{1:>10,}  {2}:{3}\n'.format(_format_bytes(size), count,
+                    filename, lineno))
+        elif self.types:
+            stream.write('\n{0:<28}{1:>10}{2:>14}  (allocation sites need tracemalloc)\n'.format(
+                'type', 'count', 'bytes'))
+            for census in self.types:
+                stream.write('{0:<28}{1:>10,}{2:>14}\n'.format(census.name, census.count,
+                    _format_bytes(census.bytes)))
+
+
+def resident_bytes():
+    'The resident memory of this process, in bytes, or None if it can\'t be found'
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+def peak_bytes():
+    'The peak resident memory of this process so far, in bytes, or None if it can\'t be found'
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux counts in kilobytes, OS X in bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def jsonabledict_census():
+    """Count the JSONableDicts in memory by class, estimating the bytes they take
+
+    The bytes of a JSONableDict include its keys and values, and any plain
+    dicts, lists and strings in them, but not other JSONableDicts, which are
+    counted under their own class. Values shared by more than one
+    JSONableDict are only counted once.
+
+    Returns a list of :data:`Census` tuples, largest first
+
+    """
+    counts = defaultdict(int)
+    sizes = defaultdict(int)
+    seen = set()
+    for obj in gc.get_objects():
+        if isinstance(obj, core.JSONableDict):
+            name = obj.__class__.__name__
+            counts[name] += 1
+            sizes[name] += _estimate(obj, seen)
+    return sorted((Census(name, counts[name], sizes[name]) for name in counts),
+        key=lambda census: census.bytes, reverse=True)
+
+
+def type_census():
+    """Count the objects the garbage collector tracks by type, estimating their bytes
+
+    Only the objects themselves are counted, not what they refer to.
+
+    Returns a list of :data:`Census` tuples, largest first
+
+    """
+    counts = defaultdict(int)
+    sizes = defaultdict(int)
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        counts[name] += 1
+        sizes[name] += sys.getsizeof(obj, 0)
+    return sorted((Census(name, counts[name], sizes[name]) for name in counts),
+        key=lambda census: census.bytes, reverse=True)
+
+
+def _estimate(owner, seen):
+    # The bytes taken by a JSONableDict and the plain containers and values
+    # in it, walked without recursion since OrderedDict's linked list of keys
+    # is as deep as the dict is long. Dicts are read with dict's own methods,
+    # so that shared values aren't copied by CopyOnWriteDict just by looking.
+    size = 0
+    pending = [owner]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or (obj is not owner and isinstance(obj, core.JSONableDict)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj, 0)
+        if isinstance(obj, dict):
+            for key, value in dict.iteritems(obj):
+                pending.append(key)
+                pending.append(value)
+        elif isinstance(obj, list):
+            pending.extend(list.__iter__(obj))
+        elif isinstance(obj, tuple):
+            pending.extend(tuple.__iter__(obj))
+        if obj is owner:
+            # Its attributes, including OrderedDict's linked list of keys
+            pending.append(obj.__dict__)
+    return size
+
+
+def _format_bytes(size):
+    # Bytes in the biggest unit that keeps them over 1, or '-' if unknown
+    if size is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return '{0:.1f}{1}'.format(size, unit) if unit != 'B' else '{0}B'.format(size)
+        size /= 1024.0
+    return '{0:.1f}GB'.format(size)
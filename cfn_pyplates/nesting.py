@@ -0,0 +1,686 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Split templates that are too big for CloudFormation into nested stacks
+
+CloudFormation limits a stack to :data:`MAX_RESOURCES` resources, and a
+template to :data:`MAX_BYTES` bytes. :func:`split_template` moves the
+resources of a template that's over either limit into child templates, each
+made into an ``AWS::CloudFormation::Stack`` resource of a parent template.
+The parent keeps everything else: the description, metadata, parameters,
+mappings, conditions and outputs.
+
+Resources that depend on each other (see :mod:`cfn_pyplates.graph`) are kept
+in the same child where they fit. Where they don't, references between
+children are passed through the parent: the child with the resource outputs
+its ``Ref`` or ``Fn::GetAtt`` value, and the parent passes that to the other
+child as a parameter. A ``Ref`` keeps working as it is, since the parameter
+has the resource's name; an ``Fn::GetAtt`` is replaced by a ``Ref`` to a
+parameter named after the resource and attribute. ``DependsOn`` between
+children becomes ``DependsOn`` between their stacks. Children get copies of
+the parameters, mappings and conditions they use.
+
+Children are split so that they never depend on each other in a cycle, and
+each is filled to at most :data:`FILL` of the limits. That includes the
+:data:`MAX_PARAMETERS` parameters and :data:`MAX_OUTPUTS` outputs a template
+can have, counting the values passed between children.
+
+Each child stack's ``TemplateURL`` is the file name of its template, so
+``aws cloudformation package`` can upload the children and fill in their
+URLs::
+
+    cfn_py_generate big.py build/big.json --split
+    aws cloudformation package --template-file build/big.json \\
+        --s3-bucket my-templates --output-template-file build/packaged.json
+
+Attributes that aren't strings, such as a list of availability zones, can't
+be passed between children, and neither can references to resources with a
+``Condition``. Keep those together with whatever uses them; splitting a
+template raises :exc:`cfn_pyplates.exceptions.Error` where they'd be passed.
+Only list attributes given to ``Fn::Join`` or ``Fn::Select`` are recognized
+as lists, since the type of an attribute isn't otherwise known.
+
+"""
+import os
+import re
+import sys
+import traceback
+from collections import OrderedDict
+
+from cfn_pyplates import cache, core, encoder, exceptions, functions
+from cfn_pyplates.references import _sub_variable
+
+# CloudFormation's limits on the number of resources in a stack, and the size
+# of a template uploaded to S3
+MAX_RESOURCES = 500
+MAX_BYTES = 1024 * 1024
+
+# CloudFormation's limits on the number of parameters and outputs a template
+# can have
+MAX_PARAMETERS = 200
+MAX_OUTPUTS = 200
+
+# How full each child template is made, as a fraction of the limits
+FILL = 0.9
+
+_scalar_types = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+
+def split_template(cft, max_resources=MAX_RESOURCES, max_bytes=MAX_BYTES, formatting=None,
+        template_url='{0}.json', max_parameters=MAX_PARAMETERS, max_outputs=MAX_OUTPUTS):
+    """Split a template into nested stacks, if it's too big for CloudFormation
+
+    Args:
+        cft: A :class:`cfn_pyplates.core.CloudFormationTemplate`
+        max_resources: The most resources a template can have
+        max_bytes: The biggest a template can be, in bytes
+        formatting: The keyword arguments the templates will be rendered with,
+            used to measure them; see :func:`cfn_pyplates.core.json_options`
+        template_url: A format string making the ``TemplateURL`` of a child
+            stack from its logical name
+        max_parameters: The most parameters a template can have
+        max_outputs: The most outputs a template can have
+
+    Returns the parent template and an OrderedDict of child stack names to
+    their templates. If the template is within the limits, it's returned as
+    it is, with no children.
+
+    Raises:
+        DependencyCycleError: :exc:`cfn_pyplates.exceptions.DependencyCycleError`,
+        if the template's resources depend on each other in a cycle
+        Error: :exc:`cfn_pyplates.exceptions.Error`, if a child would need a
+        value that can't be passed between children, or more parameters or
+        outputs than it can have
+
+    """
+    if formatting is None:
+        formatting = core.json_options()
+    # The pyplate might have changed resources since they were indexed
+    cft.references.rescan()
+    resources = cft.resources
+    if len(resources) <= max_resources and len(cft.to_json(**formatting)) <= max_bytes:
+        return cft, OrderedDict()
+
+    graph = cft.dependency_graph()
+    graph.check()
+    # Resources are measured on their own, then given the indentation they'd
+    # have in a template, two levels deep. Children might need copies of all
+    # the parameters, mappings and conditions, so there's room left for them.
+    kwargs = dict(formatting)
+    encode = kwargs.pop('cls', encoder.TemplateEncoder)(**kwargs).encode
+    indent = 2 * (kwargs.get('indent') or 0)
+    sizes = {}
+    for name in resources:
+        encoded = encode(dict.__getitem__(resources, name))
+        sizes[name] = len(encoded) + encoded.count('\n') * indent + len(name) + indent + 6
+    shared = sum(len(encode(cft[key])) for key in ('Parameters', 'Mappings', 'Conditions')
+        if key in cft)
+    # The values each resource, and the parent's outputs, would need passed
+    # to them if what they use were in another child
+    names = set(resources) | set(cft.parameters)
+    needs = dict((name, _used_values(dict.__getitem__(resources, name), names))
+        for name in resources)
+    needs[None] = _used_values(cft.outputs, resources)
+    bins = _partition(graph, sizes, needs, int(max_resources * FILL),
+        int(max_bytes * FILL) - shared, int(max_parameters * FILL), int(max_outputs * FILL))
+    return _Splitter(cft, bins, template_url, max_parameters, max_outputs).split()
+
+
+def _used_values(value, names):
+    # The (name, attribute) keys of the Refs and attributes of the given
+    # resources and parameters that a value uses; attribute is None for a Ref
+    found = set()
+
+    def rewrite(function, args):
+        if function == 'Ref':
+            if isinstance(args, basestring) and args in names:
+                found.add((args, None))
+        elif function == 'Fn::GetAtt':
+            target, attribute = _get_att_args(args)
+            if target in names:
+                found.add((target, attribute))
+        elif function == 'Fn::Sub':
+            def variable(target, attribute):
+                if target in names:
+                    found.add((target, attribute))
+            _rewrite_sub(args, variable, rewrite)
+        return None
+
+    _rewrite(value, rewrite)
+    return found
+
+
+def _partition(graph, sizes, needs, max_count, max_bytes, max_parameters, max_outputs):
+    """Partition a dependency graph's resources into bins within the limits
+
+    Connected resources are kept in the same bin where they fit. Bigger
+    groups are cut along a depth-first topological order, which keeps chains
+    of dependencies together, and only ever leaves a bin depending on
+    earlier bins.
+
+    A bin's parameters are the values its resources use from outside it, and
+    its outputs the values of its resources used from outside it, so each
+    placement is checked against the parameters and outputs of every bin it
+    adds to.
+
+    Args:
+        graph: The :class:`cfn_pyplates.graph.DependencyGraph` of the resources
+        sizes: A dict of each resource's size, in bytes
+        needs: A dict of the ``(name, attribute)`` keys of the values each
+            resource uses (see :func:`_used_values`), and those the parent's
+            outputs use under None
+        max_count: The most resources a bin can have
+        max_bytes: The biggest a bin can be, in bytes
+        max_parameters: The most parameters a bin can have
+        max_outputs: The most outputs a bin can have
+
+    Returns a list of lists of resource names
+
+    """
+    order = _depth_first_order(graph)
+    components = _components(graph, order)
+
+    # Who uses each resource's values, and which
+    users = {}
+    for user, keys in needs.iteritems():
+        for target, attribute in keys:
+            users.setdefault(target, set()).add((user, attribute))
+
+    bins = []
+    counts = []
+    totals = []
+    inputs = []
+    outputs = []
+    placed = {}
+
+    def outside(user, index):
+        return user is None or placed.get(user, index) != index
+
+    def new_inputs(index, names):
+        # The keys the names use from outside the bin they'd be added to
+        group = set(names)
+        return set(key for name in names for key in needs[name]
+            if key[0] not in group and placed.get(key[0]) != index)
+
+    def new_outputs(index, names):
+        # The keys each bin would output if the names were added to the bin
+        group = set(names)
+        added = {}
+        for name in names:
+            for user, attribute in users.get(name, ()):
+                if user not in group and outside(user, index):
+                    added.setdefault(index, set()).add((name, attribute))
+            for key in needs[name]:
+                other = placed.get(key[0])
+                if other is not None and other != index:
+                    added.setdefault(other, set()).add(key)
+        return added
+
+    def fits(index, names, size):
+        if counts[index] + len(names) > max_count or totals[index] + size > max_bytes:
+            return False
+        group = set(names)
+        kept = set(key for key in inputs[index] if key[0] not in group)
+        if len(kept | new_inputs(index, names)) > max_parameters:
+            return False
+        return all(len(outputs[other] | keys) <= max_outputs
+            for other, keys in new_outputs(index, names).iteritems())
+
+    def add(index, names, size):
+        bins[index].extend(names)
+        counts[index] += len(names)
+        totals[index] += size
+        group = set(names)
+        inputs[index] = (set(key for key in inputs[index] if key[0] not in group)
+            | new_inputs(index, names))
+        for other, keys in new_outputs(index, names).iteritems():
+            outputs[other] |= keys
+        for name in names:
+            placed[name] = index
+
+    def new_bin():
+        bins.append([])
+        counts.append(0)
+        totals.append(0)
+        inputs.append(set())
+        outputs.append(set())
+        return len(bins) - 1
+
+    # First fit decreasing, biggest groups first
+    components.sort(key=lambda names: -len(names))
+    for names in components:
+        size = sum(sizes[name] for name in names)
+        if len(names) <= max_count and size <= max_bytes:
+            for index in range(len(bins)):
+                if fits(index, names, size):
+                    add(index, names, size)
+                    break
+            else:
+                add(new_bin(), names, size)
+        else:
+            index = new_bin()
+            for name in names:
+                if counts[index] and not fits(index, [name], sizes[name]):
+                    index = new_bin()
+                add(index, [name], sizes[name])
+    return bins
+
+
+def _depth_first_order(graph):
+    # A topological order from a depth-first search, so that a resource's
+    # dependencies come right before it wherever they can
+    order = []
+    done = set()
+    for start in graph.types:
+        if start in done:
+            continue
+        done.add(start)
+        path = [start]
+        stack = [iter(sorted(graph.dependencies[start]))]
+        while stack:
+            for target in stack[-1]:
+                if target not in done:
+                    done.add(target)
+                    path.append(target)
+                    stack.append(iter(sorted(graph.dependencies[target])))
+                    break
+            else:
+                order.append(path.pop())
+                stack.pop()
+    return order
+
+
+def _components(graph, order):
+    # Groups of resources connected by dependencies, each in the given order
+    parent = dict((name, name) for name in order)
+
+    def find(name):
+        root = name
+        while parent[root] != root:
+            root = parent[root]
+        while parent[name] != root:
+            parent[name], name = root, parent[name]
+        return root
+
+    for name in order:
+        for target in graph.dependencies[name]:
+            parent[find(name)] = find(target)
+
+    components = OrderedDict()
+    for name in order:
+        components.setdefault(find(name), []).append(name)
+    return components.values()
+
+
+class _Splitter(object):
+    # Builds the parent and child templates for a partition
+
+    def __init__(self, cft, bins, template_url, max_parameters=MAX_PARAMETERS,
+            max_outputs=MAX_OUTPUTS):
+        self.cft = cft
+        self.template_url = template_url
+        self.max_parameters = max_parameters
+        self.max_outputs = max_outputs
+        self.taken = set(cft.parameters) | set(cft.resources) | set(cft.conditions)
+
+        self.stack_names = []
+        self.placement = {}
+        for index, names in enumerate(bins):
+            self.stack_names.append(self._unique('NestedStack{0}'.format(index + 1)))
+            for name in names:
+                self.placement[name] = index
+        self.bins = bins
+
+        # Values passed between children, by the name of the output and
+        # parameter that pass them: (the index of the child with the
+        # resource, the value to output)
+        self.passed = {}
+        self._passed_names = {}
+
+    def _unique(self, name):
+        candidate = name
+        count = 1
+        while candidate in self.taken:
+            count += 1
+            candidate = '{0}{1}'.format(name, count)
+        self.taken.add(candidate)
+        return candidate
+
+    def _pass(self, target, attribute=None):
+        # The name of the output and parameter passing a resource's Ref, or
+        # one of its attributes, between children
+        key = (target, attribute)
+        name = self._passed_names.get(key)
+        if name is None:
+            resource = dict.__getitem__(self.cft.resources, target)
+            if isinstance(resource, dict) and 'Condition' in resource:
+                raise exceptions.Error("Can't pass {0} between nested stacks, since it has a "
+                    "Condition; it's used from another stack or the parent's outputs".format(
+                        target))
+            if attribute is None:
+                name = target
+                value = functions.ref(target)
+            else:
+                name = self._unique(target + re.sub('[^A-Za-z0-9]', '', attribute))
+                value = functions.get_att(target, attribute)
+            self._passed_names[key] = name
+            self.passed[name] = (self.placement[target], value)
+        return name
+
+    def split(self):
+        cft = self.cft
+        resources = cft.resources
+        children = [core.CloudFormationTemplate(
+            '{0} ({1})'.format(cft['Description'], stack_name) if 'Description' in cft
+            else None) for stack_name in self.stack_names]
+        stack_dependencies = [set() for names in self.bins]
+
+        for index, names in enumerate(self.bins):
+            for name in names:
+                resource = dict.__getitem__(resources, name)
+                resource = self._rewrite_child(resource, index, stack_dependencies[index])
+                children[index].resources[name] = resource
+
+        # The parent's outputs are rewritten first, since that can add to the
+        # values the children output
+        parent = core.CloudFormationTemplate(cft.get('Description'), cft.options)
+        for key, value in cft.iteritems():
+            if key in ('AWSTemplateFormatVersion', 'Description', 'Resources'):
+                continue
+            elif key == 'Outputs':
+                rewrite = self._parent_rewriter()
+                for name, output in value.iteritems():
+                    parent.outputs[name] = _rewrite(output, rewrite)
+            elif key in parent and isinstance(value, core.JSONableDict):
+                # Copy the entries rather than the section, which belongs to
+                # the original template's reference index
+                section = dict.__getitem__(parent, key)
+                for name, entry in value.iteritems():
+                    section[name] = entry
+            else:
+                parent[key] = value
+
+        # Fill in what each child refers to but doesn't have: parameters,
+        # mappings, conditions and values passed from other children
+        stack_parameters = [OrderedDict() for names in self.bins]
+        for index, child in enumerate(children):
+            self._complete(index, child, stack_parameters[index])
+        for name, (index, value) in sorted(self.passed.iteritems()):
+            children[index].outputs.add(core.Output(name, value))
+        for stack_name, child in zip(self.stack_names, children):
+            for section, limit in (('Parameters', self.max_parameters),
+                    ('Outputs', self.max_outputs)):
+                if len(child[section]) > limit:
+                    raise exceptions.Error('{0} would have {1} {2}, more than the {3} it can '
+                        'have'.format(stack_name, len(child[section]), section.lower(), limit))
+
+        for index, stack_name in enumerate(self.stack_names):
+            properties = OrderedDict([('TemplateURL', self.template_url.format(stack_name))])
+            if stack_parameters[index]:
+                properties['Parameters'] = stack_parameters[index]
+            attributes = []
+            if stack_dependencies[index]:
+                attributes.append(core.DependsOn(sorted(
+                    self.stack_names[other] for other in stack_dependencies[index])))
+            parent.resources.add(core.Resource(stack_name, 'AWS::CloudFormation::Stack',
+                properties, attributes))
+
+        return parent, OrderedDict(zip(self.stack_names, children))
+
+    def _complete(self, index, child, stack_parameters):
+        cft = self.cft
+        while True:
+            dangling = child.references.dangling()
+            added = False
+            for reference in dangling:
+                kind, target = reference.kind, reference.target
+                if kind == 'Ref' and target in self.passed:
+                    if target not in child.parameters:
+                        child.parameters.add(core.Parameter(target, 'String'))
+                        source = self.stack_names[self.passed[target][0]]
+                        stack_parameters[target] = functions.get_att(source, 'Outputs.' + target)
+                        added = True
+                elif kind == 'Ref' and target in cft.parameters:
+                    if target not in child.parameters:
+                        child.parameters[target] = dict.__getitem__(cft.parameters, target)
+                        stack_parameters[target] = functions.ref(target)
+                        added = True
+                elif kind == 'Condition' and target in cft.conditions:
+                    if target not in child.conditions:
+                        child.conditions[target] = dict.__getitem__(cft.conditions, target)
+                        added = True
+                elif kind == 'Fn::FindInMap' and target in cft.mappings:
+                    if target not in child.mappings:
+                        child.mappings[target] = dict.__getitem__(cft.mappings, target)
+                        added = True
+            if not added:
+                return
+
+    def _rewrite_child(self, resource, index, stack_dependencies):
+        # A resource, with references to resources in other children passed
+        # through parameters
+        placement = self.placement
+
+        def elsewhere(target):
+            return target in placement and placement[target] != index
+
+        def rewrite(function, args):
+            if function == 'Ref':
+                if isinstance(args, basestring) and elsewhere(args):
+                    self._pass(args)
+                return None
+            elif function == 'Fn::GetAtt':
+                target, attribute = _get_att_args(args)
+                if target is not None and elsewhere(target):
+                    return functions.ref(self._pass(target, attribute))
+                if (isinstance(args, (list, tuple)) and args
+                        and isinstance(args[0], basestring) and elsewhere(args[0])):
+                    raise exceptions.Error("Can't pass an attribute of {0} that isn't named by "
+                        'a string between nested stacks'.format(args[0]))
+            elif function == 'Fn::Sub':
+                def variable(target, attribute):
+                    if not elsewhere(target):
+                        return None
+                    return self._pass(target, attribute)
+                return _rewrite_sub(args, variable, rewrite)
+            elif function in ('Fn::Join', 'Fn::Select'):
+                target, attribute = _list_attribute(args)
+                if target is not None and elsewhere(target):
+                    raise exceptions.Error("Can't pass {0}.{1} between nested stacks, since "
+                        "it's a list".format(target, attribute))
+            return None
+
+        if isinstance(resource, dict) and 'DependsOn' in resource:
+            depends_on = dict.__getitem__(resource, 'DependsOn')
+            names = [depends_on] if isinstance(depends_on, basestring) else list(depends_on)
+            kept = []
+            for name in names:
+                if elsewhere(name):
+                    stack_dependencies.add(placement[name])
+                else:
+                    kept.append(name)
+            if len(kept) < len(names):
+                resource = OrderedDict((key, dict.__getitem__(resource, key))
+                    for key in resource)
+                if kept:
+                    resource['DependsOn'] = kept[0] if len(kept) == 1 else kept
+                else:
+                    del resource['DependsOn']
+        return _rewrite(resource, rewrite)
+
+    def _parent_rewriter(self):
+        # References to resources from the parent's outputs go through the
+        # outputs of the children the resources are in
+        placement = self.placement
+
+        def output_of(target, attribute=None):
+            stack_name = self.stack_names[placement[target]]
+            return stack_name, 'Outputs.' + self._pass(target, attribute)
+
+        def rewrite(function, args):
+            if function == 'Ref':
+                if isinstance(args, basestring) and args in placement:
+                    return functions.get_att(*output_of(args))
+            elif function == 'Fn::GetAtt':
+                target, attribute = _get_att_args(args)
+                if target in placement:
+                    return functions.get_att(*output_of(target, attribute))
+            elif function == 'Fn::Sub':
+                def variable(target, attribute):
+                    if target not in placement:
+                        return None
+                    return '.'.join(output_of(target, attribute))
+                return _rewrite_sub(args, variable, rewrite)
+            return None
+        return rewrite
+
+
+def _get_att_args(args):
+    # The resource and attribute of an Fn::GetAtt, or (None, None)
+    if isinstance(args, basestring) and '.' in args:
+        return tuple(args.split('.', 1))
+    if (isinstance(args, (list, tuple)) and len(args) == 2
+            and isinstance(args[0], basestring) and isinstance(args[1], basestring)):
+        return args[0], args[1]
+    return None, None
+
+
+def _list_attribute(args):
+    # The resource and attribute of an Fn::GetAtt given as the list of an
+    # Fn::Join or Fn::Select, or (None, None)
+    if isinstance(args, (list, tuple)) and len(args) == 2:
+        value = args[1]
+        if isinstance(value, dict) and len(value) == 1 and 'Fn::GetAtt' in value:
+            return _get_att_args(dict.__getitem__(value, 'Fn::GetAtt'))
+    return None, None
+
+
+def _rewrite_sub(args, variable, rewrite):
+    # Rewrite the variables of an Fn::Sub; variable is called with the
+    # resource and attribute (or None) of each, and returns the name to use
+    # instead, or None to leave it alone
+    if isinstance(args, (list, tuple)) and args:
+        template = args[0]
+        local = _rewrite(args[1], rewrite) if len(args) > 1 else {}
+    else:
+        template, local = args, None
+    if not isinstance(template, basestring):
+        return None
+
+    def replace(match):
+        name = match.group(1).strip()
+        if local and name in local:
+            return match.group(0)
+        target, _, attribute = name.partition('.')
+        replacement = variable(target, attribute or None)
+        return match.group(0) if replacement is None else '${' + replacement + '}'
+
+    rewritten = _sub_variable.sub(replace, template)
+    if local is None:
+        return None if rewritten == template else {'Fn::Sub': rewritten}
+    if rewritten == template and local is args[1]:
+        return None
+    return {'Fn::Sub': [rewritten, local]}
+
+
+def _rewrite(value, rewrite):
+    """Rewrite the intrinsic functions in a value
+
+    rewrite is called with the name and arguments of every intrinsic function,
+    and returns what to replace it with, or None to leave it be (its arguments
+    are still rewritten). Only what's changed is copied, into plain
+    OrderedDicts and lists.
+
+    """
+    if isinstance(value, dict):
+        if len(value) == 1:
+            for function, args in dict.iteritems(value):
+                replacement = rewrite(function, args)
+                if replacement is not None:
+                    return replacement
+        items = []
+        changed = False
+        for key in value:
+            item = dict.__getitem__(value, key)
+            if type(item) not in _scalar_types:
+                rewritten = _rewrite(item, rewrite)
+                changed = changed or rewritten is not item
+                item = rewritten
+            items.append((key, item))
+        return OrderedDict(items) if changed else value
+    elif isinstance(value, (list, tuple)):
+        items = [item if type(item) in _scalar_types else _rewrite(item, rewrite)
+            for item in value]
+        if any(new is not old for new, old in zip(items, value)):
+            return items
+    return value
+
+
+def child_path(outfile, stack_name):
+    """The path a child template is written to, alongside its parent
+
+    Args:
+        outfile: The path of the parent template
+        stack_name: The logical name of the child's stack
+
+    """
+    root, ext = os.path.splitext(outfile)
+    return '{0}-{1}{2}'.format(root, stack_name, ext or '.json')
+
+
+def generate_split(pyplate, options=None, outfile=None, bytecode_cache=True, minify=False,
+        sort_keys=False, check_refs=False, max_resources=MAX_RESOURCES, max_bytes=MAX_BYTES):
+    """Generate a pyplate, splitting its template into nested stacks if it's too big
+
+    Like :func:`cfn_pyplates.core.generate_pyplate`, but outfile is a path,
+    and the templates of any child stacks are written alongside it (see
+    :func:`child_path`). The output cache isn't used.
+
+    Returns a list of the paths of the templates, the parent first, or None if
+    the pyplate couldn't be generated
+
+    """
+    try:
+        paths = _generate_split(pyplate, options, outfile, bytecode_cache, minify, sort_keys,
+            check_refs, max_resources, max_bytes)
+    except Exception:
+        print 'Error processing the pyplate:'
+        print traceback.format_exc()
+        return None
+
+    if len(paths) > 1:
+        sys.stderr.write('Split the template into {0} nested stacks\n'.format(len(paths) - 1))
+    return paths
+
+
+def _generate_split(pyplate, options=None, outfile=None, bytecode_cache=True, minify=False,
+        sort_keys=False, check_refs=False, max_resources=MAX_RESOURCES, max_bytes=MAX_BYTES):
+    'generate_split, without the error handling'
+    if not isinstance(pyplate, file):
+        pyplate = open(pyplate)
+    namespace = core._load_pyplate(pyplate, options, bytecode_cache)
+    cft = core._find_cloudformationtemplate(namespace)
+    if check_refs:
+        core.check_references(cft)
+    formatting = core.json_options(minify, sort_keys)
+    prefix = os.path.splitext(os.path.basename(outfile))[0]
+    parent, children = split_template(cft, max_resources, max_bytes, formatting,
+        prefix + '-{0}.json')
+
+    templates = [(outfile, parent)]
+    templates.extend((child_path(outfile, name), child) for name, child in children.items())
+    for path, template in templates:
+        def write(output_file, template=template):
+            template.write_json(output_file, **formatting)
+            return True
+        cache.write_if_changed(path, write)
+    return [path for path, template in templates]
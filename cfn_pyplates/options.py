@@ -10,18 +10,56 @@
 # The above copyright notice and this permission notice shall be included in
 # all copies or substantial portions of the Software.
 
-from collections import defaultdict
+import linecache
+import marshal
+import os
+import sys
+from collections import defaultdict, OrderedDict
+
+from cfn_pyplates import exceptions
 
 prompt_str = '''Key "{0}" not found in the supplied options mapping.
 You can enter it now (or leave blank for None/null):
 > '''
 
+# Parsed options files, marshalled, by path, mtime, size and inode; see load_options_file
+_parsed = OrderedDict()
+_parsed_limit = 64
+
 
 class OptionsMapping(defaultdict):
+    """A pyplate's options, prompting for any that are missing
+
+    When a pyplate asks for an option that isn't in the mapping, the user is
+    prompted for it. That's no good where nobody's there to answer, so when
+    the mapping isn't interactive, a missing option is recorded in
+    :attr:`missing` instead, and the pyplate gets a :class:`MissingOption`
+    placeholder and carries on. Once the pyplate has run, every missing
+    option is reported at once, see :meth:`check_missing`.
+
+    Attributes:
+        interactive: True to prompt for missing options, False to record
+            them, or None (the default) to prompt only if stdin is a terminal
+        missing: An OrderedDict of missing options, each with a list of
+            ``(filename, line number, line)`` tuples for the lines that asked for it
+
+    """
+    interactive = None
+
     def __init__(self, *args, **kwargs):
         super(OptionsMapping, self).__init__(None, *args, **kwargs)
+        self.missing = OrderedDict()
 
     def __missing__(self, key):
+        if not self._is_interactive():
+            # Note the line asking for it, which is the pyplate's or a module
+            # it uses, since dict lookups call this straight from there
+            frame = sys._getframe(1)
+            filename, lineno = frame.f_code.co_filename, frame.f_lineno
+            line = linecache.getline(filename, lineno).strip()
+            self.missing.setdefault(key, []).append((filename, lineno, line))
+            return MissingOption(key)
+
         try:
             value = raw_input(prompt_str.format(key))
         except KeyboardInterrupt:
@@ -34,3 +72,192 @@ class OptionsMapping(defaultdict):
 
         self[key] = value
         return value
+
+    def _is_interactive(self):
+        if self.interactive is not None:
+            return self.interactive
+        isatty = getattr(sys.stdin, 'isatty', None)
+        return bool(isatty and isatty())
+
+    def check_missing(self, failure=None):
+        """Raise an error listing every missing option, if there were any
+
+        Args:
+            failure: Optionally, a description of the error the pyplate
+                failed with, which is likely to be because of a placeholder
+
+        Raises:
+            MissingOptionsError: :exc:`cfn_pyplates.exceptions.MissingOptionsError`,
+            naming each missing option and the lines that asked for it
+
+        """
+        if not self.missing:
+            return
+        lines = ['{0} missing from the options mapping:'.format(
+            '1 option is' if len(self.missing) == 1 else
+            '{0} options are'.format(len(self.missing)))]
+        for key, places in self.missing.iteritems():
+            lines.append('  {0}'.format(key))
+            for filename, lineno, line in places:
+                lines.append('    {0}, line {1}: {2}'.format(filename, lineno, line))
+        if failure:
+            lines.append('The pyplate then failed with {0}'.format(failure))
+        raise exceptions.MissingOptionsError('\n'.join(lines))
+
+    @classmethod
+    def layered(cls, *layers):
+        """Make an options mapping from layers of options, each overriding the ones before it
+
+        The layers are merged into one mapping straight away, in order, so
+        a key in a later layer replaces the same key in the ones before it.
+        Where a later layer and the layers before it both have a dict for
+        the same key, the two dicts are merged the same way, key by key and
+        at every level of nesting, so an overlay only needs the nested keys
+        it changes. Anything else, lists included, is replaced whole.
+
+        Merged dicts are new copies, so the layers themselves aren't
+        changed, but values only one layer has (dicts included) are put in
+        the mapping as they are, not copied.
+
+        Args:
+            layers: Dicts of options, such as a base options file, an
+                overlay for one environment, and options given on the
+                command line (see :func:`parse_definitions`)
+
+        """
+        merged = {}
+        for layer in layers:
+            if layer:
+                _overlay(merged, layer)
+        return cls(merged)
+
+
+class MissingOption(unicode):
+    """Stands in for an option that's missing from a non-interactive mapping
+
+    It's a string naming the option, so the pyplate can keep going and any
+    other missing options can be found too. Looking up a key in it gives
+    another placeholder, for pyplates that use a missing option as a dict.
+
+    """
+    def __new__(cls, key):
+        return super(MissingOption, cls).__new__(cls, u'<missing option {0}>'.format(key))
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return self
+        return super(MissingOption, self).__getitem__(key)
+
+
+def _overlay(base, layer):
+    # Put a layer's options over base, in place, copying any nested dicts
+    # that are merged rather than changing them
+    for key, value in layer.iteritems():
+        current = base.get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            merged = dict(current)
+            _overlay(merged, value)
+            value = merged
+        base[key] = value
+
+
+def load_yaml(stream):
+    """Load YAML (or JSON) from a string or file object
+
+    libyaml's C loader is used when PyYAML was built with it, which is many
+    times faster than the pure python loader. Either way, only plain YAML
+    types are loaded, never arbitrary python objects.
+
+    """
+    import yaml
+    return yaml.load(stream, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def load_options_file(options_file):
+    """Load an options mapping from a JSON or YAML file object
+
+    JSON is a subset of YAML, so either format can be loaded here.
+
+    Options files are kept once they've been parsed, so a process that
+    loads the same file again (a batch worker, or a server) only parses it
+    again if it's changed. Each load gets its own copy of the options.
+
+    """
+    key = _file_key(options_file)
+    cached = _parsed.get(key) if key is not None else None
+    if cached is not None:
+        return marshal.loads(cached)
+
+    options = load_yaml(options_file)
+    if key is not None:
+        try:
+            _parsed[key] = marshal.dumps(options)
+        except ValueError:
+            # Dates and other types marshal can't store just aren't kept
+            pass
+        else:
+            while len(_parsed) > _parsed_limit:
+                _parsed.popitem(last=False)
+    return options
+
+
+def _file_key(options_file):
+    # What identifies the contents of a regular file, or None for anything else
+    try:
+        stat = os.fstat(options_file.fileno())
+    except (AttributeError, ValueError, IOError, OSError):
+        return None
+    path = getattr(options_file, 'name', None)
+    if not isinstance(path, basestring) or not os.path.isfile(path):
+        return None
+    return os.path.abspath(path), stat.st_mtime, stat.st_size, stat.st_ino
+
+
+def parse_definitions(definitions):
+    """Parse options given as ``key=value`` strings into a dict
+
+    Values are YAML, so ``Count=3`` is a number and ``Enabled=true`` is a
+    boolean, and an empty value is None. Dots in a key set nested options:
+    ``Network.Cidr=10.0.0.0/16`` sets ``Cidr`` in the ``Network`` dict.
+
+    Raises:
+        OptionDefinitionError: :exc:`cfn_pyplates.exceptions.OptionDefinitionError`,
+        if a definition has no ``=`` or no key
+
+    """
+    options = {}
+    for definition in definitions:
+        key, sep, value = definition.partition('=')
+        if not sep or not key:
+            raise exceptions.OptionDefinitionError(
+                'Options are defined as key=value, not {0!r}'.format(definition))
+        path = key.split('.')
+        layer = {path[-1]: load_yaml(value) if value else None}
+        for name in reversed(path[:-1]):
+            layer = {name: layer}
+        _overlay(options, layer)
+    return options
+
+
+def load_options(sources=(), definitions=()):
+    """Load an options mapping from options files and ``key=value`` definitions
+
+    Args:
+        sources: Paths or file objects of options files, each overriding
+            the ones before it
+        definitions: ``key=value`` strings overriding all the files, see
+            :func:`parse_definitions`
+
+    Returns a layered :class:`OptionsMapping`, see :meth:`OptionsMapping.layered`
+
+    """
+    layers = []
+    for source in sources:
+        if isinstance(source, basestring):
+            with open(source) as options_file:
+                layers.append(load_options_file(options_file))
+        else:
+            layers.append(load_options_file(source))
+    if definitions:
+        layers.append(parse_definitions(definitions))
+    return OptionsMapping.layered(*layers)
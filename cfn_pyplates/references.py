@@ -0,0 +1,433 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Find what a template's intrinsic functions refer to
+
+Every :class:`cfn_pyplates.core.CloudFormationTemplate` keeps a
+:class:`ReferenceIndex` of the names its resources, outputs and conditions
+refer to, as its ``references`` attribute. It can answer which parts of the
+template refer to a name, and find references to names the template doesn't
+define, before CloudFormation does::
+
+    cft.references.referrers('VPC')
+    # [('Resources', 'Subnet1'), ('Resources', 'Subnet2'), ...]
+
+    cft.references.check()
+    # DanglingReferenceError: 1 dangling reference(s):
+    #   Resources.Web refers to Subnett with Ref, which isn't a parameter or
+    #   resource (did you mean Subnet?)
+
+References are found in :mod:`intrinsic functions <cfn_pyplates.functions>`
+(or the equivalent plain dicts, such as ``{'Ref': 'VPC'}``), including the
+names used in ``Fn::Sub`` strings, and in the ``DependsOn`` and ``Condition``
+attributes of resources and outputs.
+
+"""
+import difflib
+import re
+from collections import namedtuple
+
+from cfn_pyplates import exceptions
+from cfn_pyplates.functions import Intrinsic
+from cfn_pyplates.sharing import SharedDict, SharedList
+
+Reference = namedtuple('Reference', ['kind', 'target'])
+"""A reference from one part of a template to another
+
+``kind`` is how the reference is made: ``'Ref'``, ``'Fn::GetAtt'``,
+``'Fn::FindInMap'``, ``'Condition'`` (including the condition of an
+``Fn::If``), or ``'DependsOn'``. ``target`` is the name referred to.
+
+"""
+
+DanglingReference = namedtuple('DanglingReference', ['section', 'name', 'kind', 'target'])
+"""A reference to a name that isn't defined in the template
+
+``section`` and ``name`` say which part of the template the reference is in,
+such as ``'Resources'`` and ``'Web'``.
+
+"""
+
+# Names that can be given to Ref without being defined in the template
+PSEUDO_PARAMETERS = frozenset([
+    'AWS::AccountId',
+    'AWS::NoValue',
+    'AWS::NotificationARNs',
+    'AWS::Partition',
+    'AWS::Region',
+    'AWS::StackId',
+    'AWS::StackName',
+    'AWS::URLSuffix',
+])
+
+# The sections that define the names each kind of reference can refer to
+TARGET_SECTIONS = {
+    'Ref': ('Parameters', 'Resources'),
+    'Fn::GetAtt': ('Resources',),
+    'Fn::FindInMap': ('Mappings',),
+    'Condition': ('Conditions',),
+    'DependsOn': ('Resources',),
+}
+
+# The sections that are indexed
+SECTIONS = frozenset(['Parameters', 'Mappings', 'Resources', 'Outputs', 'Conditions'])
+
+# The sections whose entries can refer to other names
+REFERRING_SECTIONS = frozenset(['Resources', 'Outputs', 'Conditions'])
+
+_section_nouns = {
+    'Parameters': 'parameter',
+    'Resources': 'resource',
+    'Mappings': 'mapping',
+    'Conditions': 'condition',
+}
+
+# Values that can't change, see _scan
+_read_only_types = frozenset([Intrinsic, SharedDict, SharedList])
+
+# Values that can't contain references, skipped without a call to _scan
+_scalar_types = frozenset([str, unicode, int, long, float, bool, type(None)])
+
+# Variables in an Fn::Sub string; ${!Literal} isn't a variable
+_sub_variable = re.compile(r'\$\{([^!}][^}]*)\}')
+
+
+class ReferenceIndex(object):
+    """An index of the references between the parts of a template
+
+    Made by :class:`cfn_pyplates.core.CloudFormationTemplate`, which keeps it
+    up to date as entries are added to and removed from its sections.
+    Entries are looked at the first time the index is used after they were
+    added, so it's fine to change an entry after adding it. Changes to entries
+    made after that aren't seen until :meth:`rescan` is called.
+
+    Looking up the references to a name takes constant time, and
+    :meth:`dangling` checks each distinct reference once.
+
+    """
+    def __init__(self):
+        # Attached sections, by their key in the template
+        self._sections = {}
+        # Entries added since the index was last used, by (section, name)
+        self._pending = {}
+        # The references made by each entry, by (section, name)
+        self._outgoing = {}
+        # The entries making each reference, by Reference
+        self._incoming = {}
+
+    def attach(self, key, section):
+        """Index the entries of a section, and keep them indexed
+
+        Called by the template when a section is set; sections that know how
+        (see :class:`cfn_pyplates.core.Resources` and friends) tell the index
+        as entries are added and removed.
+
+        Args:
+            key: The key of the section in the template, such as ``'Resources'``
+            section: The section, a :class:`cfn_pyplates.core.JSONableDict`
+
+        """
+        self.detach(key)
+        self._sections[key] = section
+        section._references = self
+        if key in REFERRING_SECTIONS:
+            for name in section:
+                self._pending[key, name] = dict.__getitem__(section, name)
+
+    def detach(self, key):
+        """Stop indexing a section, forgetting the references it made
+
+        Args:
+            key: The key of the section in the template
+
+        """
+        section = self._sections.pop(key, None)
+        if section is None:
+            return
+        if getattr(section, '_references', None) is self:
+            section._references = None
+        for name in section:
+            self.removed(key, name)
+
+    def added(self, section, name, entry):
+        """Note that an entry was added to (or replaced in) a section
+
+        Args:
+            section: The key of the section in the template
+            name: The name of the entry
+            entry: The entry itself
+
+        """
+        if section in REFERRING_SECTIONS:
+            self._unindex((section, name))
+            self._pending[section, name] = entry
+
+    def removed(self, section, name):
+        """Note that an entry was removed from a section
+
+        Args:
+            section: The key of the section in the template
+            name: The name of the entry
+
+        """
+        key = (section, name)
+        self._pending.pop(key, None)
+        self._unindex(key)
+
+    def rescan(self):
+        'Look at every entry again, to find references added to entries after they were indexed'
+        self._outgoing.clear()
+        self._incoming.clear()
+        for key, section in self._sections.iteritems():
+            if key in REFERRING_SECTIONS:
+                for name in section:
+                    self._pending[key, name] = dict.__getitem__(section, name)
+
+    def references(self, section, name):
+        """The references made by an entry
+
+        Args:
+            section: The key of the section the entry is in, such as ``'Resources'``
+            name: The name of the entry
+
+        Returns a tuple of :data:`Reference`
+
+        """
+        self._update()
+        return self._outgoing.get((section, name), ())
+
+    def referrers(self, target, kind=None):
+        """Find the entries that refer to a name
+
+        Args:
+            target: The name referred to, such as a resource's logical name
+            kind: Only count references of this kind, such as ``'Fn::GetAtt'``
+
+        Returns a sorted list of (section, name) tuples
+
+        """
+        self._update()
+        found = set()
+        for reference_kind in ((kind,) if kind else TARGET_SECTIONS):
+            found.update(self._incoming.get(Reference(reference_kind, target), ()))
+        return sorted(found)
+
+    def dangling(self):
+        """Find references to names the template doesn't define
+
+        ``Ref`` can also refer to AWS pseudo parameters, such as ``AWS::Region``.
+
+        Returns a sorted list of :data:`DanglingReference`
+
+        """
+        self._update()
+        sections = self._sections
+        found = []
+        for reference, referrers in self._incoming.iteritems():
+            target = reference.target
+            if reference.kind == 'Ref' and target in PSEUDO_PARAMETERS:
+                continue
+            for key in TARGET_SECTIONS[reference.kind]:
+                if key in sections and target in sections[key]:
+                    break
+            else:
+                found.extend(DanglingReference(section, name, reference.kind, target)
+                    for section, name in referrers)
+        found.sort()
+        return found
+
+    def check(self):
+        """Make sure every reference is to a name the template defines
+
+        Raises:
+            DanglingReferenceError: :exc:`cfn_pyplates.exceptions.DanglingReferenceError`,
+            describing every dangling reference. They're also in its ``dangling``
+            attribute, as returned by :meth:`dangling`.
+
+        """
+        dangling = self.dangling()
+        if dangling:
+            lines = ['{0} dangling reference(s):'.format(len(dangling))]
+            suggestions = {}
+            for reference in dangling:
+                key = (reference.kind, reference.target)
+                if key not in suggestions:
+                    suggestions[key] = self._suggest(*key)
+                lines.append('  {0}.{1} refers to {2} with {3}, which isn\'t a {4}{5}'.format(
+                    reference.section, reference.name, reference.target, reference.kind,
+                    ' or '.join(_section_nouns[section]
+                        for section in TARGET_SECTIONS[reference.kind]),
+                    suggestions[key]))
+            error = exceptions.DanglingReferenceError('\n'.join(lines))
+            error.dangling = dangling
+            raise error
+
+    def _suggest(self, kind, target):
+        # Suggest a defined name that a dangling reference might have meant
+        names = [name for section in TARGET_SECTIONS[kind]
+            for name in self._sections.get(section, ())]
+        close = difflib.get_close_matches(target, names, 1)
+        return ' (did you mean {0}?)'.format(close[0]) if close else ''
+
+    def _unindex(self, key):
+        # Forget the references made by an entry
+        for reference in self._outgoing.pop(key, ()):
+            referrers = self._incoming.get(reference)
+            if referrers is not None:
+                referrers.discard(key)
+                if not referrers:
+                    del self._incoming[reference]
+
+    def _update(self):
+        # Index the entries added since the index was last used
+        if not self._pending:
+            return
+        incoming = self._incoming
+        memo = {}
+        for key, entry in self._pending.iteritems():
+            references = tuple(_entry_references(key[0], entry, memo))
+            self._outgoing[key] = references
+            for reference in references:
+                referrers = incoming.get(reference)
+                if referrers is None:
+                    referrers = incoming[reference] = set()
+                referrers.add(key)
+        self._pending.clear()
+
+
+def _entry_references(section, entry, memo):
+    # The references made by an entry in a section, including the DependsOn and
+    # Condition attributes of resources and outputs
+    found = []
+    if section == 'Conditions' or not isinstance(entry, dict):
+        _scan(entry, found, memo)
+        return found
+    for key, value in dict.iteritems(entry):
+        if key == 'DependsOn':
+            if isinstance(value, basestring):
+                found.append(Reference('DependsOn', value))
+            else:
+                found.extend(Reference('DependsOn', name) for name in value
+                    if isinstance(name, basestring))
+        elif key == 'Condition' and isinstance(value, basestring):
+            found.append(Reference('Condition', value))
+        elif type(value) not in _scalar_types:
+            _scan(value, found, memo)
+    return found
+
+
+def find_references(value):
+    """Find the references made by the intrinsic functions in a value
+
+    Args:
+        value: Anything that can go in a template
+
+    Returns a list of :data:`Reference`
+
+    """
+    found = []
+    _scan(value, found, {})
+    return found
+
+
+def _scan(value, found, memo):
+    # Values are scanned as they are, without copying shared subtrees (see
+    # cfn_pyplates.sharing); looking them up by key would copy them.
+    if isinstance(value, dict):
+        if len(value) == 1:
+            for function, args in dict.iteritems(value):
+                handler = _functions.get(function)
+                if handler is not None:
+                    handler(args, found, memo)
+                    return
+        items = dict.itervalues(value)
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        return
+    for item in items:
+        item_type = type(item)
+        if item_type in _scalar_types:
+            continue
+        elif item_type in _read_only_types and item._hash is not None:
+            # Read-only values are often used many times over, so they're
+            # only scanned once per memo
+            try:
+                found.extend(memo[id(item)])
+            except KeyError:
+                start = len(found)
+                _scan(item, found, memo)
+                memo[id(item)] = found[start:]
+        else:
+            _scan(item, found, memo)
+
+
+def _named_first(kind):
+    # Functions whose first argument is the name they refer to, such as Fn::If
+    def handler(args, found, memo):
+        if isinstance(args, (list, tuple)) and args and isinstance(args[0], basestring):
+            found.append(Reference(kind, args[0]))
+            args = args[1:]
+        _scan(args, found, memo)
+    return handler
+
+
+def _named(kind):
+    # Functions whose only argument is the name they refer to, such as Ref
+    def handler(args, found, memo):
+        if isinstance(args, basestring):
+            found.append(Reference(kind, args))
+        else:
+            _scan(args, found, memo)
+    return handler
+
+
+_get_att_list = _named_first('Fn::GetAtt')
+
+
+def _get_att(args, found, memo):
+    if isinstance(args, basestring):
+        # The short form, "Resource.Attribute"
+        found.append(Reference('Fn::GetAtt', args.split('.', 1)[0]))
+    else:
+        _get_att_list(args, found, memo)
+
+
+def _sub(args, found, memo):
+    variables = {}
+    if isinstance(args, (list, tuple)) and args:
+        if len(args) > 1 and isinstance(args[1], dict):
+            variables = args[1]
+            _scan(variables, found, memo)
+        args = args[0]
+    if not isinstance(args, basestring):
+        _scan(args, found, memo)
+        return
+    for variable in _sub_variable.findall(args):
+        variable = variable.strip()
+        if variable in variables:
+            continue
+        # ${Resource.Attribute} is a GetAtt, anything else a Ref
+        if '.' in variable:
+            found.append(Reference('Fn::GetAtt', variable.split('.', 1)[0]))
+        else:
+            found.append(Reference('Ref', variable))
+
+
+_functions = {
+    'Ref': _named('Ref'),
+    'Condition': _named('Condition'),
+    'Fn::GetAtt': _get_att,
+    'Fn::FindInMap': _named_first('Fn::FindInMap'),
+    'Fn::If': _named_first('Condition'),
+    'Fn::Sub': _sub,
+}
@@ -0,0 +1,433 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Generate pyplates in a long-running server, for clients on the same machine
+
+Every run of ``cfn_py_generate`` pays for starting python and importing
+everything a pyplate needs. A :class:`Server` pays that once: it listens on a
+Unix socket, and runs the pyplates it's asked for in a pool of worker
+processes that stay loaded between requests::
+
+    cfn_py_generate --serve=/tmp/pyplates.sock --jobs=4
+
+``cfn_py_generate`` is also the client. Given ``--server``, or a
+``CFN_PYPLATES_SERVER`` environment variable, it sends its arguments to the
+server instead of running the pyplate itself, and otherwise behaves as it
+would have::
+
+    export CFN_PYPLATES_SERVER=/tmp/pyplates.sock
+    cfn_py_generate project.py project.json --check-refs
+
+A request is a JSON object on a single line, and the server replies with a
+JSON object and closes the connection. A request is a job, like the jobs of
+:mod:`cfn_pyplates.batch` (``pyplate``, ``options``, ``outfile``, ``cache``,
+``minify``, ``sort_keys`` and ``check_refs``), with some extra keys:
+
+- ``cwd``: The directory to run the pyplate in; relative paths are relative to it
+- ``environ``: The environment variables to run the pyplate with, in place of
+  the worker's own; ``cfn_py_generate`` sends its own environment
+- ``options_text``: An options mapping as JSON or YAML, used in place of an
+  options file named ``-``
+- ``split``: Split the template into nested stacks, see :mod:`cfn_pyplates.nesting`
+
+Without an ``outfile``, the reply has the generated ``template``; with one, the
+template is written there. Instead of a job, a request can have a ``batch``
+key, the path of a batch manifest, and the reply has the ``results`` of its
+jobs. Replies have ``ok`` (true or false) and the ``elapsed`` seconds, and the
+replies of failed jobs have an ``error`` object with the exception's ``type``,
+``message`` and ``traceback``.
+
+Each job is run in the directory, and with the ``sys.path`` and environment
+the worker had before it, whatever the previous job changed. Modules that pyplates import
+stay loaded in the workers between jobs, unless their source changed since, in
+which case they're imported again (see :mod:`cfn_pyplates.watch`).
+
+Anything that can connect to the socket can run code as the server's user, so
+it's only accessible to that user.
+
+"""
+import errno
+import json
+import os
+import socket
+import stat
+import sys
+import threading
+import time
+import traceback
+
+from cfn_pyplates import exceptions
+
+# Environment variable naming the socket of a server for cfn_py_generate to use
+SERVER_ENVIRONMENT_VARIABLE = 'CFN_PYPLATES_SERVER'
+
+# Keys of a job, as sent by a client, that are passed along as they are
+JOB_KEYS = ('pyplate', 'options', 'options_text', 'define', 'outfile', 'cwd', 'environ', 'cache',
+    'minify', 'sort_keys', 'check_refs', 'split')
+
+# The most connections a server handles at once; the rest wait to be accepted
+MAX_CONNECTIONS = 64
+
+# The modification times of the sources of the modules a worker has loaded,
+# by path, see _drop_changed_modules
+_module_mtimes = {}
+
+
+def run_request(job):
+    """Run a job sent to the server, in a worker process
+
+    Args:
+        job: A job dict, see :mod:`cfn_pyplates.serve`
+
+    Returns a reply dict, ready to be encoded as JSON
+
+    """
+    from cfn_pyplates import batch, cache, core, nesting
+
+    start = time.time()
+    reply = {}
+    cwd = os.getcwd()
+    path = list(sys.path)
+    environ = dict(os.environ)
+    try:
+        _drop_changed_modules()
+        if job.get('cwd'):
+            os.chdir(job['cwd'])
+        if job.get('environ') is not None:
+            _set_environ(dict((key.encode('utf-8'), value.encode('utf-8'))
+                for key, value in job['environ'].iteritems()))
+        options = batch.load_job_options(job)
+
+        use_cache = job.get('cache', True)
+        minify = job.get('minify', False)
+        sort_keys = job.get('sort_keys', False)
+        check_refs = job.get('check_refs', False)
+        if job.get('split'):
+            reply['outfiles'] = nesting._generate_split(job['pyplate'], options, job['outfile'],
+                use_cache, minify, sort_keys, check_refs)
+        elif job.get('outfile'):
+            output_cache = cache.OutputCache() if use_cache else None
+
+            def write(outfile):
+                return core._generate_pyplate(job['pyplate'], options, outfile, use_cache,
+                    output_cache, minify, sort_keys, check_refs)
+            cache.write_if_changed(job['outfile'], write)
+            reply['outfile'] = job['outfile']
+        else:
+            output_cache = cache.OutputCache() if use_cache else None
+            reply['template'] = core._generate_pyplate(job['pyplate'], options, None, use_cache,
+                output_cache, minify, sort_keys, check_refs)
+    except Exception as error:
+        reply = {'ok': False, 'error': error_info(error)}
+    else:
+        reply['ok'] = True
+    finally:
+        # Leave the worker as the job found it for the next one
+        os.chdir(cwd)
+        sys.path[:] = path
+        _set_environ(environ)
+        _note_module_mtimes()
+    reply['elapsed'] = time.time() - start
+    return reply
+
+
+def _set_environ(environ):
+    # Replace the environment variables, only touching those that change
+    for key in set(os.environ) - set(environ):
+        del os.environ[key]
+    for key, value in environ.iteritems():
+        if os.environ.get(key) != value:
+            os.environ[key] = value
+
+
+def client_environ():
+    """The environment variables of a client, for the ``environ`` of a request
+
+    Variables that aren't UTF-8 can't be sent as JSON, so they're left out.
+
+    """
+    environ = {}
+    for key, value in os.environ.iteritems():
+        try:
+            environ[key.decode('utf-8')] = value.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return environ
+
+
+def _drop_changed_modules():
+    # Forget the modules whose source changed since a job loaded them, and
+    # the modules that use them, so the next pyplate imports them again
+    from cfn_pyplates import watch
+
+    changed = set()
+    for path, mtime in _module_mtimes.items():
+        try:
+            if os.path.getmtime(path) == mtime:
+                continue
+        except OSError:
+            pass
+        changed.add(path)
+    if changed:
+        watch._drop_stale_modules(changed, set(_module_mtimes))
+        for path in changed:
+            del _module_mtimes[path]
+
+
+def _note_module_mtimes():
+    # Note the modification times of the sources of newly loaded modules
+    from cfn_pyplates import core
+
+    for module in sys.modules.values():
+        path = core._module_source(module) if module is not None else None
+        if path is None or path in _module_mtimes or core._is_installed(path):
+            continue
+        try:
+            _module_mtimes[path] = os.path.getmtime(path)
+        except OSError:
+            pass
+
+
+def error_info(error):
+    'Describe an exception being handled, for a reply'
+    return {
+        'type': error.__class__.__name__,
+        'message': unicode(error.message if isinstance(error, exceptions.Error) else error),
+        'traceback': traceback.format_exc(),
+    }
+
+
+class Server(object):
+    """Serve requests to generate pyplates on a Unix socket
+
+    Requests are handled as they come in, each by a thread of its own, but no
+    more than the number of worker processes are run at once; the rest wait
+    their turn. Once ``connections`` are being handled, no more are accepted
+    until one of them is done.
+
+    Args:
+        path: The path of the socket to listen on. If there's a socket there
+            already that nothing is listening on, it's replaced.
+        processes: The number of worker processes, defaults to the number of CPUs
+        connections: The most connections handled at once, defaults to
+            :data:`MAX_CONNECTIONS`
+
+    """
+    def __init__(self, path, processes=None, connections=MAX_CONNECTIONS):
+        self.path = path
+        self.processes = processes
+        self.connections = connections
+        self.pool = None
+        self.socket = None
+        self._closing = False
+        self._close_lock = threading.Lock()
+        self._handling = 0
+        self._handled = threading.Condition()
+
+    def listen(self):
+        'Start the workers, and start listening on the socket'
+        import multiprocessing
+
+        _remove_stale_socket(self.path)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only the user running the server gets to connect to it
+        umask = os.umask(0177)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(umask)
+        listener.listen(128)
+        self.socket = listener
+        self.pool = multiprocessing.Pool(self.processes)
+
+    def serve_forever(self):
+        'Handle requests until interrupted or closed, then clean up; call listen first'
+        listener = self.socket
+        try:
+            while listener is not None and self._reserve():
+                try:
+                    connection, address = listener.accept()
+                except socket.error as error:
+                    self._release()
+                    if error.errno == errno.EINTR or self._closing:
+                        continue
+                    raise
+                thread = threading.Thread(target=self._handle_reserved, args=(connection,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            self.close()
+
+    def _reserve(self):
+        # Wait for fewer than the most connections to be handled, and count
+        # another; False if the server's closing. The wait has a timeout, so
+        # a close from another thread or an interrupt isn't missed.
+        with self._handled:
+            while self._handling >= self.connections and not self._closing:
+                self._handled.wait(0.1)
+            if self._closing:
+                return False
+            self._handling += 1
+            return True
+
+    def _release(self):
+        with self._handled:
+            self._handling -= 1
+            self._handled.notify()
+
+    def _handle_reserved(self, connection):
+        try:
+            self.handle(connection)
+        finally:
+            self._release()
+
+    def close(self):
+        'Stop listening and stop the workers, from any thread'
+        self._closing = True
+        with self._close_lock:
+            if self.socket is not None:
+                try:
+                    # Wakes up serve_forever, if it's waiting for a connection
+                    self.socket.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                self.socket.close()
+                self.socket = None
+                if os.path.exists(self.path):
+                    os.unlink(self.path)
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool.join()
+                self.pool = None
+
+    def handle(self, connection):
+        'Read a request from a connection, and reply to it'
+        start = time.time()
+        try:
+            try:
+                request = json.loads(_read_line(connection))
+                if not isinstance(request, dict):
+                    raise exceptions.Error('A request must be a JSON object')
+                reply = self.reply(request)
+            except Exception as error:
+                reply = {'ok': False, 'error': error_info(error), 'elapsed': time.time() - start}
+            connection.sendall(json.dumps(reply) + '\n')
+        except socket.error:
+            # The client went away, nobody's left to tell
+            pass
+        finally:
+            connection.close()
+
+    def reply(self, request):
+        """Handle a request, and return the reply
+
+        Args:
+            request: The decoded request, see :mod:`cfn_pyplates.serve`
+
+        """
+        if request.get('batch'):
+            return self._reply_batch(request)
+        job = dict((key, request[key]) for key in JOB_KEYS if key in request)
+        if not job.get('pyplate'):
+            raise exceptions.Error('A request needs a pyplate, or a batch manifest')
+        return self.pool.apply(run_request, (job,))
+
+    def _reply_batch(self, request):
+        from cfn_pyplates import batch
+
+        start = time.time()
+        if request.get('cwd'):
+            manifest = os.path.join(request['cwd'], request['batch'])
+        else:
+            manifest = request['batch']
+        jobs = batch.load_manifest(manifest)
+        for job in jobs:
+            for key in ('cwd', 'environ', 'cache', 'minify', 'sort_keys', 'check_refs'):
+                if key in request:
+                    job[key] = request[key]
+            if request.get('define'):
+                job['define'] = list(job.get('define') or ()) + list(request['define'])
+        results = self.pool.map(run_request, jobs, chunksize=1)
+        for job, result in zip(jobs, results):
+            result['pyplate'] = job['pyplate']
+            result['outfile'] = job['outfile']
+        return {
+            'ok': all(result['ok'] for result in results),
+            'results': results,
+            'elapsed': time.time() - start,
+        }
+
+
+def _read_line(connection):
+    # Read up to the first newline, or until the client stops sending
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if '\n' in chunk:
+            break
+    return ''.join(chunks)
+
+
+def _remove_stale_socket(path):
+    # A socket file left behind by a server that didn't exit cleanly stops a
+    # new server binding to it, but one that's still in use shouldn't be
+    # taken, and anything that isn't a socket is left well alone
+    try:
+        mode = os.stat(path).st_mode
+    except OSError as error:
+        if error.errno == errno.ENOENT:
+            return
+        raise
+    if not stat.S_ISSOCK(mode):
+        raise exceptions.Error('{0} exists and isn\'t a socket'.format(path))
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error:
+        os.unlink(path)
+    else:
+        raise exceptions.Error('A server is already listening on {0}'.format(path))
+    finally:
+        probe.close()
+
+
+def request(path, message, timeout=None):
+    """Send a request to a server, and return its reply
+
+    Args:
+        path: The path of the server's socket
+        message: The request, a dict, see :mod:`cfn_pyplates.serve`
+        timeout: The most seconds to wait for the reply, or None to wait
+            as long as it takes
+
+    Raises:
+        socket.error: If the server can't be reached
+
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(path)
+        connection.sendall(json.dumps(message) + '\n')
+        connection.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        connection.close()
+    return json.loads(''.join(chunks))
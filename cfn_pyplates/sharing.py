@@ -0,0 +1,275 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Store repeated parts of a template once
+
+Big templates tend to repeat themselves: the same health check, tag list or
+security group rules, over and over across hundreds of resources, each a
+separate dict or list. With sharing turned on (see
+:class:`cfn_pyplates.core.CloudFormationTemplate`), plain dicts and lists in
+a template are swapped for read-only :class:`SharedDict` and
+:class:`SharedList` copies, and equal copies are the same object, so each
+distinct subtree is only stored once.
+
+Shared subtrees are copied on write: getting one by key or index from a
+:class:`JSONableDict <cfn_pyplates.core.JSONableDict>`, or from a dict or
+list that was itself gotten that way, swaps in a private, writable copy of it
+first. So this just works, and only changes the first bucket::
+
+    first_bucket['Properties']['Tags'][0]['Value'] = 'changed'
+
+Values reached by iterating (``items()``, ``values()``, ``for tag in tags``)
+are not copied, and are read-only if they're shared.
+
+Since shared subtrees are copies, changing a dict or list after giving it to
+a sharing template doesn't change the template; change it through the
+template instead.
+
+"""
+import weakref
+from collections import OrderedDict
+
+from cfn_pyplates.functions import Intrinsic, _CachedFragment
+
+
+class SharedDict(_CachedFragment, dict):
+    """A read-only dict, shared by every part of a template that contains an equal dict
+
+    Made by :func:`share`, and not meant to be made directly. Its keys are
+    kept in the order of the dict it was made from, so that it encodes the
+    same way.
+
+    """
+    __slots__ = ('_keys', '_hash', '_fragments', '__weakref__')
+
+    def __iter__(self):
+        return iter(self._keys)
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self._keys)
+
+    def itervalues(self):
+        for key in self._keys:
+            yield dict.__getitem__(self, key)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def iteritems(self):
+        for key in self._keys:
+            yield key, dict.__getitem__(self, key)
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __repr__(self):
+        return '{' + ', '.join('{0!r}: {1!r}'.format(*item) for item in self.iteritems()) + '}'
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return OrderedDict, (self.items(),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Shared dicts are read-only, get this dict by key from its parent '
+            'for a copy that can be changed')
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+class SharedList(_CachedFragment, list):
+    """A read-only list, shared by every part of a template that contains an equal list
+
+    Made by :func:`share`, and not meant to be made directly.
+
+    """
+    __slots__ = ('_hash', '_fragments', '__weakref__')
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Shared lists are read-only, get this list by index from its parent '
+            'for a copy that can be changed')
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = reverse = sort = _readonly
+
+
+class CopyOnWriteDict(OrderedDict):
+    """An OrderedDict that copies shared values when they're gotten by key
+
+    Whoever gets a value by key might change it, so a shared value is swapped
+    for a private copy (see :func:`thaw`) first. Iterating hands out values
+    as they are. :class:`JSONableDict <cfn_pyplates.core.JSONableDict>` is one
+    of these, and so are the private copies of shared dicts.
+
+    """
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if type(value) in _shared_types:
+            value = thaw(value)
+            # Replacing an existing key, so the order is untouched
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def itervalues(self):
+        for key in self:
+            yield dict.__getitem__(self, key)
+
+    def iteritems(self):
+        for key in self:
+            yield key, dict.__getitem__(self, key)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+
+class CopyOnWriteList(list):
+    'A private copy of a SharedList, which copies shared items when they are gotten by index'
+    __slots__ = ()
+
+    def __getitem__(self, index):
+        value = list.__getitem__(self, index)
+        if not isinstance(index, slice) and type(value) in _shared_types:
+            value = thaw(value)
+            list.__setitem__(self, index, value)
+        return value
+
+
+_shared_types = frozenset([SharedDict, SharedList])
+_scalar_types = frozenset([str, unicode, int, long, bool, type(None)])
+
+# Shared subtrees, by key; see share
+_interned = {}
+
+
+def _forget(ref):
+    # A shared subtree was garbage collected
+    if _interned.get(ref.key) is ref:
+        del _interned[ref.key]
+
+
+def _intern(cls, key, contents):
+    key = (cls, key)
+    ref = _interned.get(key)
+    shared = ref() if ref is not None else None
+    if shared is None:
+        shared = cls(contents)
+        if cls is SharedDict:
+            shared._keys = tuple(item[0] for item in contents)
+        shared._hash = hash(key)
+        shared._fragments = None
+        _interned[key] = weakref.KeyedRef(shared, _forget, key)
+    return shared
+
+
+def share(value):
+    """Swap the plain dicts and lists in a value for shared, read-only copies
+
+    JSONableDicts are changed in place: their values are shared, but they
+    aren't shared themselves. Dicts and lists that contain something that
+    can't be shared (like a JSONableDict, or an object the JSON encoder
+    converts with ``default``) are copied into a :class:`CopyOnWriteDict` or
+    :class:`CopyOnWriteList`, with as much of their contents shared as possible.
+
+    Args:
+        value: A value that's about to go into a template
+
+    Returns the value to put in the template in its place
+
+    """
+    return _share(value)[0]
+
+
+def _share(value):
+    # Returns the value to use, and a key that's only equal for values that
+    # encode identically, or None if the value can't be shared
+    value_type = type(value)
+    if value_type in _scalar_types:
+        return value, (value_type, value)
+    elif value_type is float:
+        # 0.0 == -0.0, but they encode differently
+        return value, (float, repr(value))
+    elif value_type in _shared_types:
+        # Already shared, so its identity is as good as its contents
+        return value, (value_type, id(value))
+    elif value_type is Intrinsic:
+        return value, ((Intrinsic, id(value)) if value._hash is not None else None)
+    elif value_type is dict or value_type is OrderedDict or value_type is CopyOnWriteDict:
+        items = []
+        keys = []
+        for key, item in value.iteritems():
+            item, item_key = _share(item)
+            items.append((key, item))
+            if item_key is None or type(key) not in _scalar_types:
+                keys = None
+            elif keys is not None:
+                keys.append((type(key), key, item_key))
+        if keys is None:
+            return CopyOnWriteDict(items), None
+        shared = _intern(SharedDict, tuple(keys), items)
+        return shared, (SharedDict, id(shared))
+    elif value_type is list or value_type is tuple or value_type is CopyOnWriteList:
+        items = []
+        keys = []
+        for item in value:
+            item, item_key = _share(item)
+            items.append(item)
+            if item_key is None:
+                keys = None
+            elif keys is not None:
+                keys.append(item_key)
+        if keys is None:
+            return CopyOnWriteList(items), None
+        shared = _intern(SharedList, tuple(keys), items)
+        return shared, (SharedList, id(shared))
+    elif hasattr(value, '_share_contents'):
+        # A JSONableDict
+        value._share_contents()
+    return value, None
+
+
+def thaw(value):
+    """A private, writable copy of a shared subtree
+
+    Only the top level is copied; anything shared inside it is copied when
+    it's gotten by key or index.
+
+    Args:
+        value: A :class:`SharedDict` or :class:`SharedList`
+
+    """
+    if isinstance(value, SharedDict):
+        return CopyOnWriteDict(value.iteritems())
+    return CopyOnWriteList(value)
@@ -0,0 +1,473 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Check resources against the CloudFormation resource specification
+
+AWS publishes the types of resource CloudFormation knows about, with their
+properties and attributes, as a JSON `resource specification <cfn-spec_>`_.
+A :class:`ResourceSpec` loaded from a copy of it can find typos in resource
+types and property names, missing required properties, values of the wrong
+type, and ``Fn::GetAtt`` attributes a resource doesn't have, before
+CloudFormation does::
+
+    spec = ResourceSpec.load('CloudFormationResourceSpecification.json')
+    spec.check(cft)
+    # SpecificationError: 2 problem(s) with resources:
+    #   Resources.Web: AWS::EC2::Instanse isn't a resource type (did you mean
+    #   AWS::EC2::Instance?)
+    #   Resources.Db.Properties.DBInstanceClas isn't a property of
+    #   AWS::RDS::DBInstance (did you mean DBInstanceClass?)
+
+The specification is several megabytes of JSON, which takes a while to
+parse. The first time a specification file is loaded, the parts needed to
+check resources are compiled into an index, kept in the per-user cache (see
+:func:`cfn_pyplates.cache.cache_dir`) much like compiled pyplates are, and
+loading the same file again loads the index instead. Each type is stored in
+the index on its own, and only unpacked if a template uses it.
+
+Custom resources (``AWS::CloudFormation::CustomResource`` and
+``Custom::...`` types) can have any properties and attributes, so they're
+only checked for the type name. Values made with intrinsic functions aren't
+checked at all, since what they turn into isn't known until the stack is made.
+
+"""
+import difflib
+import gzip
+import hashlib
+import imp
+import json
+import marshal
+import os
+import re
+from collections import namedtuple
+
+from cfn_pyplates import cache, exceptions
+from cfn_pyplates.functions import Intrinsic
+
+# Bumped whenever what's kept in an index changes
+_INDEX_FORMAT = 1
+
+# The value types that aren't property types
+PRIMITIVE_TYPES = frozenset(['String', 'Long', 'Integer', 'Double', 'Boolean', 'Timestamp', 'Json'])
+
+# Resource types that can have any properties and attributes
+CUSTOM_RESOURCE_TYPE = 'AWS::CloudFormation::CustomResource'
+CUSTOM_RESOURCE_PREFIX = 'Custom::'
+
+SpecProblem = namedtuple('SpecProblem', ['path', 'message'])
+"""Something about a resource that doesn't match the resource specification
+
+``path`` is where the problem is in the template, a tuple of keys and list
+indexes like ``('Resources', 'Web', 'Properties', 'ImageId')``.
+
+"""
+
+_integer = re.compile(r'^[-+]?\d+$')
+
+
+class ResourceSpec(object):
+    """The resource and property types of a resource specification
+
+    Args:
+        resource_types: A mapping of each resource type's ``(properties,
+            required, attributes)``
+        property_types: A mapping of each property type's ``(properties, required)``
+        version: The version of the specification, if it gave one
+        digest: A hex digest of the specification's source, if known
+
+    Properties are dicts of each property's value type, a ``(container,
+    item)`` tuple: the container is ``'List'``, ``'Map'`` or None, and the
+    item a primitive type or the full name of a property type, or None if
+    anything goes. ``required`` and ``attributes`` are tuples of names.
+
+    Use :meth:`load` or :meth:`from_json` to make one.
+
+    """
+    def __init__(self, resource_types, property_types, version=None, digest=None):
+        self.resource_types = resource_types
+        self.property_types = property_types
+        self.version = version
+        self.digest = digest
+
+    @classmethod
+    def from_json(cls, spec, digest=None):
+        """Compile a parsed resource specification
+
+        Args:
+            spec: The specification's JSON, as loaded by :func:`json.load`
+            digest: A hex digest of the specification's source, if known
+
+        """
+        definitions = spec.get('PropertyTypes') or {}
+        names = frozenset(definitions)
+        property_types = {}
+        for name, definition in definitions.iteritems():
+            property_types[_name(name)] = _compile_properties(definition,
+                name.split('.', 1)[0], names)
+        resource_types = {}
+        for name, definition in (spec.get('ResourceTypes') or {}).iteritems():
+            properties, required = _compile_properties(definition, name, names)
+            attributes = tuple(sorted(_name(attribute)
+                for attribute in definition.get('Attributes') or ()))
+            resource_types[_name(name)] = (properties, required, attributes)
+        return cls(resource_types, property_types, spec.get('ResourceSpecificationVersion'),
+            digest)
+
+    @classmethod
+    def load(cls, path, use_cache=True):
+        """Load a resource specification file, using its compiled index if there is one
+
+        Like compiled pyplates (see :func:`cfn_pyplates.cache.compile_pyplate`),
+        the index is used without reading the specification at all if its
+        mtime and size haven't changed, and otherwise if its contents haven't.
+
+        Args:
+            path: The path of the specification, which can be gzipped if its
+                name ends in ``.gz``
+            use_cache: If False, the specification is always parsed, and no
+                index is read or written
+
+        """
+        stat = os.stat(path)
+        mtime, size = int(stat.st_mtime * 1000000), stat.st_size
+        index_path = _index_path(path)
+        if use_cache:
+            header, index = cache._read_bytecode(index_path)
+            if header is not None and header[1:3] == (mtime, size):
+                spec = cls._from_index(index)
+                if spec is not None:
+                    return spec
+
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as spec_file:
+            source = spec_file.read()
+        digest = hashlib.sha1(source).digest()
+        if use_cache and header is not None and header[3] == digest:
+            spec = cls._from_index(index)
+        else:
+            spec = None
+        if spec is None:
+            spec = cls.from_json(json.loads(source), digest.encode('hex'))
+        if use_cache:
+            # Either the index is new, or its header needs the mtime and size refreshed
+            cache._write_bytecode(index_path, (imp.get_magic(), mtime, size, digest),
+                spec._to_index())
+        return spec
+
+    @classmethod
+    def _from_index(cls, index):
+        # A spec from a loaded index, or None if it's in an older format
+        if not isinstance(index, tuple) or not index or index[0] != _INDEX_FORMAT:
+            return None
+        _, resource_types, property_types, version, digest = index
+        return cls(_Definitions(resource_types), _Definitions(property_types), version, digest)
+
+    def _to_index(self):
+        # What's marshalled into an index, with each type marshalled on its own
+        return (_INDEX_FORMAT, _marshal_each(self.resource_types),
+            _marshal_each(self.property_types), self.version, self.digest)
+
+    def problems(self, cft):
+        """Find everything about a template's resources that doesn't match this specification
+
+        Args:
+            cft: A :class:`cfn_pyplates.core.CloudFormationTemplate`, or any
+                dict like one
+
+        Returns a list of :data:`SpecProblem`, in the order of the template
+
+        """
+        found = []
+        resources = dict.get(cft, 'Resources') or {}
+        types = {}
+        for name, resource in resources.iteritems():
+            path = ('Resources', name)
+            if not isinstance(resource, dict):
+                continue
+            resource_type = dict.get(resource, 'Type')
+            types[name] = resource_type
+            if not isinstance(resource_type, basestring):
+                found.append(SpecProblem(path, 'has no Type'))
+                continue
+            if _is_custom(resource_type):
+                continue
+            definition = self.resource_types.get(resource_type)
+            if definition is None:
+                found.append(SpecProblem(path, '{0} isn\'t a resource type{1}'.format(
+                    resource_type, _suggest(resource_type, self.resource_types))))
+                continue
+            properties = dict.get(resource, 'Properties')
+            if properties is None:
+                properties = {}
+            self._check_properties(properties, definition[:2], resource_type,
+                path + ('Properties',), found)
+
+        for section in ('Resources', 'Outputs'):
+            for name, entry in (dict.get(cft, section) or {}).iteritems():
+                self._check_attributes(entry, types, (section, name), found)
+        return found
+
+    def check(self, cft):
+        """Make sure a template's resources match this specification
+
+        Args:
+            cft: A :class:`cfn_pyplates.core.CloudFormationTemplate`
+
+        Raises:
+            SpecificationError: :exc:`cfn_pyplates.exceptions.SpecificationError`,
+            describing every problem. They're also in its ``problems``
+            attribute, as returned by :meth:`problems`.
+
+        """
+        problems = self.problems(cft)
+        if problems:
+            lines = ['{0} problem(s) with resources:'.format(len(problems))]
+            for problem in problems:
+                lines.append('  {0}{1} {2}'.format(_format_path(problem.path),
+                    ':' if problem.message[0].isupper() else '', problem.message))
+            error = exceptions.SpecificationError('\n'.join(lines))
+            error.problems = problems
+            raise error
+
+    def _check_properties(self, properties, definition, type_name, path, found):
+        # Check the properties of a resource or property type
+        allowed, required = definition
+        if not isinstance(properties, dict):
+            found.append(SpecProblem(path, 'should be an object of {0} properties'.format(
+                type_name)))
+            return
+        if allowed is None:
+            # Resource types without properties in the specification can't have any
+            for name in properties:
+                found.append(SpecProblem(path + (name,), 'isn\'t a property of {0}, which '
+                    'has none'.format(type_name)))
+            return
+        for name, value in properties.iteritems():
+            value_type = allowed.get(name)
+            if value_type is None:
+                found.append(SpecProblem(path + (name,), 'isn\'t a property of {0}{1}'.format(
+                    type_name, _suggest(name, allowed))))
+            else:
+                self._check_value(value, value_type, path + (name,), found)
+        for name in required:
+            if name not in properties:
+                found.append(SpecProblem(path, 'is missing {0}, which {1} requires'.format(
+                    name, type_name)))
+
+    def _check_value(self, value, value_type, path, found):
+        container, item = value_type
+        if _is_intrinsic(value):
+            return
+        if container == 'List':
+            if not isinstance(value, (list, tuple)):
+                found.append(SpecProblem(path, 'should be a list'))
+            else:
+                for index, element in enumerate(value):
+                    self._check_item(element, item, path + (index,), found)
+        elif container == 'Map':
+            if not isinstance(value, dict):
+                found.append(SpecProblem(path, 'should be an object'))
+            else:
+                for key, element in value.iteritems():
+                    self._check_item(element, item, path + (key,), found)
+        else:
+            self._check_item(value, item, path, found)
+
+    def _check_item(self, value, item, path, found):
+        if item is None or _is_intrinsic(value):
+            return
+        if item in PRIMITIVE_TYPES:
+            if not _primitive_checks[item](value):
+                found.append(SpecProblem(path, 'should be {0} {1}, not {2!r}'.format(
+                    'an' if item[0] in 'AEIOU' else 'a', item, value)))
+            return
+        definition = self.property_types.get(item)
+        if definition is not None and definition[0] is not None:
+            self._check_properties(value, definition, item, path, found)
+
+    def _check_attributes(self, value, types, path, found):
+        # Check the attributes of the resources an entry gets with Fn::GetAtt
+        pending = [value]
+        while pending:
+            value = pending.pop()
+            if isinstance(value, dict):
+                if len(value) == 1 and 'Fn::GetAtt' in value:
+                    self._check_attribute(dict.get(value, 'Fn::GetAtt'), types, path, found)
+                pending.extend(dict.itervalues(value))
+            elif isinstance(value, (list, tuple)):
+                pending.extend(value)
+
+    def _check_attribute(self, args, types, path, found):
+        if isinstance(args, basestring) and '.' in args:
+            args = args.split('.', 1)
+        if not (isinstance(args, (list, tuple)) and len(args) == 2
+                and isinstance(args[0], basestring) and isinstance(args[1], basestring)):
+            return
+        name, attribute = args
+        resource_type = types.get(name)
+        if not isinstance(resource_type, basestring) or _is_custom(resource_type):
+            return
+        definition = self.resource_types.get(resource_type)
+        if definition is not None and attribute not in definition[2]:
+            found.append(SpecProblem(path, 'gets {0}.{1}, which {2} doesn\'t have{3}'.format(
+                name, attribute, resource_type, _suggest(attribute, definition[2]))))
+
+
+class _Definitions(object):
+    'Type definitions from an index, each unmarshalled the first time it\'s used'
+    def __init__(self, marshalled):
+        self.marshalled = marshalled
+        self._loaded = {}
+
+    def get(self, name, default=None):
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        marshalled = self.marshalled.get(name)
+        if marshalled is None:
+            return default
+        definition = self._loaded[name] = marshal.loads(marshalled)
+        return definition
+
+    def __getitem__(self, name):
+        definition = self.get(name)
+        if definition is None:
+            raise KeyError(name)
+        return definition
+
+    def __contains__(self, name):
+        return name in self.marshalled
+
+    def __iter__(self):
+        return iter(self.marshalled)
+
+    def __len__(self):
+        return len(self.marshalled)
+
+
+def _marshal_each(definitions):
+    if isinstance(definitions, _Definitions):
+        return definitions.marshalled
+    return dict((name, marshal.dumps(definitions[name])) for name in definitions)
+
+
+def _name(name):
+    # Names are kept as interned byte strings, which marshal stores only once
+    return intern(name.encode('utf-8'))
+
+
+def _compile_properties(definition, scope, names):
+    # The properties of a resource or property type, and which are required.
+    # Property types without properties of their own can be anything.
+    if 'Properties' not in definition:
+        return None, ()
+    properties = {}
+    required = []
+    for name, property_definition in definition['Properties'].iteritems():
+        name = _name(name)
+        properties[name] = _value_type(property_definition, scope, names)
+        if property_definition.get('Required'):
+            required.append(name)
+    return properties, tuple(sorted(required))
+
+
+def _value_type(definition, scope, names):
+    # The (container, item) of a property's value
+    if 'PrimitiveType' in definition:
+        return None, _name(definition['PrimitiveType'])
+    container = definition.get('Type')
+    if container in ('List', 'Map'):
+        item = definition.get('PrimitiveItemType')
+        if item is None:
+            item = _property_type(definition.get('ItemType'), scope, names)
+        else:
+            item = _name(item)
+        return _name(container), item
+    return None, _property_type(container, scope, names)
+
+
+def _property_type(name, scope, names):
+    # A property type's name within a resource type, like BlockDeviceMapping,
+    # is short for AWS::EC2::Instance.BlockDeviceMapping. Some, like Tag,
+    # are shared by every resource type.
+    if name is None:
+        return None
+    qualified = u'{0}.{1}'.format(scope, name)
+    if qualified in names:
+        return _name(qualified)
+    return _name(name) if name in names else None
+
+
+def _index_path(path):
+    # Indexes are kept in the per-user cache, by the specification's path
+    name = hashlib.sha1(os.path.abspath(path)).hexdigest()
+    return os.path.join(cache.cache_dir(), 'spec', name + '.idx')
+
+
+def _is_custom(resource_type):
+    return resource_type == CUSTOM_RESOURCE_TYPE or resource_type.startswith(
+        CUSTOM_RESOURCE_PREFIX)
+
+
+def _is_intrinsic(value):
+    # Intrinsic functions, and the equivalent plain dicts, like {'Ref': 'VPC'}
+    if isinstance(value, Intrinsic):
+        return True
+    if isinstance(value, dict) and len(value) == 1:
+        for key in dict.iterkeys(value):
+            return key == 'Ref' or key == 'Condition' or key.startswith('Fn::')
+    return False
+
+
+def _is_number(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+
+def _is_float_string(value):
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+# CloudFormation converts strings to numbers and booleans, and the other way round
+_primitive_checks = {
+    'String': lambda value: isinstance(value, (basestring, int, long, float)),
+    'Long': lambda value: (isinstance(value, (int, long)) and not isinstance(value, bool)) or (
+        isinstance(value, float) and value.is_integer()) or (
+        isinstance(value, basestring) and _integer.match(value) is not None),
+    'Double': lambda value: _is_number(value) or (
+        isinstance(value, basestring) and _is_float_string(value)),
+    'Boolean': lambda value: isinstance(value, bool) or (
+        isinstance(value, basestring) and value.lower() in ('true', 'false')),
+    'Timestamp': lambda value: isinstance(value, basestring),
+    'Json': lambda value: isinstance(value, (dict, basestring)),
+}
+_primitive_checks['Integer'] = _primitive_checks['Long']
+
+
+def _suggest(name, names):
+    close = difflib.get_close_matches(name, names, 1)
+    return ' (did you mean {0}?)'.format(close[0]) if close else ''
+
+
+def _format_path(path):
+    # ('Resources', 'Web', 'Properties', 'Tags', 0) as Resources.Web.Properties.Tags[0]
+    text = ''
+    for key in path:
+        if isinstance(key, (int, long)):
+            text += '[{0}]'.format(key)
+        else:
+            text += ('.' if text else '') + key
+    return text
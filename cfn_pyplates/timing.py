@@ -0,0 +1,191 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Time the phases of generating templates
+
+When generating a template is slow, a :class:`Profile` tells you where the
+time went: loading options, compiling or running the pyplate, checking its
+references, or serializing it. Pass one to
+:func:`cfn_pyplates.core.generate_pyplate`, or use ``cfn_py_generate --profile``::
+
+    profile = Profile()
+    generate_pyplate('project.py', options, profile=profile)
+    profile.report()
+
+The phases are:
+
+- ``options``: Loading the options files
+- ``cache lookup``: Looking for the template in the output cache
+- ``compile``: Compiling the pyplate, or loading it from the bytecode cache
+- ``run``: Running the pyplate
+- ``find template``: Finding the pyplate's template
+- ``check refs``: Checking the template's references, with ``--check-refs``
+- ``check spec``: Checking the template's resources, with ``--spec``
+- ``dependencies``: Finding the files the template depends on, for the output cache
+- ``serialize``: Encoding the template as JSON, and writing it out
+
+"""
+import gc
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Profile(object):
+    """Wall and CPU time spent in each phase of generating templates
+
+    Time spent in a phase is added up over every time it's run, so one
+    profile can cover a whole batch.
+
+    Args:
+        count_objects: If True, also count the objects each phase leaves
+            behind, as the change in the number of objects the garbage
+            collector tracks. Counting them takes a while with a lot of
+            objects around, which is counted as part of each phase's time.
+
+    Attributes:
+        phases: An OrderedDict of each phase's ``calls``, ``wall`` and ``cpu``
+            seconds, and ``objects`` if they're counted, in the order the
+            phases were first run
+        jobs: The phases of each job of a batch, see :meth:`merge`
+
+    """
+    def __init__(self, count_objects=False):
+        self.count_objects = count_objects
+        self.phases = OrderedDict()
+        self.jobs = []
+
+    @contextmanager
+    def phase(self, name):
+        'A context manager timing the code it runs as part of a phase'
+        objects = len(gc.get_objects()) if self.count_objects else None
+        wall, cpu = time.time(), _cpu_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.time() - wall, _cpu_time() - cpu
+            if objects is not None:
+                objects = len(gc.get_objects()) - objects
+            self.add(name, wall, cpu, objects)
+
+    def add(self, name, wall, cpu, objects=None, calls=1):
+        """Add time spent in a phase
+
+        Args:
+            name: The phase's name
+            wall: Wall time, in seconds
+            cpu: CPU time, in seconds
+            objects: The change in the number of objects, if they were counted
+            calls: The number of times the phase was run
+
+        """
+        totals = self.phases.get(name)
+        if totals is None:
+            totals = self.phases[name] = OrderedDict([('calls', 0), ('wall', 0.0), ('cpu', 0.0)])
+        totals['calls'] += calls
+        totals['wall'] += wall
+        totals['cpu'] += cpu
+        if objects is not None:
+            totals['objects'] = totals.get('objects', 0) + objects
+
+    def merge(self, other, **job):
+        """Add the phases of another profile to this one's
+
+        Args:
+            other: The other :class:`Profile`
+            job: If given, describes the other profile, like the ``pyplate``
+                and ``outfile`` of a batch job, and the other profile's
+                phases are added to :attr:`jobs` as well
+
+        """
+        for name, totals in other.phases.iteritems():
+            self.add(name, totals['wall'], totals['cpu'], totals.get('objects'), totals['calls'])
+        if job:
+            job['phases'] = other.phases
+            self.jobs.append(job)
+
+    def total(self):
+        'The total wall and CPU seconds of every phase'
+        return (sum(totals['wall'] for totals in self.phases.itervalues()),
+            sum(totals['cpu'] for totals in self.phases.itervalues()))
+
+    def report(self, stream=None):
+        """Write a table of the phases, slowest first
+
+        Args:
+            stream: The file object to write it to, defaults to stderr
+
+        """
+        stream = sys.stderr if stream is None else stream
+        counted = any('objects' in totals for totals in self.phases.itervalues())
+        header = '{0:<16}{1:>7}{2:>11}{3:>7}{4:>11}'.format('phase', 'calls', 'wall', '%', 'cpu')
+        if counted:
+            header += '{0:>11}'.format('objects')
+        stream.write(header + '\n')
+
+        total_wall, total_cpu = self.total()
+        phases = sorted(self.phases.iteritems(), key=lambda item: item[1]['wall'], reverse=True)
+        for name, totals in phases:
+            line = '{0:<16}{1:>7}{2:>10.3f}s{3:>7.1%}{4:>10.3f}s'.format(name, totals['calls'],
+                totals['wall'], totals['wall'] / total_wall if total_wall else 0, totals['cpu'])
+            if counted:
+                line += '{0:>+11,}'.format(totals['objects']) if 'objects' in totals else ' ' * 11
+            stream.write(line + '\n')
+        stream.write('{0:<23}{1:>10.3f}s{2:>17.3f}s\n'.format('total', total_wall, total_cpu))
+
+    def write_json(self, path):
+        """Write the profile to a JSON file, to be put together with others
+
+        The file has the totals for each phase as ``phases``, and the phases
+        of each batch job as ``jobs``.
+
+        Args:
+            path: The path of the file to write
+
+        """
+        with open(path, 'w') as json_file:
+            json.dump(OrderedDict([('phases', self.phases), ('jobs', self.jobs)]), json_file,
+                indent=2, separators=(',', ': '))
+            json_file.write('\n')
+
+
+class _NoPhase(object):
+    'Stands in for Profile.phase when nothing is being profiled'
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+_no_phase = _NoPhase()
+
+
+def phase(profile, name):
+    """Time a phase if there's a profile, or do nothing if there isn't
+
+    Args:
+        profile: A :class:`Profile`, or None
+        name: The name of the phase
+
+    Returns a context manager, see :meth:`Profile.phase`
+
+    """
+    return _no_phase if profile is None else profile.phase(name)
+
+
+def _cpu_time():
+    # CPU time used by this process, in both user and system mode
+    times = os.times()
+    return times[0] + times[1]
@@ -0,0 +1,254 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Find the lines of a pyplate that take the time, and make the resources
+
+A :class:`Tracer` follows a pyplate as it runs, line by line, and charges
+each line with the time spent on it, the JSONableDicts (resources,
+properties, and so on) made while it ran, and the resources it added to the
+template. Time spent in cfn_pyplates and the standard library is charged to
+the pyplate line that called them, so the lines and functions you wrote are
+what's left to look at::
+
+    tracer = Tracer()
+    generate_pyplate('project.py', options, tracer=tracer)
+    tracer.report()
+    with open('project.stacks', 'w') as stacks:
+        tracer.write_collapsed(stacks)
+
+Lines are identified by the stack of calls that led to them, so a line in a
+helper function is charged separately for each line that called the helper.
+:meth:`Tracer.write_collapsed` writes the stacks in the collapsed format that
+flame graph tools, like ``flamegraph.pl`` or speedscope, read.
+
+Tracing makes pyplates run several times slower, so compare the lines
+against each other rather than taking their times at face value.
+
+"""
+import linecache
+import os
+import sys
+import time
+from collections import defaultdict
+
+from cfn_pyplates import core
+
+# What Tracer.write_collapsed can write for each stack
+METRICS = ('time', 'dicts', 'resources')
+
+_package_dir = os.path.dirname(os.path.abspath(__file__))
+_stdlib_dir = os.path.dirname(os.path.abspath(os.__file__))
+
+# Calls the tracer counts, wherever they're made from
+_jsonabledict_init = core.JSONableDict.__init__.im_func.func_code
+_section_setitem = core._Section.__setitem__.im_func.func_code
+
+
+class Tracer(object):
+    """Charge the lines of running pyplates with the time and dicts they take
+
+    A tracer is used as a context manager around running a pyplate, and can
+    be used again to add up more than one run.
+
+    Attributes:
+        time: The seconds spent on each stack of lines
+        dicts: The number of JSONableDicts made by each stack of lines
+        resources: The number of resources added to templates by each stack of lines
+
+    Stacks are tuples of ``(function, filename, line number)`` tuples, outermost first.
+
+    """
+    def __init__(self):
+        self.time = defaultdict(float)
+        self.dicts = defaultdict(int)
+        self.resources = defaultdict(int)
+        # The stack of lines leading to each traced frame that's running
+        self._stacks = {}
+        self._labels = {}
+        self._traced_files = {}
+        self._current = None
+        self._last = None
+        self._previous_trace = None
+
+    def __enter__(self):
+        self._previous_trace = sys.gettrace()
+        self._current = None
+        self._last = time.time()
+        sys.settrace(self._trace_call)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.settrace(self._previous_trace)
+        self._charge(time.time())
+        self._stacks.clear()
+        self._current = None
+        return False
+
+    def _charge(self, now):
+        # Charge the time since the last event to the line that was running
+        if self._current is not None:
+            self.time[self._current] += now - self._last
+
+    def _trace_call(self, frame, event, arg):
+        # The global trace function, called as every frame starts running
+        self._charge(time.time())
+        code = frame.f_code
+        if self._current is not None:
+            if code is _jsonabledict_init:
+                self.dicts[self._current] += 1
+            elif code is _section_setitem:
+                section, key = frame.f_locals['self'], frame.f_locals['key']
+                if isinstance(section, core.Resources) and key not in section:
+                    self.resources[self._current] += 1
+
+        if not self._is_traced(code.co_filename):
+            self._last = time.time()
+            return None
+
+        stack = ()
+        parent = frame.f_back
+        while parent is not None:
+            if parent in self._stacks:
+                stack = self._stacks[parent] + (self._label(parent.f_code, parent.f_lineno),)
+                break
+            parent = parent.f_back
+        self._stacks[frame] = stack
+        self._current = stack + (self._label(code, frame.f_lineno),)
+        self._last = time.time()
+        return self._trace_line
+
+    def _trace_line(self, frame, event, arg):
+        # The local trace function of the frames being traced
+        self._charge(time.time())
+        if event == 'line':
+            self._current = self._stacks[frame] + (self._label(frame.f_code, frame.f_lineno),)
+        elif event == 'return':
+            # Back to the line that called this frame, if it's being traced
+            self._current = self._stacks.pop(frame, None) or None
+        self._last = time.time()
+        return self._trace_line
+
+    def _is_traced(self, filename):
+        # Only pyplates and the modules they use are traced, not the ones
+        # that come with python or cfn_pyplates
+        traced = self._traced_files.get(filename)
+        if traced is None:
+            path = os.path.abspath(filename)
+            installed = os.sep + 'site-packages' + os.sep in path or (
+                os.sep + 'dist-packages' + os.sep in path)
+            traced = not (path.startswith(_package_dir + os.sep) or
+                (path.startswith(_stdlib_dir + os.sep) and not installed))
+            self._traced_files[filename] = traced
+        return traced
+
+    def _label(self, code, lineno):
+        # Labels are kept, rather than making a new tuple for every line run
+        label = self._labels.get((code, lineno))
+        if label is None:
+            label = self._labels[code, lineno] = (
+                code.co_name, _display_path(code.co_filename), lineno)
+        return label
+
+    def lines(self):
+        """The totals of each line, however it was reached
+
+        Returns a list of ``(filename, line number, seconds, dicts, resources)``
+        tuples, slowest first
+
+        """
+        totals = defaultdict(lambda: [0.0, 0, 0])
+        for stack, metrics in self._stack_metrics():
+            location = stack[-1][1:]
+            for metric in range(3):
+                totals[location][metric] += metrics[metric]
+        return sorted((location + tuple(total) for location, total in totals.iteritems()),
+            key=lambda line: line[2], reverse=True)
+
+    def functions(self):
+        """The totals of each function, including the functions it calls
+
+        Returns a list of ``(function, filename, seconds, dicts, resources)``
+        tuples, slowest first
+
+        """
+        totals = defaultdict(lambda: [0.0, 0, 0])
+        for stack, metrics in self._stack_metrics():
+            # A recursive function is only charged once for each stack
+            for function in set(label[:2] for label in stack):
+                for metric in range(3):
+                    totals[function][metric] += metrics[metric]
+        return sorted((function + tuple(total) for function, total in totals.iteritems()),
+            key=lambda function: function[2], reverse=True)
+
+    def _stack_metrics(self):
+        # Every stack with anything charged to it, and its time, dicts and resources
+        for stack in set(self.time) | set(self.dicts) | set(self.resources):
+            yield stack, (self.time.get(stack, 0.0), self.dicts.get(stack, 0),
+                self.resources.get(stack, 0))
+
+    def report(self, stream=None, limit=20):
+        """Write tables of the lines and functions that took the most time
+
+        Args:
+            stream: The file object to write them to, defaults to stderr
+            limit: The number of lines, and of functions, to list
+
+        """
+        stream = sys.stderr if stream is None else stream
+        total = sum(self.time.itervalues())
+        header = '{0:>10}{1:>7}{2:>9}{3:>11}  {4}\n'
+        row = '{0:>9.3f}s{1:>7.1%}{2:>9,}{3:>11,}  {4}\n'
+
+        stream.write(header.format('self', '%', 'dicts', 'resources', 'line'))
+        for filename, lineno, seconds, dicts, resources in self.lines()[:limit]:
+            source = linecache.getline(filename, lineno).strip()
+            stream.write(row.format(seconds, seconds / total if total else 0, dicts, resources,
+                '{0}:{1}: {2}'.format(filename, lineno, source)))
+
+        stream.write('\n' + header.format('total', '%', 'dicts', 'resources', 'function'))
+        for name, filename, seconds, dicts, resources in self.functions()[:limit]:
+            stream.write(row.format(seconds, seconds / total if total else 0, dicts, resources,
+                '{0} ({1})'.format(name, filename)))
+
+    def write_collapsed(self, stream, metric='time'):
+        """Write the stacks in the collapsed format read by flame graph tools
+
+        Each line is a stack of ``function (file:line)`` labels, separated
+        by semicolons, and its count: the time in microseconds, or the
+        number of dicts or resources.
+
+        Args:
+            stream: The file object to write to
+            metric: What to count, one of :data:`METRICS`
+
+        """
+        if metric not in METRICS:
+            raise ValueError('Stacks can be written with one of {0}, not {1!r}'.format(
+                ', '.join(METRICS), metric))
+        counts = getattr(self, metric)
+        for stack in sorted(counts):
+            count = counts[stack]
+            if metric == 'time':
+                count = int(round(count * 1000000))
+            if count:
+                stream.write('{0} {1}\n'.format(
+                    ';'.join('{0} ({1}:{2})'.format(*label) for label in stack), count))
+
+
+def _display_path(filename):
+    # Paths under the working directory are shown relative to it
+    path = os.path.abspath(filename)
+    cwd = os.getcwd()
+    if path.startswith(cwd + os.sep):
+        return os.path.relpath(path, cwd)
+    return filename
+
@@ -0,0 +1,511 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Typed resource classes, generated from the CloudFormation resource specification
+
+:func:`write_package` turns a :class:`ResourceSpec <cfn_pyplates.spec.ResourceSpec>`
+into a python package with a class for each resource type, and for each
+property type, with a module for each service namespace. Put the package
+somewhere a pyplate can import it from (next to the pyplate will do)::
+
+    cfn_py_resources CloudFormationResourceSpecification.json resources
+
+and a pyplate can use its classes in place of :class:`Resource
+<cfn_pyplates.core.Resource>`::
+
+    from resources import EC2
+
+    cft.resources.add(EC2.Instance('Web', ImageId=ref('ImageId'), InstanceType='t2.micro',
+        BlockDeviceMappings=[EC2.Instance.BlockDeviceMapping(DeviceName='/dev/sdb')]))
+
+Properties are checked as they're set, whether as keyword arguments, by
+key, or as attributes (``web.InstanceType = 't2.micro'``), and a property
+that isn't in the specification, or a value of the wrong type, raises
+:exc:`SpecificationError <cfn_pyplates.exceptions.SpecificationError>`
+straight away, from the line that set it. Values are checked the same way
+as by :meth:`ResourceSpec.check <cfn_pyplates.spec.ResourceSpec.check>`, so
+intrinsic functions can go anywhere. Required properties can't be checked
+until the template is finished; use ``--spec`` for those.
+
+AWS namespaces are attributes of the package by service name (``EC2``),
+and other vendors' by vendor and service (``Alexa_ASK``). Each namespace's
+module is only imported when it's first used, so a pyplate only loads the
+classes it uses, rather than every resource type there is.
+
+Property types, like ``EC2.Instance.BlockDeviceMapping``, are attributes of
+the resource types that use them. Property types are often named after the
+property they're for, like ``EC2.Instance.CpuOptions``; on a resource, rather
+than its type, such a name is the property. They're dicts that only allow their own
+properties as keys or attributes, and have no ``__dict__`` of their own (so
+they take no more memory than a plain dict), which makes them usable
+anywhere a dict is.
+
+"""
+import keyword
+import os
+import re
+import sys
+import types
+
+from cfn_pyplates import core, exceptions, spec
+
+# The definitions of the property types in the modules loaded so far, by name,
+# for checking values that are dicts of their properties
+_property_types = {}
+_checker = spec.ResourceSpec({}, _property_types)
+
+# Namespaces other than AWS's are named by vendor and service
+_AWS_PREFIX = 'AWS::'
+
+# Names in the specification that aren't python identifiers have these replaced
+_not_identifier = re.compile(r'\W')
+
+
+class TypedProperties(core.Properties):
+    """The properties of a typed resource, which are checked as they're set
+
+    Args:
+        update_dict: A dictionary of properties for prepopulating the properties
+        resource: The :class:`TypedResource` class the properties belong to
+
+    Properties can be set and gotten as attributes, as well as by key.
+    Attributes starting with a capital letter, like property names do, are
+    always taken to be properties, so that typos are caught.
+
+    """
+    def __init__(self, update_dict=None, resource=None):
+        # Set before the properties themselves, which are checked against it
+        self.__dict__['_resource'] = resource
+        super(TypedProperties, self).__init__(update_dict, 'Properties')
+
+    def __setitem__(self, key, value, *args, **kwargs):
+        resource = self.__dict__.get('_resource')
+        # Unpickling sets the items before the resource class
+        if resource is not None:
+            _check(resource.resource_type, resource._properties, key, value)
+        super(TypedProperties, self).__setitem__(key, value, *args, **kwargs)
+
+    def __getattr__(self, name):
+        resource = self.__dict__.get('_resource')
+        if resource is not None and name in resource._properties:
+            try:
+                return self[name]
+            except KeyError:
+                pass
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_resource') is not None and _is_property_name(name):
+            self[name] = value
+        else:
+            super(TypedProperties, self).__setattr__(name, value)
+
+
+class TypedResource(core.Resource):
+    """A resource of one type, as generated by :func:`write_package`
+
+    Args:
+        name: The unique name of the resource to add
+        properties: Optional properties mapping to apply to this resource
+        attributes: Optional (one of 'Condition', 'DependsOn', 'DeletionPolicy',
+            'Metadata', 'UpdatePolicy' or a list of 2 or more)
+        kwargs: Properties to apply to this resource, by name. They're
+            added after ``properties``, in alphabetical order.
+
+    Raises:
+        SpecificationError: :exc:`cfn_pyplates.exceptions.SpecificationError`,
+        if a property isn't one of the resource type's, or its value is of
+        the wrong type
+
+    The resource's properties are :class:`TypedProperties`, and can also be
+    set and gotten as attributes of the resource, in the same way.
+
+    """
+    # The resource type, and its properties' (container, item) value types
+    # and required properties, as kept by ResourceSpec
+    resource_type = None
+    _properties = {}
+    _required = ()
+
+    def __init__(self, name, properties=None, attributes=[], **kwargs):
+        typed_properties = TypedProperties(properties, type(self))
+        for key in sorted(kwargs):
+            typed_properties[key] = kwargs[key]
+        super(TypedResource, self).__init__(name, self.resource_type, typed_properties,
+            attributes)
+
+    @classmethod
+    def from_rows(cls, rows, name_fn, properties_fn=None, attributes=[]):
+        """Make a resource of this type from each row of some data
+
+        Takes the same arguments as :meth:`Resource.from_rows
+        <cfn_pyplates.core.Resource.from_rows>`, apart from the type. Each
+        row's properties are checked like any others.
+
+        """
+        return [cls(name, properties, attributes)
+            for name, properties in core._check_rows(rows, name_fn, properties_fn)]
+
+    def __setitem__(self, key, value, *args, **kwargs):
+        if key == 'Properties' and not isinstance(value, TypedProperties):
+            value = TypedProperties(value, type(self))
+        super(TypedResource, self).__setitem__(key, value, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if name in type(self)._properties:
+            properties = self.get('Properties')
+            if properties is not None and name in properties:
+                return properties[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if not _is_property_name(name):
+            return super(TypedResource, self).__setattr__(name, value)
+        self._set_property(name, value)
+
+    def _set_property(self, name, value):
+        properties = self.get('Properties')
+        if properties is None:
+            self.add(TypedProperties({name: value}, type(self)))
+        else:
+            properties[name] = value
+
+
+class NestedPropertyType(object):
+    """A property type, as an attribute of a resource type that uses it
+
+    Args:
+        name: The attribute's name
+        cls: The :class:`PropertyType` class
+
+    Gotten from the resource type, it's the property type. Gotten or set on a
+    resource, it's the property of the same name, if the resource type has one.
+
+    """
+    def __init__(self, name, cls):
+        self.name = name
+        self.cls = cls
+
+    def __get__(self, resource, resource_class):
+        if resource is None or self.name not in resource_class._properties:
+            return self.cls
+        return resource.__getattr__(self.name)
+
+    def __set__(self, resource, value):
+        resource._set_property(self.name, value)
+
+
+class PropertyType(dict):
+    """A property type's properties, which are checked as they're set
+
+    Takes the same arguments as :class:`dict`. Properties can be set and
+    gotten as attributes, as well as by key, but nothing else can be set.
+
+    Raises:
+        SpecificationError: :exc:`cfn_pyplates.exceptions.SpecificationError`,
+        if a property isn't one of the property type's, or its value is of
+        the wrong type
+
+    """
+    __slots__ = ()
+    # The property type's full name, and its properties like TypedResource's
+    type_name = None
+    _properties = {}
+    _required = ()
+
+    def __init__(self, *args, **kwargs):
+        super(PropertyType, self).__init__()
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        _check(self.type_name, self._properties, key, value)
+        super(PropertyType, self).__setitem__(key, value)
+
+    def update(self, *args, **kwargs):
+        # dict's own update and setdefault skip __setitem__
+        for key, value in dict(*args, **kwargs).iteritems():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __getattr__(self, name):
+        if name in self._properties:
+            try:
+                return self[name]
+            except KeyError:
+                pass
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return '{0}({1})'.format(type(self).__name__, super(PropertyType, self).__repr__())
+
+
+def property_type(cls):
+    """Class decorator for generated :class:`PropertyType` classes
+
+    Makes the property type known, so that dicts given as its values are
+    checked too.
+
+    """
+    _property_types[cls.type_name] = (cls._properties, cls._required)
+    return cls
+
+
+def _is_property_name(name):
+    # Property names are capitalized, unlike python attributes
+    return name[:1].isupper()
+
+
+def _check(type_name, properties, key, value):
+    # Check a property as it's set
+    value_type = properties.get(key)
+    if value_type is None:
+        found = [spec.SpecProblem((key,), 'isn\'t a property of {0}{1}'.format(
+            type_name, spec._suggest(key, properties)))]
+    else:
+        found = []
+        _checker._check_value(value, value_type, (key,), found)
+    if found:
+        error = exceptions.SpecificationError('; '.join('{0} {1}'.format(
+            spec._format_path(problem.path), problem.message) for problem in found))
+        error.problems = found
+        raise error
+
+
+class LazyPackage(types.ModuleType):
+    """A generated package that imports each namespace's module when it's first used
+
+    Args:
+        module: The package's module, whose contents it takes over
+        namespaces: A mapping of each namespace's attribute name to its module's name
+
+    """
+    def __init__(self, module, namespaces):
+        super(LazyPackage, self).__init__(module.__name__, module.__doc__)
+        self.__dict__.update(vars(module))
+        self.__dict__['_namespaces'] = namespaces
+        self.__dict__['__all__'] = sorted(namespaces)
+
+    def __getattr__(self, name):
+        module_name = self._namespaces.get(name)
+        if module_name is None:
+            raise AttributeError('\'module\' object has no attribute {0!r}'.format(name))
+        full_name = '{0}.{1}'.format(self.__name__, module_name)
+        __import__(full_name)
+        module = sys.modules[full_name]
+        setattr(self, name, module)
+        return module
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._namespaces))
+
+
+def lazy_package(name, namespaces):
+    """Make a generated package load its namespaces lazily
+
+    Called by the package's ``__init__`` with its own name, replacing itself
+    in :data:`sys.modules` with a :class:`LazyPackage`.
+
+    Args:
+        name: The package's name
+        namespaces: A mapping of each namespace's attribute name to its module's name
+
+    Returns the :class:`LazyPackage`
+
+    """
+    package = sys.modules[name] = LazyPackage(sys.modules[name], namespaces)
+    return package
+
+
+def write_package(resource_spec, directory):
+    """Write a package of typed resource classes for a resource specification
+
+    Args:
+        resource_spec: A :class:`cfn_pyplates.spec.ResourceSpec`
+        directory: The package's directory, which is made if need be. The
+            package is named after it.
+
+    Returns a list of the paths of the modules written
+
+    """
+    namespaces = {}
+    for name in resource_spec.resource_types:
+        namespace, _ = name.rsplit('::', 1)
+        namespaces.setdefault(namespace, ([], []))[0].append(name)
+    common = []
+    for name in resource_spec.property_types:
+        if resource_spec.property_types[name][0] is None:
+            # Property types without properties of their own can be anything
+            continue
+        if '.' in name:
+            namespace, _ = name.split('.', 1)[0].rsplit('::', 1)
+            namespaces.setdefault(namespace, ([], []))[1].append(name)
+        else:
+            common.append(name)
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    header = _header(resource_spec)
+    written = []
+
+    def write(module_name, source):
+        path = os.path.join(directory, module_name + '.py')
+        with open(path, 'w') as module_file:
+            module_file.write(header + source)
+        written.append(path)
+
+    write('common', _common_source(resource_spec, sorted(common)))
+    attributes = {}
+    for namespace, (resource_types, property_types) in sorted(namespaces.iteritems()):
+        module_name = _identifier(namespace.replace('::', '_').lower())
+        if namespace.startswith(_AWS_PREFIX):
+            attributes[_identifier(namespace[len(_AWS_PREFIX):])] = module_name
+        else:
+            attributes[_identifier(namespace.replace('::', '_'))] = module_name
+        write(module_name, _namespace_source(resource_spec, namespace, sorted(resource_types),
+            sorted(property_types), frozenset(common)))
+    write('__init__', _package_source(resource_spec, attributes))
+    return written
+
+
+def _header(resource_spec):
+    return ('# Generated by cfn_pyplates.typed from version {0} of the CloudFormation\n'
+        '# resource specification, don\'t edit it; generate it again instead.\n'.format(
+            resource_spec.version or 'unknown'))
+
+
+def _package_source(resource_spec, attributes):
+    lines = [
+        '"""Typed resource classes for the CloudFormation resource specification',
+        '',
+        'See cfn_pyplates.typed. Each namespace is imported when it\'s first used.',
+        '',
+        '"""',
+        'from __future__ import absolute_import',
+        '',
+        'from cfn_pyplates import typed',
+        '',
+        'typed.lazy_package(__name__, {',
+    ]
+    for attribute, module_name in sorted(attributes.iteritems()):
+        lines.append('    {0!r}: {1!r},'.format(attribute, module_name))
+    lines.append('})')
+    return '\n'.join(lines) + '\n'
+
+
+def _common_source(resource_spec, names):
+    lines = ['"""Property types shared by every namespace"""',
+        'from __future__ import absolute_import', '', 'from cfn_pyplates import typed']
+    for name in names:
+        lines.extend(_property_type_source(resource_spec, name, _identifier(name)))
+    return '\n'.join(lines) + '\n'
+
+
+def _namespace_source(resource_spec, namespace, resource_types, property_types, common):
+    lines = ['"""{0} resource types"""'.format(namespace),
+        'from __future__ import absolute_import', '', 'from cfn_pyplates import typed',
+        '', 'from . import common  # NOQA']
+    # Property types are defined before the resource types they belong to,
+    # as Resource_PropertyType, and are attributes of those resource types
+    nested = {}
+    for name in property_types:
+        resource_type, short_name = name.split('.', 1)
+        class_name = _identifier('{0}_{1}'.format(resource_type.rsplit('::', 1)[1],
+            short_name))
+        nested.setdefault(resource_type, []).append((_identifier(short_name), class_name))
+        lines.extend(_property_type_source(resource_spec, name, class_name))
+
+    for name in resource_types:
+        properties, required, _ = resource_spec.resource_types[name]
+        # Resource types without properties can't have any
+        properties = properties or {}
+        lines.extend(['', '', 'class {0}(typed.TypedResource):'.format(
+            _identifier(name.rsplit('::', 1)[1]))])
+        lines.extend(_docstring(name, properties, required))
+        lines.append('    resource_type = {0!r}'.format(name))
+        lines.extend(_properties_source(properties, required))
+        attributes = dict(nested.get(name, ()))
+        for short_name in _used_common(resource_spec, name, properties, common):
+            attributes.setdefault(_identifier(short_name), 'common.' + _identifier(short_name))
+        for attribute, class_name in sorted(attributes.iteritems()):
+            lines.append('    {0} = typed.NestedPropertyType({0!r}, {1})'.format(attribute,
+                class_name))
+    return '\n'.join(lines) + '\n'
+
+
+def _property_type_source(resource_spec, name, class_name):
+    properties, required = resource_spec.property_types[name]
+    lines = ['', '', '@typed.property_type', 'class {0}(typed.PropertyType):'.format(class_name)]
+    lines.extend(_docstring(name, properties, required))
+    lines.extend(['    __slots__ = ()', '    type_name = {0!r}'.format(name)])
+    lines.extend(_properties_source(properties, required))
+    return lines
+
+
+def _docstring(name, properties, required):
+    lines = ['    """{0}'.format(name), '']
+    for property_name in sorted(properties):
+        container, item = properties[property_name]
+        description = (item or 'anything').rsplit('.', 1)[-1]
+        if container is not None:
+            description = '{0} of {1}'.format(container, description)
+        if property_name in required:
+            description += ', required'
+        lines.append('    - {0}: {1}'.format(property_name, description))
+    lines.extend(['', '    """'])
+    return lines
+
+
+def _properties_source(properties, required):
+    lines = ['    _properties = {']
+    for property_name in sorted(properties):
+        lines.append('        {0!r}: {1!r},'.format(property_name, properties[property_name]))
+    lines.extend(['    }', '    _required = {0!r}'.format(tuple(required))])
+    return lines
+
+
+def _used_common(resource_spec, resource_type, properties, common):
+    # The shared property types a resource type's properties use, directly
+    # or through its own property types
+    used = set()
+    pending = [properties]
+    seen = set()
+    while pending:
+        for _, item in pending.pop().itervalues():
+            if item in common:
+                used.add(item)
+            elif item is not None and item.startswith(resource_type + '.') and item not in seen:
+                seen.add(item)
+                definition = resource_spec.property_types.get(item)
+                if definition is not None and definition[0] is not None:
+                    pending.append(definition[0])
+    return sorted(used)
+
+
+def _identifier(name):
+    # A python identifier for a name in the specification
+    name = _not_identifier.sub('_', name)
+    if not name or name[0].isdigit() or keyword.iskeyword(name):
+        name = '_' + name
+    return name
@@ -0,0 +1,345 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+"""Regenerate templates as their pyplates change
+
+A :class:`Watch` generates a set of jobs (the same job dicts used by
+:mod:`cfn_pyplates.batch`) once, then keeps the process running and watches
+every file those jobs depend on: the pyplates, their options files, and the
+python modules they import, such as a base template module added to
+``sys.path`` by the pyplate.
+
+When files change, only the jobs that depend on them are regenerated. Changed
+modules, and any loaded modules that use them, are dropped from
+``sys.modules`` so that the pyplate picks up the new code when it imports
+them again; every other module stays loaded.
+
+Changes are picked up with inotify on Linux, and by polling elsewhere. Bursts
+of changes, like an editor saving several files at once, are gathered up and
+handled together. A file changed while a job that reads it is being
+generated is noticed too, since files are compared with how they were when
+the job read them.
+
+Each job is run in the directory and with the ``sys.path`` the watch had
+before it, whatever the previous job changed.
+
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+import traceback
+
+from cfn_pyplates import batch, cache, core, spec
+
+
+class PollingWatcher(object):
+    """Watch files for changes by checking their stat info at an interval
+
+    Args:
+        interval: Seconds between checks
+
+    """
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._stats = {}
+
+    def watch(self, paths):
+        'Set the paths to watch, replacing any paths watched before'
+        self._stats = dict((path, _stat(path)) for path in paths)
+
+    def wait(self, timeout=None):
+        """Wait for watched files to change
+
+        Args:
+            timeout: The most seconds to wait, or None to wait indefinitely
+
+        Returns the set of changed paths, empty if the timeout ran out first
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            changed = set()
+            for path, stat in self._stats.items():
+                current = _stat(path)
+                if current != stat:
+                    self._stats[path] = current
+                    changed.add(path)
+            if changed:
+                return changed
+
+            if deadline is None:
+                time.sleep(self.interval)
+            elif time.time() >= deadline:
+                return changed
+            else:
+                time.sleep(min(self.interval, deadline - time.time()))
+
+    def close(self):
+        pass
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size, stat.st_ino
+
+
+class InotifyWatcher(object):
+    """Watch files for changes with Linux's inotify
+
+    Directories are watched rather than the files in them, so that files
+    replaced by editors that save to a temp file and rename it into place
+    are still noticed.
+
+    Raises:
+        OSError: inotify isn't available
+
+    """
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    # IN_CREATE | IN_DELETE
+    _mask = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+    _event = struct.Struct('iIII')
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError(errno.ENOSYS, 'libc not found')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        try:
+            self._libc.inotify_init
+        except AttributeError:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        self._fd = self._libc.inotify_init()
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        self._paths = set()
+        self._directories = {}
+
+    def watch(self, paths):
+        'Set the paths to watch, replacing any paths watched before'
+        self._paths = set(paths)
+        directories = set(os.path.dirname(path) for path in self._paths)
+
+        for wd, directory in self._directories.items():
+            if directory not in directories:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._directories[wd]
+
+        for directory in directories - set(self._directories.values()):
+            wd = self._libc.inotify_add_watch(self._fd, directory, self._mask)
+            if wd >= 0:
+                self._directories[wd] = directory
+
+    def wait(self, timeout=None):
+        """Wait for watched files to change
+
+        Args:
+            timeout: The most seconds to wait, or None to wait indefinitely
+
+        Returns the set of changed paths, empty if the timeout ran out first
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return set()
+
+            changed = set(path for path in self._read_events() if path in self._paths)
+            if changed:
+                return changed
+
+    def _read_events(self):
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self._event.unpack_from(data, offset)
+            offset += self._event.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            if wd in self._directories and name:
+                yield os.path.join(self._directories[wd], name)
+
+    def close(self):
+        os.close(self._fd)
+
+
+def make_watcher():
+    'Make an InotifyWatcher if inotify is available, otherwise a PollingWatcher'
+    try:
+        return InotifyWatcher()
+    except OSError:
+        return PollingWatcher()
+
+
+class Watch(object):
+    """Keep a set of jobs' templates up to date with their pyplates
+
+    Args:
+        jobs: A list of job dicts, as described in :mod:`cfn_pyplates.batch`
+        watcher: A watcher to use, defaults to the result of :func:`make_watcher`
+        debounce: Seconds to wait for more changes after a change is seen,
+            before regenerating anything
+
+    """
+    def __init__(self, jobs, watcher=None, debounce=0.2):
+        self.jobs = jobs
+        self.watcher = watcher or make_watcher()
+        self.debounce = debounce
+        self.dependencies = {}
+        # The stat info of each job's dependencies from when the job read
+        # them, by the job's id
+        self.stats = {}
+
+    def run(self):
+        'Generate every job, then regenerate jobs as they change, until interrupted'
+        self.generate(self.jobs)
+        try:
+            while True:
+                self.update(self.wait())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.watcher.close()
+
+    def wait(self):
+        'Wait for watched files to change, returning the changed paths'
+        self.watcher.watch(set().union(*self.dependencies.values()))
+        # Files changed since their jobs read them, before they were watched
+        changed = set(path for stats in self.stats.values()
+            for path, stat in stats.iteritems() if _stat(path) != stat)
+        if not changed:
+            changed = self.watcher.wait()
+        # Keep gathering changes until things settle down
+        while True:
+            more = self.watcher.wait(self.debounce)
+            if not more:
+                return changed
+            changed |= more
+
+    def update(self, changed):
+        """Regenerate the jobs affected by a set of changed paths
+
+        Returns the list of regenerated jobs
+
+        """
+        changed = set(os.path.abspath(path) for path in changed)
+        _drop_stale_modules(changed, set().union(*self.dependencies.values()))
+
+        affected = [
+            job for job in self.jobs
+            if self.dependencies.get(id(job), set()) & changed
+        ]
+        self.generate(affected)
+        return affected
+
+    def generate(self, jobs):
+        'Generate some jobs, reporting and recording the dependencies of each'
+        for job in jobs:
+            result, dependencies, stats = self._generate_job(job)
+            batch.report_result(result)
+            self.dependencies[id(job)] = dependencies
+            self.stats[id(job)] = stats
+
+    def _generate_job(self, job):
+        # Like batch.run_job, but always runs the pyplate (no output cache)
+        # so that the modules it depends on can be found. Returns the result,
+        # the job's dependencies, and their stat info from before they were
+        # read.
+        start = time.time()
+        # The pyplate and its options are always dependencies, even if
+        # generation fails, so that fixing them triggers a retry
+        dependencies = set([os.path.abspath(job['pyplate'])])
+        dependencies.update(os.path.abspath(path) for path in batch.job_options_files(job))
+        if job.get('spec'):
+            dependencies.add(os.path.abspath(job['spec']))
+        stats = dict((path, _stat(path))
+            for path in dependencies | self.dependencies.get(id(job), set()))
+        cwd = os.getcwd()
+        sys_path = list(sys.path)
+        try:
+            options = batch.load_job_options(job)
+            modules = set(sys.modules)
+            with open(job['pyplate']) as pyplate:
+                namespace = core._load_pyplate(pyplate, options, job.get('cache', True))
+            # Modules new to the job were imported just now, so they're as read
+            for path in core._pyplate_dependencies(namespace, modules):
+                dependencies.add(path)
+                if path not in stats:
+                    stats[path] = _stat(path)
+            cft = core._find_cloudformationtemplate(namespace)
+            if job.get('check_refs'):
+                core.check_references(cft)
+            if job.get('spec'):
+                spec.ResourceSpec.load(job['spec']).check(cft)
+            formatting = core.json_options(job.get('minify', False), job.get('sort_keys', False))
+
+            def write(outfile):
+                cft.write_json(outfile, **formatting)
+                return True
+            cache.write_if_changed(job['outfile'], write)
+        except Exception:
+            error = traceback.format_exc()
+            result = batch.JobResult(job, False, time.time() - start, error)
+        else:
+            result = batch.JobResult(job, True, time.time() - start, None)
+        finally:
+            # Leave the directory and sys.path as they were for the next job
+            os.chdir(cwd)
+            sys.path[:] = sys_path
+
+        stats = dict((path, stat) for path, stat in stats.iteritems() if path in dependencies)
+        return result, dependencies, stats
+
+
+def _drop_stale_modules(changed, dependencies):
+    """Remove modules from sys.modules whose source changed
+
+    Modules that use a stale module are stale too, since they hold references
+    to its old classes and functions, so they're removed as well. Only modules
+    whose source is in dependencies are ever removed, and modules that are part
+    of python or installed into site-packages are never touched.
+
+    Returns the names of the removed modules
+
+    """
+    sources = {}
+    users = {}
+    for name, module in sys.modules.items():
+        path = core._module_source(module) if module is not None else None
+        if path is None or path not in dependencies or core._is_installed(path):
+            continue
+        sources[name] = path
+        for used in core._used_modules(module):
+            if used is not None:
+                users.setdefault(used.__name__, set()).add(name)
+
+    stale = set(name for name, path in sources.items() if path in changed)
+    pending = list(stale)
+    while pending:
+        for name in users.get(pending.pop(), ()):
+            if name not in stale:
+                stale.add(name)
+                pending.append(name)
+
+    for name in stale:
+        del sys.modules[name]
+    return stale
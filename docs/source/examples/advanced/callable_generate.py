@@ -10,3 +10,8 @@ generate_pyplate('/path/to/project.py')
 # CloudFormationTemplate, generating its JSON template is as easy as
 # casting it as a string (or unicode) object:
 print str(my_cloud_formation_template_instance)
+
+# Large templates can be streamed straight into a file object, rather than
+# being built up in memory as one big string first
+with open('/path/to/project.json', 'w') as outfile:
+    generate_pyplate('/path/to/project.py', outfile=outfile)
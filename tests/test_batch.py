@@ -0,0 +1,100 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from textwrap import dedent
+
+import mock
+
+from cfn_pyplates import batch, exceptions, timing
+
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        environ_patcher = mock.patch.dict('os.environ',
+            {'CFN_PYPLATES_CACHE_DIR': os.path.join(self.workdir, 'cache')})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+
+    def _write(self, name, contents):
+        with open(os.path.join(self.workdir, name), 'w') as f:
+            f.write(dedent(contents))
+
+    def _make_manifest(self, count):
+        # Each job gets its own pyplate, reading its description from options
+        self._write('pyplate.py', u'''\
+        cft = CloudFormationTemplate(options['Description'])
+        ''')
+        manifest = []
+        for i in range(count):
+            self._write('options{0}.yaml'.format(i), 'Description: Stack {0}\n'.format(i))
+            manifest.append({
+                'pyplate': 'pyplate.py',
+                'options': 'options{0}.yaml'.format(i),
+                'outfile': 'out{0}.json'.format(i),
+            })
+        self._write('manifest.yaml', json.dumps(manifest))
+        return os.path.join(self.workdir, 'manifest.yaml')
+
+    def _load_output(self, i):
+        with open(os.path.join(self.workdir, 'out{0}.json'.format(i))) as f:
+            return json.load(f)
+
+    def test_load_manifest_resolves_paths(self):
+        manifest = self._make_manifest(1)
+        jobs = batch.load_manifest(manifest)
+        self.assertEqual(jobs[0]['pyplate'], os.path.join(self.workdir, 'pyplate.py'))
+        self.assertEqual(jobs[0]['outfile'], os.path.join(self.workdir, 'out0.json'))
+
+    def test_load_manifest_bad_entry(self):
+        self._write('manifest.yaml', '- pyplate: pyplate.py\n')
+        with self.assertRaises(exceptions.ManifestError):
+            batch.load_manifest(os.path.join(self.workdir, 'manifest.yaml'))
+
+    def test_run_batch_serial(self):
+        jobs = batch.load_manifest(self._make_manifest(3))
+        results = list(batch.run_batch(jobs, processes=1))
+        self.assertTrue(all(result.ok for result in results))
+        for i in range(3):
+            self.assertEqual(self._load_output(i)['Description'], 'Stack {0}'.format(i))
+
+    def test_run_batch_pool(self):
+        jobs = batch.load_manifest(self._make_manifest(4))
+        results = list(batch.run_batch(jobs, processes=2))
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result.ok for result in results))
+        for i in range(4):
+            self.assertEqual(self._load_output(i)['Description'], 'Stack {0}'.format(i))
+
+    def test_run_job_failure(self):
+        self._write('broken.py', 'I am a broken pyplate.\n')
+        job = {
+            'pyplate': os.path.join(self.workdir, 'broken.py'),
+            'outfile': os.path.join(self.workdir, 'broken.json'),
+        }
+        result = batch.run_job(job)
+        self.assertFalse(result.ok)
+        self.assertIn('SyntaxError', result.error)
+
+    def test_generate_batch_profile(self):
+        profile = timing.Profile()
+        failures = batch.generate_batch(self._make_manifest(2), processes=1, profile=profile)
+        self.assertEqual(failures, 0)
+        self.assertEqual(profile.phases['options']['calls'], 2)
+        self.assertEqual(profile.phases['run']['calls'], 2)
+        self.assertEqual(sorted(job['outfile'] for job in profile.jobs),
+            [os.path.join(self.workdir, 'out{0}.json'.format(i)) for i in range(2)])
@@ -0,0 +1,206 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from textwrap import dedent
+
+import mock
+
+from cfn_pyplates import cache, core
+from cfn_pyplates.options import OptionsMapping
+
+
+class BytecodeCacheTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.path = os.path.join(self.workdir, 'pyplate.py')
+        self._write_pyplate('value = 1\n')
+
+    def _write_pyplate(self, contents):
+        with open(self.path, 'w') as f:
+            f.write(contents)
+
+    def _compile(self, use_cache=True):
+        with open(self.path) as pyplate:
+            return cache.compile_pyplate(pyplate, use_cache)
+
+    def _run(self, code):
+        namespace = {}
+        exec code in namespace
+        return namespace['value']
+
+    def test_bytecode_written(self):
+        self._run(self._compile())
+        cache_path = cache.bytecode_path(self.path)
+        self.assertEqual(os.path.dirname(cache_path), os.path.join(self.workdir, '__pycache__'))
+        self.assertTrue(os.path.exists(cache_path))
+
+    def test_bytecode_not_written(self):
+        self.assertEqual(self._run(self._compile(use_cache=False)), 1)
+        self.assertFalse(os.path.exists(cache.bytecode_path(self.path)))
+
+    def test_bytecode_reused(self):
+        self._compile()
+        # A warm cache means the pyplate isn't compiled again
+        with mock.patch('cfn_pyplates.cache.compile', create=True) as compile:
+            self.assertEqual(self._run(self._compile()), 1)
+        self.assertFalse(compile.called)
+
+    def test_bytecode_touched(self):
+        self._compile()
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        # The mtime changed but the source didn't, so the cached code is still good
+        with mock.patch('cfn_pyplates.cache.compile', create=True) as compile:
+            self.assertEqual(self._run(self._compile()), 1)
+        self.assertFalse(compile.called)
+
+    def test_bytecode_invalidated(self):
+        self._compile()
+        self._write_pyplate('value = 22\n')
+        self.assertEqual(self._run(self._compile()), 22)
+
+    def test_bytecode_corrupt(self):
+        self._compile()
+        with open(cache.bytecode_path(self.path), 'wb') as cache_file:
+            cache_file.write('garbage')
+        self.assertEqual(self._run(self._compile()), 1)
+
+
+class OutputCacheTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.output_cache = cache.OutputCache(os.path.join(self.workdir, 'cache'))
+        self.path = os.path.join(self.workdir, 'pyplate.py')
+        with open(self.path, 'w') as f:
+            f.write(dedent('''\
+            cft = CloudFormationTemplate(options['Description'])
+            '''))
+
+    def _key(self, options):
+        with open(self.path) as pyplate:
+            return self.output_cache.key(pyplate, options)
+
+    def _store(self, key, contents, dependencies=()):
+        with self.output_cache.store(key, dependencies) as cache_file:
+            cache_file.write(contents)
+
+    def test_key(self):
+        key = self._key({'Description': 'One'})
+        self.assertEqual(key, self._key({'Description': 'One'}))
+        self.assertNotEqual(key, self._key({'Description': 'Two'}))
+
+    def test_get_store(self):
+        key = self._key({})
+        self.assertIsNone(self.output_cache.get(key))
+        self._store(key, 'cached')
+        with open(self.output_cache.get(key)) as cached:
+            self.assertEqual(cached.read(), 'cached')
+
+    def test_store_failure(self):
+        key = self._key({})
+        with self.assertRaises(ValueError):
+            with self.output_cache.store(key) as cache_file:
+                cache_file.write('half a templ')
+                raise ValueError
+        self.assertIsNone(self.output_cache.get(key))
+        self.assertEqual(os.listdir(self.output_cache.directory), [])
+
+    def test_dependency_changed(self):
+        key = self._key({})
+        self._store(key, 'cached', [self.path])
+        self.assertIsNotNone(self.output_cache.get(key))
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertIsNone(self.output_cache.get(key))
+
+    def test_evict_lru(self):
+        self.output_cache.max_entries = 2
+        keys = [self._key({'Description': str(i)}) for i in range(3)]
+        self._store(keys[0], 'first')
+        self._store(keys[1], 'second')
+        # Make the first entry the most recently used one
+        entry = self.output_cache.get(keys[1])
+        os.utime(entry, (time.time() - 10, time.time() - 10))
+        self.output_cache.get(keys[0])
+        self._store(keys[2], 'third')
+
+        self.assertIsNotNone(self.output_cache.get(keys[0]))
+        self.assertIsNone(self.output_cache.get(keys[1]))
+        self.assertIsNotNone(self.output_cache.get(keys[2]))
+
+    def test_evict_size(self):
+        self.output_cache.max_size = 10
+        self._store(self._key({}), 'x' * 11)
+        self.assertEqual(os.listdir(self.output_cache.directory), [])
+
+    def test_generate_hit(self):
+        options = {'Description': 'Cached'}
+        output = core.generate_pyplate(self.path, options, output_cache=self.output_cache)
+        with mock.patch('cfn_pyplates.core._load_pyplate') as load_pyplate:
+            cached_output = core.generate_pyplate(self.path, options,
+                output_cache=self.output_cache)
+        self.assertFalse(load_pyplate.called)
+        self.assertEqual(output, cached_output)
+
+    def test_generate_prompted(self):
+        # Output generated with prompted options isn't cached
+        options = OptionsMapping()
+        options.interactive = True
+        with mock.patch('__builtin__.raw_input', return_value='Prompted'):
+            core.generate_pyplate(self.path, options, output_cache=self.output_cache)
+        self.assertIsNone(self.output_cache.get(self._key({})))
+        self.assertIsNone(self.output_cache.get(self._key(options)))
+
+
+class WriteIfChangedTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.path = os.path.join(self.workdir, 'out.json')
+
+    def _write(self, contents):
+        def write(f):
+            f.write(contents)
+            return True
+        return cache.write_if_changed(self.path, write)
+
+    def test_new_file(self):
+        self.assertTrue(self._write('new'))
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'new')
+        self.assertEqual(os.listdir(self.workdir), ['out.json'])
+
+    def test_unchanged_file(self):
+        self._write('same')
+        os.chmod(self.path, 0640)
+        os.utime(self.path, (0, 0))
+        self._write('same')
+        self.assertEqual(os.stat(self.path).st_mtime, 0)
+
+        # A changed file is rewritten in place, keeping its permissions
+        inode = os.stat(self.path).st_ino
+        self._write('different')
+        self.assertNotEqual(os.stat(self.path).st_mtime, 0)
+        self.assertEqual(os.stat(self.path).st_mode & 0777, 0640)
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+
+    def test_failed_write(self):
+        self._write('original')
+        cache.write_if_changed(self.path, lambda f: f.write('broken') and None)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'original')
@@ -10,16 +10,23 @@
 # The above copyright notice and this permission notice shall be included in
 # all copies or substantial portions of the Software.
 
+from collections import OrderedDict
 from cStringIO import StringIO
 from textwrap import dedent
 from tempfile import NamedTemporaryFile
 import json
+import os
+import shutil
+import subprocess
 import sys
+import tempfile
+import threading
 import unittest
 
 import mock
 
-from cfn_pyplates import cli
+import cfn_pyplates
+from cfn_pyplates import cli, core
 
 
 class CLITestCase(unittest.TestCase):
@@ -38,6 +45,12 @@ class CLITestCase(unittest.TestCase):
         stdout_patcher = mock.patch('sys.stdout', new=StringIO())
         stdout_patcher.start()
         self.addCleanup(stdout_patcher.stop)
+        # Keep the output cache out of the user's cache dir
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        environ_patcher = mock.patch.dict('os.environ', {'CFN_PYPLATES_CACHE_DIR': cache_dir})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
 
     def _make_pyplate(self, contents):
         contents = dedent(contents)
@@ -57,6 +70,7 @@ class CLITestCase(unittest.TestCase):
                 )
         return out
 
+    @mock.patch('cfn_pyplates.options.OptionsMapping.interactive', True)
     @mock.patch('__builtin__.raw_input')
     def test_generate(self, raw_input):
         # Make a pyplate that uses the options mapping
@@ -106,6 +120,108 @@ class CLITestCase(unittest.TestCase):
         # If so, then prompts to populate missing options_mapping entries work
         self.assertEqual(template['Parameters']['DoesNotExist'], input_value)
 
+    def test_generate_missing_options(self):
+        # Without a terminal to prompt on, every missing option is reported
+        # in one run, even though a placeholder breaks the pyplate
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate(options['Description'])
+        cft.parameters.add(Parameter('Size', 'Number', {'Default': options['Size'] + 1}))
+        cft.parameters.add(Parameter('Name', 'String', {'Default': options['Name']}))
+        ''')
+        sys.argv = ['cfn_py_generate', pyplate.name]
+        out = self._generate(fail_on_error=False)
+        self.assertIn('2 options are missing from the options mapping:', out)
+        self.assertIn("line 1: cft = CloudFormationTemplate(options['Description'])", out)
+        self.assertIn('  Size\n', out)
+        self.assertNotIn('  Name\n', out)
+        self.assertIn('The pyplate then failed with TypeError', out)
+
+    def test_generate_profile(self):
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate(options['Description'])
+        ''')
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        profile_json = os.path.join(workdir, 'profile.json')
+        sys.argv = ['cfn_py_generate', pyplate.name, '-D', 'Description=Profiled',
+            '--profile-json', profile_json]
+        with mock.patch('sys.stderr', new=StringIO()) as stderr:
+            self._generate()
+        self.assertIn('Profiled', sys.stdout.getvalue())
+        self.assertTrue(stderr.getvalue().startswith('phase'))
+        with open(profile_json) as f:
+            phases = json.load(f)['phases']
+        self.assertIn('options', phases)
+        self.assertIn('run', phases)
+
+    def test_generate_trace(self):
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('Traced')
+        for i in range(3):
+            cft.resources.add(Resource('Topic%d' % i, 'AWS::SNS::Topic'))
+        ''')
+        stacks = NamedTemporaryFile()
+        sys.argv = ['cfn_py_generate', pyplate.name, '--trace', stacks.name,
+            '--trace-metric', 'resources']
+        with mock.patch('sys.stderr', new=StringIO()) as stderr:
+            self._generate()
+        self.assertIn('resources  line', stderr.getvalue())
+        self.assertEqual(stacks.read(), '<module> ({0}:3) 3\n'.format(pyplate.name))
+
+    def test_generate_memory_report(self):
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('Measured')
+        cft.resources.add(Resource('Topic', 'AWS::SNS::Topic'))
+        ''')
+        sys.argv = ['cfn_py_generate', pyplate.name, '--memory-report']
+        with mock.patch('sys.stderr', new=StringIO()) as stderr:
+            self._generate()
+        report = stderr.getvalue()
+        self.assertTrue(report.startswith('after'))
+        self.assertIn('\nResource ', report)
+        # The phase times are only reported when asked for
+        self.assertNotIn('calls', report)
+
+    def test_generate_spec(self):
+        spec_file = NamedTemporaryFile(suffix='.json')
+        json.dump({'ResourceTypes': {'AWS::SNS::Topic': {
+            'Properties': {'TopicName': {'PrimitiveType': 'String'}}}}}, spec_file)
+        spec_file.flush()
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('Checked')
+        cft.resources.add(Resource('Topic', 'AWS::SNS::Topic', {'TopicName': 'alerts'}))
+        ''')
+        sys.argv = ['cfn_py_generate', pyplate.name, '--spec', spec_file.name]
+        self.assertEqual(json.loads(self._generate())['Resources']['Topic']['Type'],
+            'AWS::SNS::Topic')
+
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('Checked')
+        cft.resources.add(Resource('Topic', 'AWS::SNS::Topic', {'TopicNam': 'alerts'}))
+        ''')
+        sys.argv = ['cfn_py_generate', pyplate.name, '--spec', spec_file.name]
+        sys.stdout.truncate(0)
+        out = self._generate(fail_on_error=False)
+        self.assertIn('SpecificationError: 1 problem(s) with resources:', out)
+        self.assertIn('Resources.Topic.Properties.TopicNam isn\'t a property of AWS::SNS::Topic '
+            '(did you mean TopicName?)', out)
+
+    @mock.patch('sys.stderr')
+    def test_resources(self, stderr):
+        spec_file = NamedTemporaryFile(suffix='.json')
+        json.dump({'ResourceTypes': {'AWS::SNS::Topic': {
+            'Properties': {'TopicName': {'PrimitiveType': 'String'}}}}}, spec_file)
+        spec_file.flush()
+        package = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, package)
+        sys.argv = ['cfn_py_resources', spec_file.name, package]
+        self.assertEqual(cli.resources(), 0)
+        self.assertEqual(sorted(os.listdir(package)), ['__init__.py', 'aws_sns.py', 'common.py'])
+
+        sys.argv = ['cfn_py_resources', spec_file.name + '.missing', package]
+        self.assertEqual(cli.resources(), 1)
+        self.assertIn('Could not load the resource specification', sys.stdout.getvalue())
+
     def test_generate_no_options_no_outfile(self):
         # generate with no options mapping to stdout
         description = 'This is a test.'
@@ -148,6 +264,167 @@ class CLITestCase(unittest.TestCase):
         # If so, then options_mapping interpolation works
         self.assertTrue(template['Parameters']['Exists'])
 
+    def test_generate_unchanged_outfile(self):
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('This is a test')
+        ''')
+        outfile = NamedTemporaryFile()
+        sys.argv = ['cfn_py_generate', pyplate.name, outfile.name]
+        self._generate()
+
+        # Regenerating the same template shouldn't touch the outfile
+        os.utime(outfile.name, (0, 0))
+        self._generate()
+        self.assertEqual(os.stat(outfile.name).st_mtime, 0)
+
+        # Unless the template changes
+        pyplate.seek(0)
+        pyplate.write("cft = CloudFormationTemplate('This is another test')\n")
+        pyplate.flush()
+        self._generate()
+        self.assertNotEqual(os.stat(outfile.name).st_mtime, 0)
+        self.assertEqual(json.load(outfile)['Description'], 'This is another test')
+
+    @mock.patch('cfn_pyplates.cache.OutputCache')
+    def test_generate_no_cache(self, output_cache):
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('This is a test')
+        ''')
+        sys.argv = ['cfn_py_generate', pyplate.name, '--no-cache']
+        template = json.loads(self._generate())
+        self.assertEqual(template['Description'], 'This is a test')
+        self.assertFalse(output_cache.called)
+
+    @mock.patch('sys.stderr', new_callable=StringIO)
+    def test_generate_minify(self, stderr):
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('This is a test')
+        cft.parameters.add(Parameter('Name', 'String'))
+        ''')
+        outfile = NamedTemporaryFile()
+        sys.argv = ['cfn_py_generate', pyplate.name, outfile.name]
+        self._generate()
+        indented = outfile.read()
+
+        # The output cache shouldn't hand back the indented template
+        sys.argv = ['cfn_py_generate', pyplate.name, outfile.name, '--minify', '--sort-keys']
+        self._generate()
+        outfile.seek(0)
+        minified = outfile.read()
+        self.assertEqual(minified, json.dumps(json.loads(indented), separators=(',', ':'),
+            sort_keys=True))
+
+        saved = len(indented) - len(minified)
+        report = 'Minified template is {0:,} bytes, {1:,} bytes ({2:.1%}) smaller than ' \
+            'indented\n'.format(len(minified), saved, float(saved) / len(indented))
+        self.assertEqual(stderr.getvalue(), report)
+
+        # Streamed output is counted as it's written
+        sys.argv = ['cfn_py_generate', pyplate.name, '--minify', '--no-cache']
+        sys.stdout.truncate(0)
+        stderr.truncate(0)
+        self._generate()
+        self.assertEqual(stderr.getvalue(), report)
+
+    def test_byte_counter(self):
+        # Indented sizes are counted from minified JSON, however it's split up
+        template = OrderedDict([
+            ('Empty', [{}, [], {'Nested': [1, {'Deeper': None}]}]),
+            ('Strings', [u'{[,:"\\ n\xe4me]}', 'a\\', '\\"', '']),
+            ('Numbers', {'1': 1.5, 'Two': -2}),
+        ])
+        minified = json.dumps(template, **core.json_options(minify=True))
+        indented = json.dumps(template, **core.json_options())
+        for size in (1, 2, 7, len(minified)):
+            counter = cli._ByteCounter()
+            for start in range(0, len(minified), size):
+                counter.write(minified[start:start + size])
+            self.assertEqual(counter.size, len(minified))
+            self.assertEqual(counter.indented_size, len(indented))
+
+    def test_generate_layered_options(self):
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate(options['Name'])
+        cft.metadata.update(options['Network'])
+        ''')
+        base = NamedTemporaryFile()
+        base.write('Name: base\nNetwork: {Cidr: 10.0.0.0/16, Zones: [a, b]}\n')
+        base.flush()
+        overlay = NamedTemporaryFile()
+        overlay.write('{"Network": {"Cidr": "10.1.0.0/16"}}')
+        overlay.flush()
+
+        sys.argv = ['cfn_py_generate', pyplate.name, '-o', base.name, '-o', overlay.name,
+            '-D', 'Name=defined', '--define', 'Network.Zones=[c]']
+        template = json.loads(self._generate())
+        self.assertEqual(template['Description'], 'defined')
+        self.assertEqual(template['Metadata'], {'Cidr': '10.1.0.0/16', 'Zones': ['c']})
+
+        sys.argv = ['cfn_py_generate', pyplate.name, '-D', 'Name']
+        self.assertEqual(cli.generate(), 1)
+        self.assertIn("Options are defined as key=value, not 'Name'", sys.stdout.getvalue())
+
+    def test_generate_check_refs(self):
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('This is a test')
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': ref('VCP')}))
+        ''')
+        sys.argv = ['cfn_py_generate', pyplate.name]
+        self.assertIn('"VCP"', self._generate())
+
+        sys.argv = ['cfn_py_generate', pyplate.name, '--check-refs']
+        self.assertEqual(cli.generate(), 1)
+        self.assertIn("Resources.Subnet refers to VCP with Ref, which isn't a parameter or "
+            "resource", sys.stdout.getvalue())
+
+    def test_generate_server(self):
+        from cfn_pyplates import serve
+
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        server = serve.Server(os.path.join(workdir, 'server.sock'), 1)
+        server.listen()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.close)
+
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate(options['Description'])
+        ''')
+        sys.stdin.write('Description: From stdin\n')
+        sys.stdin.seek(0)
+        sys.argv = ['cfn_py_generate', pyplate.name, '-o', '-', '--server', server.path]
+        self.assertEqual(json.loads(self._generate())['Description'], 'From stdin')
+
+        # The server can also be given by the environment, and errors come back
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('This is a test')
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': ref('VCP')}))
+        ''')
+        sys.argv = ['cfn_py_generate', pyplate.name, '--check-refs']
+        with mock.patch.dict('os.environ', {'CFN_PYPLATES_SERVER': server.path}):
+            self.assertEqual(cli.generate(), 1)
+        self.assertIn('DanglingReferenceError', sys.stdout.getvalue())
+
+    def test_generate_batch(self):
+        pyplate = self._make_pyplate(u'''\
+        cft = CloudFormationTemplate('This is a test')
+        ''')
+        outfiles = [NamedTemporaryFile(), NamedTemporaryFile()]
+        manifest = NamedTemporaryFile()
+        manifest.write(json.dumps([
+            {'pyplate': pyplate.name, 'outfile': outfile.name} for outfile in outfiles
+        ]))
+        manifest.flush()
+
+        sys.argv = ['cfn_py_generate', '--batch', manifest.name, '-j', '2']
+        out = self._generate()
+
+        self.assertIn('2 of 2 pyplates generated', out)
+        for outfile in outfiles:
+            self.assertEqual(json.load(outfile)['Description'], 'This is a test')
+
     def test_broken_pyplate(self):
         pyplate = self._make_pyplate(u'''\
         I am a broken pyplate.
@@ -157,6 +434,7 @@ class CLITestCase(unittest.TestCase):
         # This pyplate should fail because its python syntax isn't valid
         self.assertIn('SyntaxError', out)
 
+    @mock.patch('cfn_pyplates.options.OptionsMapping.interactive', True)
     @mock.patch('__builtin__.raw_input')
     def test_generate_raw_input_cancelled(self, raw_input):
         raw_input.side_effect = KeyboardInterrupt
@@ -195,6 +473,7 @@ class CLITestCase(unittest.TestCase):
             # Run the command, catch it if it tries to exit the interpreter
             self._generate()
 
+    @mock.patch('cfn_pyplates.options.OptionsMapping.interactive', True)
     @mock.patch('__builtin__.raw_input')
     def test_generate_raw_input_empty(self, raw_input):
         # Make a pyplate that uses the options mapping
@@ -232,3 +511,44 @@ class CLITestCase(unittest.TestCase):
 
         # The empty string returned by raw_input should have explicitly been transformed to None
         self.assertTrue(template['Parameters']['DoesNotExist'] is None)
+
+
+class StartupTestCase(unittest.TestCase):
+    def test_lazy_imports(self):
+        # Importing cfn_pyplates shouldn't pull in anything only the CLI needs
+        heavy = ['yaml', 'docopt', 'schema', 'pkg_resources', 'multiprocessing', 'ctypes']
+        script = 'import sys, cfn_pyplates; print [m for m in {0!r} if m in sys.modules]'
+        loaded = subprocess.check_output([sys.executable, '-c', script.format(heavy)])
+        self.assertEqual(loaded.strip(), '[]')
+
+        # Nor should it, or the CLI module, load the template machinery
+        # (None entries are python 2's failed relative imports, like cfn_pyplates.os)
+        script = ('import sys, {0}; print sorted(name for name, module in sys.modules.items() '
+            'if module and name.startswith("cfn_pyplates."))')
+        loaded = subprocess.check_output([sys.executable, '-c', script.format('cfn_pyplates')])
+        self.assertEqual(loaded.strip(), '[]')
+        loaded = subprocess.check_output([sys.executable, '-c', script.format('cfn_pyplates.cli')])
+        self.assertEqual(loaded.strip(),
+            "['cfn_pyplates.cli', 'cfn_pyplates.exceptions', 'cfn_pyplates.options']")
+
+    def test_lazy_submodules(self):
+        # Submodules are still attributes of the package, imported when first used
+        script = ('import sys, cfn_pyplates; core = cfn_pyplates.core; '
+            'print core.__name__, core.CloudFormationTemplate.__name__, '
+            '"cfn_pyplates.cli" in sys.modules')
+        loaded = subprocess.check_output([sys.executable, '-c', script])
+        self.assertEqual(loaded.split(), ['cfn_pyplates.core', 'CloudFormationTemplate', 'False'])
+        self.assertIs(cfn_pyplates.functions, sys.modules['cfn_pyplates.functions'])
+        self.assertIn('options', dir(cfn_pyplates))
+        self.assertRaises(AttributeError, getattr, cfn_pyplates, 'missing')
+
+    def test_version(self):
+        from pkg_resources import get_distribution
+        self.assertEqual(cfn_pyplates.version(), get_distribution('cfn-pyplates').version)
+
+    @mock.patch('cfn_pyplates._read_metadata_version', return_value=None)
+    def test_version_fallback(self, read_metadata_version):
+        from pkg_resources import get_distribution
+        with mock.patch('cfn_pyplates._version', None):
+            self.assertEqual(cfn_pyplates.version(), get_distribution('cfn-pyplates').version)
+        self.assertTrue(read_metadata_version.called)
@@ -13,6 +13,8 @@ import json
 import mock
 import unittest
 import warnings
+from cStringIO import StringIO
+from collections import OrderedDict
 from textwrap import dedent
 from tempfile import NamedTemporaryFile
 
@@ -99,6 +101,22 @@ class JSONableDictTestCase(unittest.TestCase):
         self.assertEqual(len(caught), 1)
         self.assertTrue(bad_name in str(caught[0].message))
 
+    def test_iter_json(self):
+        bm = core.JSONableDict({'Key': 'Value', 'List': [1, 2, 3]})
+        bm.add(TestResource({'Id': 1}))
+        self.assertEqual(''.join(bm.iter_json()), bm.to_json())
+        self.assertEqual(''.join(bm.iter_json(indent=2, separators=(',', ': '))), bm.json)
+
+    def test_json_options(self):
+        bm = core.JSONableDict({'Key': 'Value', 'List': [1, 2, 3]})
+        bm.add(TestResource({'Id': 1}))
+        self.assertEqual(bm.to_json(**core.json_options()), bm.json)
+        minified = bm.to_json(**core.json_options(minify=True))
+        self.assertNotIn(' ', minified)
+        self.assertEqual(json.loads(minified), json.loads(bm.json))
+        self.assertEqual(bm.to_json(**core.json_options(sort_keys=True)),
+            json.dumps(json.loads(bm.json), indent=2, separators=(',', ': '), sort_keys=True))
+
     def test_str_unicode(self):
         # string and unicode dunder methods return the same contents
         bm = core.JSONableDict()
@@ -147,6 +165,39 @@ class CloudFormationTemplateTestCase(unittest.TestCase):
         }''')
         self.assertEqual(unicode(cft), expected_out)
 
+    def test_render_without_side_effects(self):
+        cft = core.CloudFormationTemplate('This is a test')
+        first = unicode(cft)
+        # Empty sections are left out, but not removed from the template
+        self.assertNotIn('Resources', first)
+        self.assertIn('Resources', cft)
+        self.assertEqual(unicode(cft), first)
+        self.assertEqual(cft.json, first)
+
+        # So they can still be used after rendering
+        cft.resources.add(core.Resource('TestResource', 'AWS::Resource::Test'))
+        self.assertIn('TestResource', json.loads(unicode(cft))['Resources'])
+
+    def test_replaced_section(self):
+        cft = core.CloudFormationTemplate()
+        cft.outputs = core.JSONableDict(name='Outputs')
+        self.assertNotIn('Outputs', json.loads(unicode(cft)))
+        # Plain values at the top level are never left out, even if empty
+        cft['Outputs'] = {}
+        self.assertEqual(json.loads(unicode(cft))['Outputs'], {})
+
+    def test_write_json(self):
+        cft = core.CloudFormationTemplate('This is a test')
+        cft.resources.add(core.Resource('TestResource', 'AWS::Resource::Test',
+            {'Key1': 'Value1', 'Key2': ['Value2', {'Ref': 'TestResource'}]}))
+        outfile = StringIO()
+        cft.write_json(outfile, indent=2, separators=(',', ': '))
+
+        # Streamed output should be identical to the output of the unicode
+        # dunder, empty template elements included
+        self.assertEqual(outfile.getvalue(), unicode(cft))
+        self.assertNotIn('Outputs', outfile.getvalue())
+
 
 class ResourcesTestCase(unittest.TestCase):
     def test_resource(self):
@@ -308,6 +359,97 @@ class ResourcesTestCase(unittest.TestCase):
         self.assertEqual(unicode(cft.resources.test), expected_out)
 
 
+    def test_from_rows(self):
+        rows = [
+            {'QueueName': 'orders', 'DelaySeconds': '0'},
+            OrderedDict([('QueueName', 'invoices'), ('DelaySeconds', '5')]),
+        ]
+        depends_on = core.DependsOn('Topic')
+        resources = core.Resource.from_rows('AWS::SQS::Queue', rows,
+            lambda row: row['QueueName'].capitalize() + 'Queue', attributes=depends_on)
+        for resource, row in zip(resources, rows):
+            expected = core.Resource(row['QueueName'].capitalize() + 'Queue', 'AWS::SQS::Queue',
+                row, depends_on)
+            self.assertEqual(resource.name, expected.name)
+            self.assertEqual(resource.json, expected.json)
+            self.assertEqual(resource.digest, expected.digest)
+            # Made without __init__, but just the same
+            self.assertEqual(sorted(vars(resource)), sorted(vars(expected)))
+            self.assertIsInstance(resource['Properties'], core.Properties)
+
+        cft = core.CloudFormationTemplate(share=True)
+        self.assertEqual(cft.resources.extend(resources), resources)
+        self.assertEqual(list(cft.resources), ['OrdersQueue', 'InvoicesQueue'])
+        # Indexed like any other resources
+        self.assertEqual([(reference.name, reference.target)
+            for reference in cft.references.dangling()],
+            [('InvoicesQueue', 'Topic'), ('OrdersQueue', 'Topic')])
+        # Changing them still works as usual
+        resources[0]['Properties']['DelaySeconds'] = '10'
+        self.assertEqual(json.loads(cft.json)['Resources']['OrdersQueue']['Properties'],
+            {'QueueName': 'orders', 'DelaySeconds': '10'})
+
+    def test_bare_ordered_dict(self):
+        # Resources made in bulk skip OrderedDict.__init__, and still work
+        # like any other OrderedDict
+        row = OrderedDict([('QueueName', 'orders'), ('DelaySeconds', '0'),
+            ('VisibilityTimeout', '30')])
+        resource, = core.Resource.from_rows('AWS::SQS::Queue', [row], lambda row: 'Queue')
+        expected = core.Resource('Queue', 'AWS::SQS::Queue', row)
+        for bare, made in [(resource, expected),
+                (resource['Properties'], expected['Properties'])]:
+            self.assertEqual(bare, made)
+            self.assertEqual(bare.keys(), made.keys())
+            self.assertEqual(list(reversed(bare)), list(reversed(made)))
+
+        properties = resource['Properties']
+        self.assertEqual(properties.popitem(), ('VisibilityTimeout', '30'))
+        self.assertEqual(properties.popitem(last=False), ('QueueName', 'orders'))
+        properties['QueueName'] = 'orders'
+        self.assertEqual(properties.keys(), ['DelaySeconds', 'QueueName'])
+        # Moving a key to the end
+        properties['DelaySeconds'] = properties.pop('DelaySeconds')
+        self.assertEqual(properties.keys(), ['QueueName', 'DelaySeconds'])
+        del properties['QueueName']
+        self.assertEqual(properties, OrderedDict([('DelaySeconds', '0')]))
+        self.assertNotEqual(properties, OrderedDict([('DelaySeconds', '5')]))
+        properties.clear()
+        self.assertEqual(properties.items(), [])
+
+    def test_from_rows_properties_fn(self):
+        resources = core.Resource.from_rows('AWS::Route53::RecordSet',
+            [['www', '10.0.0.1'], ['api', '10.0.0.2']], lambda row: row[0].upper() + 'Record',
+            lambda row: {'Name': row[0] + '.example.com', 'ResourceRecords': [row[1]]})
+        self.assertEqual([resource.name for resource in resources], ['WWWRecord', 'APIRecord'])
+        self.assertEqual(resources[1]['Properties']['ResourceRecords'], ['10.0.0.2'])
+
+    def test_from_rows_checks(self):
+        name_fn = lambda row: row.get('Name')
+        for rows, message in [
+            ([{'Name': 'Queue1'}, {'Name': 'queue-2'}],
+                'Row 1: \'queue-2\' isn\'t a resource name, which can only have letters and '
+                'digits'),
+            ([{'Name': 'Queue1'}, {}], 'Row 1: None isn\'t a resource name'),
+            ([{'Name': 'Queue1'}, {'Name': 'Queue1'}],
+                'Row 1: Queue1 is the name of an earlier row\'s resource'),
+        ]:
+            with self.assertRaises(exceptions.ResourceRowError) as context:
+                core.Resource.from_rows('AWS::SQS::Queue', rows, name_fn)
+            self.assertTrue(context.exception.message.startswith(message))
+        self.assertRaises(exceptions.ResourceRowError, core.Resource.from_rows,
+            'AWS::SQS::Queue', [('Queue1', 30)], lambda row: row[0])
+
+    def test_extend(self):
+        cft = core.CloudFormationTemplate()
+        queue = core.Resource('Queue', 'AWS::SQS::Queue')
+        self.assertRaises(exceptions.AddRemoveError, cft.resources.extend,
+            [queue, {'Type': 'AWS::SQS::Queue'}])
+        # Nothing is added unless everything can be
+        self.assertNotIn('Queue', cft.resources)
+        cft.resources.extend(iter([queue]))
+        self.assertIs(cft.resources['Queue'], queue)
+
+
 class ConditionsTestCase(unittest.TestCase):
     def test_condition(self):
         cft = core.CloudFormationTemplate()
@@ -484,6 +626,24 @@ class GenerateTestCase(unittest.TestCase):
         output = json.loads(core.generate_pyplate(pyplate.name, {'ThisKeyExists': True}))
         self.assertTrue(output['Parameters']['Exists'])
 
+    def test_callable_generate_minify(self):
+        pyplate = NamedTemporaryFile()
+        pyplate.write(dedent(u'''\
+        cft = CloudFormationTemplate('This is a test')
+        cft.parameters.add(Parameter('B', 'String'))
+        cft.parameters.add(Parameter('A', 'String', {'Default': 'A'}))
+        '''))
+        pyplate.flush()
+
+        output = core.generate_pyplate(pyplate.name, minify=True)
+        self.assertNotIn(' ', output.replace('This is a test', ''))
+        self.assertNotIn('\n', output)
+        self.assertEqual(json.loads(output), json.loads(core.generate_pyplate(pyplate.name)))
+
+        output = core.generate_pyplate(pyplate.name, minify=True, sort_keys=True)
+        self.assertLess(output.index('"A"'), output.index('"B"'))
+        self.assertLess(output.index('"Default"'), output.index('"Type"'))
+
     @mock.patch('cfn_pyplates.exceptions.Error')
     def test_callable_generate_no_template(self, error):
         # Make a pyplate with no CloudFormationTemplate in it
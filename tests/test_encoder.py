@@ -0,0 +1,117 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+from collections import OrderedDict
+import json
+import unittest
+
+from cfn_pyplates.core import CloudFormationTemplate, Resource, json_options
+from cfn_pyplates.encoder import TemplateEncoder
+from cfn_pyplates.functions import c_equals, c_if, get_att, join, ref
+
+
+class TemplateEncoderTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.template = OrderedDict([
+            ('Name', join('-', ref('AWS::StackName'), u'n\xe4me')),
+            ('Nested', {'List': [ref('AWS::StackName'), get_att('Thing', 'Attr'), 1.5, None]}),
+            ('Equals', [c_equals(1, True), c_equals(float('inf'), 2)]),
+            ('If', c_if('Condition', {'Key': 'Value'}, ref('AWS::NoValue'))),
+            ('Empty', [{}, []]),
+            (2, False),
+        ])
+
+    def test_same_as_json(self):
+        for kwargs in [{}, {'indent': 2, 'separators': (',', ': ')}, {'indent': 4},
+                {'separators': (',', ':')}, {'sort_keys': True}, {'ensure_ascii': False},
+                {'indent': 2, 'sort_keys': True}]:
+            # Twice, so that the second time uses remembered fragments
+            for i in range(2):
+                self.assertEqual(json.dumps(self.template, cls=TemplateEncoder, **kwargs),
+                    json.dumps(self.template, **kwargs))
+                self.assertEqual(''.join(TemplateEncoder(**kwargs).iterencode(self.template)),
+                    json.dumps(self.template, **kwargs))
+
+    def test_fragments_reused(self):
+        stack_name = ref('AWS::StackName')
+        encoder = TemplateEncoder(indent=2)
+        encoder.encode(self.template)
+        fragments = dict(stack_name._fragments)
+        self.assertTrue(fragments)
+        encoder.encode(self.template)
+        for key, fragment in stack_name._fragments.items():
+            self.assertIs(fragment, fragments[key])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            json.dumps(self.template, cls=TemplateEncoder, allow_nan=False, indent=2)
+        circular = []
+        circular.append(circular)
+        with self.assertRaises(ValueError):
+            json.dumps(circular, cls=TemplateEncoder, indent=2)
+        with self.assertRaises(TypeError):
+            json.dumps({'Key': object()}, cls=TemplateEncoder, indent=2)
+
+    def test_cache_fragments(self):
+        def make_template(cache_json):
+            cft = CloudFormationTemplate('Fragments test', share=cache_json, cache_json=cache_json)
+            for name in ('Web', 'Worker'):
+                cft.resources.add(Resource(name, 'AWS::EC2::Instance', {
+                    'ImageId': 'ami-12345',
+                    'SecurityGroups': [ref('Group')],
+                }))
+            return cft
+
+        cft = make_template(cache_json=True)
+        expected = make_template(cache_json=False)
+        for options in [json_options(), json_options(minify=True, sort_keys=True)]:
+            self.assertEqual(cft.to_json(**options), expected.to_json(**options))
+        worker = cft.resources['Worker']
+        fragments = dict(worker._fragments)
+        self.assertTrue(fragments)
+
+        for template in (cft, expected):
+            template.resources['Web']['Properties']['ImageId'] = 'ami-67890'
+            template.resources['Web']['Properties']['SecurityGroups'].append('sg-1234')
+        self.assertIsNone(cft.resources._fragments)
+        for options in [json_options(), json_options(minify=True, sort_keys=True)]:
+            self.assertEqual(cft.to_json(**options), expected.to_json(**options))
+            self.assertEqual(''.join(cft.iter_json(**options)), expected.to_json(**options))
+        for key, fragment in worker._fragments.items():
+            self.assertIs(fragment, fragments[key])
+
+    def test_cache_plain_values(self):
+        # Plain dicts and lists can be changed in place, so their JSON isn't remembered
+        cft = CloudFormationTemplate('Fragments test', cache_json=True)
+        groups = [ref('Group')]
+        web = cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+            'ImageId': 'ami-12345',
+            'SecurityGroups': groups,
+        }))
+        bucket = cft.resources.add(Resource('Bucket', 'AWS::S3::Bucket', {'BucketName': 'b'}))
+        cft.to_json()
+        self.assertIsNone(web._fragments)
+        self.assertIsNone(cft.resources._fragments)
+        self.assertTrue(bucket._fragments)
+
+        groups.append('sg-1234')
+        self.assertEqual(json.loads(cft.to_json())['Resources']['Web']['Properties'][
+            'SecurityGroups'], [{'Ref': 'Group'}, 'sg-1234'])
+
+        # Including those in intrinsics, which aren't interned when they hold one
+        inner = {'a': 1}
+        bucket['Properties']['Tags'] = c_if('Condition', inner, 'b')
+        cft.to_json()
+        self.assertIsNone(bucket._fragments)
+        inner['a'] = 2
+        self.assertEqual(json.loads(cft.to_json())['Resources']['Bucket']['Properties'][
+            'Tags'], {'Fn::If': ['Condition', {'a': 2}, 'b']})
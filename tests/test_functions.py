@@ -10,6 +10,9 @@
 # The above copyright notice and this permission notice shall be included in
 # all copies or substantial portions of the Software.
 
+import copy
+import json
+import pickle
 import unittest
 
 from cfn_pyplates import exceptions, functions
@@ -69,6 +72,54 @@ class IntrinsicFuncsTestCase(unittest.TestCase):
         self.assertEqual(ret['Fn::Equals'], ['Thing 1', 'Thing 2'])
 
 
+class IntrinsicTestCase(unittest.TestCase):
+    def test_interned(self):
+        self.assertIs(functions.ref('Thing'), functions.ref('Thing'))
+        self.assertIs(functions.join('-', functions.ref('Thing'), 'x'),
+            functions.join('-', functions.ref('Thing'), 'x'))
+        self.assertIsNot(functions.ref('Thing'), functions.ref('Other'))
+        # Equal in python, but not in JSON
+        self.assertIsNot(functions.c_equals(1, 2), functions.c_equals(True, 2))
+        self.assertIsNot(functions.c_equals(1, 2), functions.c_equals(1.0, 2))
+
+    def test_dict_compatible(self):
+        ret = functions.get_att('ThingName', 'AttrName')
+        self.assertEqual(ret, {'Fn::GetAtt': ['ThingName', 'AttrName']})
+        self.assertEqual(json.loads(json.dumps(ret)), {'Fn::GetAtt': ['ThingName', 'AttrName']})
+        self.assertEqual(repr(ret), repr({'Fn::GetAtt': ['ThingName', 'AttrName']}))
+
+    def test_read_only(self):
+        ret = functions.join('.', 'x', 'y')
+        with self.assertRaises(TypeError):
+            ret['Fn::Join'] = 'z'
+        with self.assertRaises(TypeError):
+            ret.update({'Ref': 'z'})
+        with self.assertRaises(AttributeError):
+            ret['Fn::Join'][1].append('z')
+
+    def test_hashable(self):
+        refs = set([functions.ref('Thing'), functions.ref('Thing'), functions.ref('Other')])
+        self.assertEqual(len(refs), 2)
+
+    def test_mutable_arguments(self):
+        # Intrinsics holding something that can change aren't interned or hashable
+        properties = {'Key': 'Value'}
+        ret = functions.c_if('Condition', properties, functions.ref('AWS::NoValue'))
+        self.assertIsNot(ret, functions.c_if('Condition', properties, functions.ref('AWS::NoValue')))
+        with self.assertRaises(TypeError):
+            hash(ret)
+        properties['Key'] = 'Changed'
+        self.assertEqual(ret['Fn::If'][1], {'Key': 'Changed'})
+
+    def test_copy_pickle(self):
+        ret = functions.join('.', functions.ref('Thing'), 'y')
+        self.assertIs(copy.deepcopy(ret), ret)
+        self.assertIs(pickle.loads(pickle.dumps(ret, pickle.HIGHEST_PROTOCOL)), ret)
+        mutable = functions.c_if('Condition', {'Key': 'Value'}, 'x')
+        self.assertEqual(copy.deepcopy(mutable), mutable)
+        self.assertIsNot(copy.deepcopy(mutable)['Fn::If'][1], mutable['Fn::If'][1])
+
+
 class IntrinsicFuncsFailureCase(unittest.TestCase):
     def test_join_unjoinable(self):
         with self.assertRaises(exceptions.IntrinsicFuncInputError) as ctx:
@@ -0,0 +1,118 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import json
+import unittest
+
+from cfn_pyplates import core, exceptions
+from cfn_pyplates.core import CloudFormationTemplate, DependsOn, Parameter, Resource
+from cfn_pyplates.functions import get_att, ref
+
+
+class DependencyGraphTestCase(unittest.TestCase):
+    def test_dependencies(self):
+        cft = CloudFormationTemplate('Graph test')
+        cft.parameters.add(Parameter('Environment', 'String'))
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+            'SubnetId': ref('Subnet'),
+            'SecurityGroupIds': [get_att('WebSecurityGroup', 'GroupId')],
+            'Tags': [{'Key': 'Environment', 'Value': ref('Environment')}],
+        }, [DependsOn(['Gateway'])]))
+        cft.resources.add(Resource('WebSecurityGroup', 'AWS::EC2::SecurityGroup', {
+            'VpcId': ref('VPC'),
+        }))
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {
+            'VpcId': ref('VPC'),
+            'Description': {'Fn::Sub': 'Subnet of ${VPC}'},
+        }))
+        cft.resources.add(Resource('Gateway', 'AWS::EC2::InternetGateway'))
+        cft.resources.add(Resource('VPC', 'AWS::EC2::VPC'))
+        graph = cft.dependency_graph()
+        self.assertEqual(len(graph), 5)
+        # Parameters aren't resources, so they aren't dependencies
+        self.assertEqual(graph.depends_on('Web'), ['Gateway', 'Subnet', 'WebSecurityGroup'])
+        self.assertEqual(graph.dependencies['Subnet'], {'VPC': ('Ref',)})
+        self.assertEqual(graph.dependents('VPC'), ['Subnet', 'WebSecurityGroup'])
+        self.assertEqual(graph.dependents('Web'), [])
+
+    def test_order(self):
+        cft = CloudFormationTemplate('Graph test')
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+            'SubnetId': ref('Subnet'),
+            'SecurityGroupIds': [get_att('WebSecurityGroup', 'GroupId')],
+        }))
+        cft.resources.add(Resource('WebSecurityGroup', 'AWS::EC2::SecurityGroup', {
+            'VpcId': ref('VPC'),
+        }))
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': ref('VPC')}))
+        cft.resources.add(Resource('Gateway', 'AWS::EC2::InternetGateway'))
+        cft.resources.add(Resource('VPC', 'AWS::EC2::VPC', attributes=[DependsOn('Gateway')]))
+        graph = cft.dependency_graph()
+        order = graph.topological_order()
+        self.assertEqual(order, ['Gateway', 'VPC', 'WebSecurityGroup', 'Subnet', 'Web'])
+        self.assertEqual(graph.depths(),
+            {'Gateway': 0, 'VPC': 1, 'WebSecurityGroup': 2, 'Subnet': 2, 'Web': 3})
+        self.assertIsNone(graph.find_cycle())
+        graph.check()
+
+    def test_cycle(self):
+        cft = CloudFormationTemplate('Graph test')
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance',
+            attributes=[DependsOn('Gateway')]))
+        cft.resources.add(Resource('Gateway', 'AWS::EC2::InternetGateway', {
+            'Tags': [{'Key': 'Server', 'Value': get_att('Web', 'PrivateIp')}],
+        }))
+        graph = cft.dependency_graph()
+        self.assertEqual(graph.find_cycle(), ['Web', 'Gateway', 'Web'])
+        for method in graph.check, graph.topological_order, graph.depths:
+            with self.assertRaises(exceptions.DependencyCycleError) as context:
+                method()
+            self.assertEqual(context.exception.cycle, ['Web', 'Gateway', 'Web'])
+            self.assertIn('Web -> Gateway -> Web', str(context.exception))
+
+        with self.assertRaises(exceptions.DependencyCycleError):
+            core.check_references(cft)
+
+    def test_deep(self):
+        # Far deeper than the recursion limit
+        cft = CloudFormationTemplate('Deep')
+        for i in range(5000):
+            cft.resources.add(Resource('R{0}'.format(i), 'AWS::SNS::Topic',
+                attributes=[DependsOn('R{0}'.format(i - 1))] if i else []))
+        graph = cft.dependency_graph()
+        self.assertIsNone(graph.find_cycle())
+        self.assertEqual(graph.depths()['R4999'], 4999)
+
+        cft.resources['R0']['DependsOn'] = 'R4999'
+        cft.references.rescan()
+        self.assertEqual(len(cft.dependency_graph().find_cycle()), 5001)
+
+    def test_export(self):
+        cft = CloudFormationTemplate('Graph test')
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {'SubnetId': ref('Subnet')},
+            [DependsOn('Gateway')]))
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': ref('VPC')}))
+        cft.resources.add(Resource('Gateway', 'AWS::EC2::InternetGateway'))
+        cft.resources.add(Resource('VPC', 'AWS::EC2::VPC'))
+        graph = cft.dependency_graph()
+        exported = json.loads(graph.to_json())
+        self.assertEqual(exported['nodes'][0], {'name': 'Web', 'type': 'AWS::EC2::Instance'})
+        self.assertIn({'from': 'Web', 'to': 'Gateway', 'kinds': ['DependsOn']},
+            exported['edges'])
+        self.assertIn({'from': 'Subnet', 'to': 'VPC', 'kinds': ['Ref']}, exported['edges'])
+        self.assertEqual(len(exported['edges']), 3)
+
+        dot = graph.to_dot()
+        self.assertTrue(dot.startswith('digraph dependencies {'))
+        self.assertIn('"Web" [label="Web\\nAWS::EC2::Instance"];', dot)
+        self.assertIn('"Web" -> "Gateway" [style=dashed];', dot)
+        self.assertIn('"Web" -> "Subnet";', dot)
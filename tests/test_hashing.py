@@ -0,0 +1,168 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import copy
+import json
+import unittest
+from collections import OrderedDict
+
+from cfn_pyplates import hashing
+from cfn_pyplates.core import CloudFormationTemplate, Properties, Resource, ec2_tags
+from cfn_pyplates.functions import ref
+
+
+class HashingTestCase(unittest.TestCase):
+    def test_json_semantics(self):
+        self.assertEqual(hashing.digest({'a': [1, 'b']}), hashing.digest({u'a': [1, u'b']}))
+        self.assertEqual(hashing.digest([1, 2]), hashing.digest((1, 2)))
+        self.assertEqual(hashing.digest({1: 'a'}), hashing.digest({'1': 'a'}))
+        self.assertNotEqual(hashing.digest(1), hashing.digest('1'))
+        self.assertNotEqual(hashing.digest(1), hashing.digest(1.0))
+        self.assertNotEqual(hashing.digest(['ab', 'c']), hashing.digest(['a', 'bc']))
+        self.assertNotEqual(hashing.digest([[1], 2]), hashing.digest([1, [2]]))
+        ordered = OrderedDict([('a', 1), ('b', 2)])
+        self.assertNotEqual(hashing.digest(ordered), hashing.digest(OrderedDict(
+            reversed(ordered.items()))))
+        self.assertRaises(TypeError, hashing.digest, [object()])
+
+    def test_template_digest(self):
+        templates = []
+        for share, image in [(False, 'ami-12345'), (True, 'ami-12345'), (False, 'ami-67890')]:
+            cft = CloudFormationTemplate('Hashing test', share=share)
+            cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+                'ImageId': image,
+                'SecurityGroups': [ref('Group')],
+            }))
+            templates.append(cft)
+        cft, shared, changed = templates
+        self.assertEqual(cft.digest, shared.digest)
+        self.assertEqual(cft.digest, hashing.hexdigest(json.loads(cft.json,
+            object_pairs_hook=OrderedDict)))
+        self.assertNotEqual(cft.digest, changed.digest)
+
+    def test_invalidation(self):
+        # Shared, so that digests are kept (see test_plain_values)
+        cft = CloudFormationTemplate('Hashing test', share=True)
+        web = cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {'ImageId': 'ami-12345'}))
+        worker = cft.resources.add(Resource('Worker', 'AWS::EC2::Instance',
+            {'ImageId': 'ami-12345'}))
+        before = cft.digest
+        worker_digest = worker.digest
+
+        web['Properties']['ImageId'] = 'ami-67890'
+        self.assertIsNone(cft._digest)
+        self.assertEqual(worker._digest, worker_digest.decode('hex'))
+        self.assertEqual(cft.digest, hashing.hexdigest(json.loads(cft.json,
+            object_pairs_hook=OrderedDict)))
+        self.assertNotEqual(cft.digest, before)
+
+        web['Properties']['ImageId'] = 'ami-12345'
+        self.assertEqual(cft.digest, before)
+
+    def test_add_remove(self):
+        cft = CloudFormationTemplate('Hashing test', share=True)
+        before = cft.digest
+        extra = cft.resources.add(Resource('Extra', 'AWS::S3::Bucket'))
+        self.assertNotEqual(cft.digest, before)
+        cft.resources.remove(extra)
+        self.assertEqual(cft.digest, before)
+        # Removed children don't change the template any more
+        extra.add(Properties({'BucketName': 'extra'}))
+        self.assertEqual(cft._digest, before.decode('hex'))
+
+    def test_empty_section(self):
+        cft = CloudFormationTemplate('Hashing test')
+        before = cft.digest
+        cft.outputs.update({'Address': {'Value': 'example.com'}})
+        self.assertNotEqual(cft.digest, before)
+        cft.outputs.clear()
+        self.assertEqual(cft.digest, before)
+
+    def test_plain_values(self):
+        # Plain dicts and lists can be changed in place, so digests aren't
+        # kept for anything with one in it, unlike shared values
+        for share in (False, True):
+            templates = []
+            for _ in range(2):
+                cft = CloudFormationTemplate('Hashing test', share=share)
+                cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+                    'ImageId': 'ami-12345',
+                    'Tags': ec2_tags({'Name': 'web'}),
+                }))
+                templates.append(cft)
+            cft, other = templates
+            before = cft.digest
+            if share:
+                self.assertEqual(cft._digest, before.decode('hex'))
+            else:
+                self.assertIsNone(cft._digest)
+                self.assertIsNone(cft.resources['Web']._digest)
+
+            # Shared values gotten by key are swapped for plain private copies
+            cft.resources['Web']['Properties']['Tags'].append({'Key': 'Team', 'Value': 'a'})
+            self.assertNotEqual(cft.digest, before)
+            self.assertEqual(cft.changes(other), [('Resources', 'Web', 'Properties', 'Tags')])
+            self.assertNotEqual(cft, other)
+
+    def test_equality(self):
+        templates = []
+        for image in ('ami-12345', 'ami-12345', 'ami-67890'):
+            cft = CloudFormationTemplate('Hashing test')
+            cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+                'ImageId': image,
+                'Tags': ec2_tags({'Name': 'web'}),
+            }))
+            templates.append(cft)
+        cft, other, changed = templates
+        self.assertEqual(cft, other)
+        self.assertNotEqual(cft, changed)
+        # Empty sections aren't rendered, so don't count
+        del other['Outputs']
+        self.assertEqual(cft, other)
+        self.assertFalse(cft != other)
+
+        # Plain lists changed in place count, even with digests known
+        cft.digest, other.digest
+        cft.resources['Web']['Properties']['Tags'].append({'Key': 'Team', 'Value': 'platform'})
+        self.assertNotEqual(cft, other)
+        self.assertNotEqual(other, cft)
+
+    def test_changes(self):
+        templates = []
+        for _ in range(2):
+            cft = CloudFormationTemplate('Hashing test')
+            for name in ('Web', 'Worker'):
+                cft.resources.add(Resource(name, 'AWS::EC2::Instance', {'ImageId': 'ami-12345'}))
+            templates.append(cft)
+        cft, changed = templates
+        self.assertEqual(cft.changes(changed), [])
+        changed.resources['Web']['Properties']['ImageId'] = 'ami-67890'
+        changed.resources.add(Resource('Extra', 'AWS::S3::Bucket'))
+        del changed.resources['Worker']
+        self.assertEqual(changed.changes(cft), [
+            ('Resources', 'Web', 'Properties', 'ImageId'),
+            ('Resources', 'Extra'),
+            ('Resources', 'Worker'),
+        ])
+        previous = json.loads(cft.json, object_pairs_hook=OrderedDict)
+        self.assertEqual(hashing.changes(previous, changed), changed.changes(cft))
+
+    def test_copy(self):
+        cft = CloudFormationTemplate('Hashing test')
+        properties = cft.resources.add(Resource('Web', 'AWS::EC2::Instance',
+            {'ImageId': 'ami-12345'}))['Properties']
+        before = cft.digest
+        copied = copy.copy(properties)
+        self.assertEqual(copied.digest, properties.digest)
+        copied['ImageId'] = 'ami-67890'
+        self.assertNotEqual(copied.digest, properties.digest)
+        self.assertEqual(cft.digest, before)
@@ -0,0 +1,72 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+import os
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+import mock
+
+from cfn_pyplates import core, memory
+
+
+class MemoryTestCase(unittest.TestCase):
+    def test_census(self):
+        cft = core.CloudFormationTemplate('Census')
+        for i in range(2000):
+            cft.resources.add(core.Resource('Topic{0}'.format(i), 'AWS::SNS::Topic',
+                {'DisplayName': 'Topic {0}'.format(i)}))
+        census = dict((entry.name, entry) for entry in memory.jsonabledict_census())
+        self.assertGreaterEqual(census['Resource'].count, 2000)
+        self.assertGreaterEqual(census['Properties'].count, 2000)
+        # A section's own estimate leaves out the resources in it, which are
+        # counted under their own class
+        self.assertGreater(census['Resource'].bytes, census['Resources'].bytes)
+        self.assertGreater(memory.type_census()[0].count, 0)
+
+    def test_profile(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        pyplate = os.path.join(workdir, 'pyplate.py')
+        with open(pyplate, 'w') as f:
+            f.write("cft = CloudFormationTemplate('Measured')\n"
+                "cft.resources.add(Resource('Topic', 'AWS::SNS::Topic'))\n")
+
+        profile = memory.MemoryProfile(sites=3)
+        with mock.patch('cfn_pyplates.memory.tracemalloc', None):
+            profile.start()
+            with profile.phase('options'):
+                pass
+            core.generate_pyplate(pyplate, {}, profile=profile)
+            profile.stop()
+        self.assertEqual([snapshot.phase for snapshot in profile.snapshots],
+            ['options', 'run', 'serialize'])
+        self.assertIsNone(profile.snapshots[0].traced)
+        self.assertIn('Resource', [census.name for census in profile.census])
+        # Without tracemalloc, the biggest types stand in for allocation sites
+        self.assertEqual(profile.sites, [])
+        self.assertEqual(len(profile.types), 3)
+        # The times are still profiled
+        self.assertIn('run', profile.phases)
+
+        report = StringIO()
+        profile.report_memory(report)
+        self.assertIn('allocation sites need tracemalloc', report.getvalue())
+        self.assertEqual(report.getvalue().splitlines()[0].split(),
+            ['after', 'resident', 'peak', 'traced'])
+
+    def test_format_bytes(self):
+        self.assertEqual(memory._format_bytes(None), '-')
+        self.assertEqual(memory._format_bytes(512), '512B')
+        self.assertEqual(memory._format_bytes(1536), '1.5KB')
+        self.assertEqual(memory._format_bytes(3 * 1024 ** 3), '3.0GB')
@@ -0,0 +1,200 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from cfn_pyplates import nesting
+from cfn_pyplates.core import (CloudFormationTemplate, Condition, DependsOn, Mapping, Output,
+    Parameter, Resource)
+from cfn_pyplates.exceptions import Error
+from cfn_pyplates.functions import c_equals, c_if, find_in_map, get_att, ref
+
+
+class SplitTemplateTestCase(unittest.TestCase):
+    def test_fits(self):
+        cft = CloudFormationTemplate('Fits')
+        cft.resources.add(Resource('Topic', 'AWS::SNS::Topic'))
+        parent, children = nesting.split_template(cft)
+        self.assertIs(parent, cft)
+        self.assertEqual(children, {})
+
+    def test_split(self):
+        cft = CloudFormationTemplate('Nesting test')
+        cft.parameters.add(Parameter('Environment', 'String'))
+        cft.mappings.add(Mapping('AMIs', {'us-east-1': {'HVM': 'ami-00000001'}}))
+        cft.conditions.add(Condition('IsProd', c_equals(ref('Environment'), 'prod')))
+        cft.resources.add(Resource('VPC', 'AWS::EC2::VPC', {'CidrBlock': '10.0.0.0/16'}))
+        for i in range(4):
+            cft.resources.add(Resource('Subnet{0}'.format(i), 'AWS::EC2::Subnet', {
+                'VpcId': ref('VPC'),
+                'CidrBlock': {'Fn::Sub': '${VPC.CidrBlock}'},
+            }))
+            cft.resources.add(Resource('Web{0}'.format(i), 'AWS::EC2::Instance', {
+                'ImageId': find_in_map('AMIs', ref('AWS::Region'), 'HVM'),
+                'InstanceType': c_if('IsProd', 'm3.large', 'm3.medium'),
+                'SubnetId': ref('Subnet{0}'.format(i)),
+            }, [DependsOn('VPC')]))
+        cft.outputs.add(Output('Address', get_att('Web0', 'PublicIp')))
+        cft.outputs.add(Output('VpcId', ref('VPC')))
+        parent, children = nesting.split_template(cft, max_resources=4)
+        self.assertEqual(children.keys(), ['NestedStack1', 'NestedStack2', 'NestedStack3'])
+        self.assertEqual(sorted(parent.resources), children.keys())
+
+        # Every resource is in exactly one child, and each is complete
+        names = [name for child in children.values() for name in child.resources]
+        self.assertEqual(sorted(names), sorted(cft.resources))
+        for child in children.values():
+            self.assertLessEqual(len(child.resources), 3)
+            self.assertEqual(child.references.dangling(), [])
+        parent.references.check()
+        parent.dependency_graph().check()
+
+        # The VPC's Ref and attribute are passed to the children without it
+        first, second = children['NestedStack1'], children['NestedStack2']
+        self.assertIn('VPC', first.resources)
+        self.assertEqual(sorted(first.outputs), ['VPC', 'VPCCidrBlock', 'Web0PublicIp'])
+        self.assertEqual(sorted(second.parameters), ['Environment', 'VPC', 'VPCCidrBlock'])
+        subnet = second.resources[second.resources.keys()[0]]
+        self.assertEqual(subnet['Properties']['CidrBlock'], {'Fn::Sub': '${VPCCidrBlock}'})
+        self.assertEqual(second.conditions.keys(), ['IsProd'])
+        self.assertEqual(second.mappings.keys(), ['AMIs'])
+
+        stack = parent.resources['NestedStack2']
+        self.assertEqual(stack['Properties']['TemplateURL'], 'NestedStack2.json')
+        self.assertEqual(stack['Properties']['Parameters']['VPCCidrBlock'],
+            get_att('NestedStack1', 'Outputs.VPCCidrBlock'))
+        self.assertEqual(stack['Properties']['Parameters']['Environment'], ref('Environment'))
+        # DependsOn a resource in another child becomes DependsOn its stack
+        self.assertEqual(stack['DependsOn'], ['NestedStack1'])
+        for name in second.resources:
+            self.assertNotIn('DependsOn', second.resources[name])
+
+        # The parent's outputs come from the children
+        self.assertEqual(parent.outputs['VpcId']['Value'], get_att('NestedStack1', 'Outputs.VPC'))
+        self.assertEqual(parent.outputs['Address']['Value'],
+            get_att('NestedStack1', 'Outputs.Web0PublicIp'))
+        self.assertEqual(parent.conditions.keys(), ['IsProd'])
+
+        # The original template is left alone
+        self.assertEqual(len(cft.resources), 9)
+        self.assertEqual(cft.outputs['VpcId']['Value'], ref('VPC'))
+
+    def test_acyclic(self):
+        # A chain too long for one child is cut so that children only depend
+        # on the ones before them
+        cft = CloudFormationTemplate('Chain')
+        for i in range(50):
+            cft.resources.add(Resource('R{0}'.format(i), 'AWS::SNS::Topic',
+                {'DisplayName': ref('R{0}'.format(i - 1))} if i else None))
+        parent, children = nesting.split_template(cft, max_resources=10)
+        self.assertEqual(len(children), 6)
+        self.assertIsNone(parent.dependency_graph().find_cycle())
+        self.assertEqual(parent.dependency_graph().depths()['NestedStack6'], 5)
+
+    def test_bytes(self):
+        cft = CloudFormationTemplate('Bytes')
+        for i in range(50):
+            cft.resources.add(Resource('Topic{0}'.format(i), 'AWS::SNS::Topic',
+                {'DisplayName': 'Topic number {0}'.format(i)}))
+        size = len(cft.json)
+        parent, children = nesting.split_template(cft, max_bytes=size // 2)
+        self.assertGreater(len(children), 1)
+        for child in children.values():
+            self.assertLess(len(child.json), size // 2)
+
+    def test_parameters(self):
+        # Children are kept within the parameters they can have, counting
+        # the ones copied from the template
+        cft = CloudFormationTemplate('Parameters')
+        for i in range(20):
+            cft.parameters.add(Parameter('Name{0}'.format(i), 'String'))
+            cft.parameters.add(Parameter('Display{0}'.format(i), 'String'))
+            cft.resources.add(Resource('Topic{0}'.format(i), 'AWS::SNS::Topic', {
+                'TopicName': ref('Name{0}'.format(i)),
+                'DisplayName': ref('Display{0}'.format(i)),
+            }))
+        parent, children = nesting.split_template(cft, max_resources=10, max_parameters=10)
+        self.assertEqual(len(children), 5)
+        for child in children.values():
+            self.assertLessEqual(len(child.parameters), 9)
+
+    def test_outputs(self):
+        # One resource with more attributes used from other children than a
+        # template can output
+        cft = CloudFormationTemplate('Outputs')
+        cft.resources.add(Resource('Hub', 'AWS::SNS::Topic'))
+        for i in range(20):
+            cft.resources.add(Resource('Spoke{0}'.format(i), 'AWS::SNS::Topic',
+                {'DisplayName': get_att('Hub', 'Attribute{0}'.format(i))}))
+        parent, children = nesting.split_template(cft, max_resources=10)
+        self.assertEqual(len(children['NestedStack1'].outputs), 12)
+        with self.assertRaises(Error) as raised:
+            nesting.split_template(cft, max_resources=10, max_outputs=10)
+        self.assertIn('NestedStack1 would have 12 outputs', raised.exception.message)
+
+    def _chain(self, value):
+        # A chain of resources too long for one child, each using the one
+        # before it, with the value the first is used by
+        cft = CloudFormationTemplate('Chain')
+        for i in range(10):
+            properties = {'DisplayName': value('R{0}'.format(i - 1))} if i else None
+            cft.resources.add(Resource('R{0}'.format(i), 'AWS::SNS::Topic', properties))
+        return cft
+
+    def test_condition(self):
+        cft = self._chain(ref)
+        cft.conditions.add(Condition('IsProd', c_equals(ref('AWS::Region'), 'us-east-1')))
+        for name in cft.resources:
+            cft.resources[name]['Condition'] = 'IsProd'
+        with self.assertRaises(Error) as raised:
+            nesting.split_template(cft, max_resources=4)
+        self.assertIn('it has a Condition', raised.exception.message)
+
+    def test_list_attribute(self):
+        cft = self._chain(lambda name: {'Fn::Join': [',', get_att(name, 'Names')]})
+        with self.assertRaises(Error) as raised:
+            nesting.split_template(cft, max_resources=4)
+        self.assertIn("since it's a list", raised.exception.message)
+
+    def test_attribute_name(self):
+        cft = self._chain(lambda name: {'Fn::GetAtt': [name, ref('AWS::Region')]})
+        with self.assertRaises(Error) as raised:
+            nesting.split_template(cft, max_resources=4)
+        self.assertIn("isn't named by a string", raised.exception.message)
+
+
+class GenerateSplitTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_generate_split(self):
+        pyplate = os.path.join(self.directory, 'pyplate.py')
+        with open(pyplate, 'w') as f:
+            f.write('cft = CloudFormationTemplate("Split")\n'
+                'for i in range(20):\n'
+                '    cft.resources.add(Resource("Topic%d" % i, "AWS::SNS::Topic"))\n')
+        outfile = os.path.join(self.directory, 'big.json')
+
+        paths = nesting.generate_split(pyplate, outfile=outfile, max_resources=10)
+        self.assertEqual([os.path.basename(path) for path in paths],
+            ['big.json', 'big-NestedStack1.json', 'big-NestedStack2.json', 'big-NestedStack3.json'])
+        with open(outfile) as f:
+            parent = json.load(f)
+        self.assertEqual(parent['Resources']['NestedStack1']['Properties']['TemplateURL'],
+            'big-NestedStack1.json')
+        with open(paths[1]) as f:
+            self.assertEqual(len(json.load(f)['Resources']), 9)
@@ -0,0 +1,129 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from cfn_pyplates import exceptions, options
+from cfn_pyplates.options import OptionsMapping
+
+
+class OptionsTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+
+    def _write(self, name, contents):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_layered(self):
+        base = {'Name': 'web', 'Network': {'Cidr': '10.0.0.0/16', 'Zones': ['a', 'b']}}
+        overlay = {'Network': {'Cidr': '10.1.0.0/16'}, 'Size': 'large'}
+        mapping = OptionsMapping.layered(base, overlay, {'Name': 'api'})
+        self.assertEqual(mapping, {
+            'Name': 'api',
+            'Network': {'Cidr': '10.1.0.0/16', 'Zones': ['a', 'b']},
+            'Size': 'large',
+        })
+        self.assertIsInstance(mapping, OptionsMapping)
+        # The layers are left alone
+        self.assertEqual(base['Network']['Cidr'], '10.0.0.0/16')
+
+        # A value that isn't a dict on both sides is replaced outright
+        mapping = OptionsMapping.layered(base, {'Network': None})
+        self.assertIsNone(mapping['Network'])
+
+    def test_parse_definitions(self):
+        self.assertEqual(options.parse_definitions(
+            ['Count=3', 'Enabled=true', 'Name=web=1', 'Empty=', 'Network.Cidr=10.0.0.0/16',
+            'Network.Zones=[a, b]']), {
+                'Count': 3,
+                'Enabled': True,
+                'Name': 'web=1',
+                'Empty': None,
+                'Network': {'Cidr': '10.0.0.0/16', 'Zones': ['a', 'b']},
+            })
+        for definition in ('Name', '=value'):
+            with self.assertRaises(exceptions.OptionDefinitionError):
+                options.parse_definitions([definition])
+
+    def test_load_options(self):
+        base = self._write('base.yaml', 'Name: web\nNetwork:\n  Cidr: 10.0.0.0/16\n  Zones: [a]\n')
+        overlay = self._write('prod.json', '{"Network": {"Cidr": "10.1.0.0/16"}}')
+        mapping = options.load_options([base, open(overlay)], ['Name=api'])
+        self.assertEqual(mapping, {
+            'Name': 'api',
+            'Network': {'Cidr': '10.1.0.0/16', 'Zones': ['a']},
+        })
+        self.assertEqual(options.load_options(), {})
+
+    def test_safe(self):
+        path = self._write('unsafe.yaml', 'Value: !!python/object/apply:os.getcwd []\n')
+        with self.assertRaises(Exception):
+            options.load_options([path])
+
+    def test_parse_cache(self):
+        path = self._write('options.yaml', 'Zones: [a, b]\n')
+        with open(path) as f:
+            first = options.load_options_file(f)
+        first['Zones'].append('c')
+
+        # Loading it again doesn't parse it again, and gives a fresh copy
+        with mock.patch('cfn_pyplates.options.load_yaml') as load_yaml:
+            with open(path) as f:
+                self.assertEqual(options.load_options_file(f), {'Zones': ['a', 'b']})
+            self.assertFalse(load_yaml.called)
+
+        # Changing the file is noticed
+        self._write('options.yaml', 'Zones: [a, b, c, d]\n')
+        with open(path) as f:
+            self.assertEqual(options.load_options_file(f), {'Zones': ['a', 'b', 'c', 'd']})
+
+    def test_missing(self):
+        mapping = OptionsMapping({'Name': 'web'})
+        mapping.interactive = False
+        with mock.patch('__builtin__.raw_input') as raw_input:
+            self.assertEqual(mapping['Name'], 'web')
+            self.assertEqual(mapping['Size'], '<missing option Size>')
+            # Missing options used as dicts give placeholders too
+            self.assertIsInstance(mapping['Network']['Cidr'], options.MissingOption)
+            mapping['Size']
+        self.assertFalse(raw_input.called)
+        self.assertEqual(mapping.keys(), ['Name'])
+
+        self.assertEqual(mapping.missing.keys(), ['Size', 'Network'])
+        filename, lineno, line = mapping.missing['Size'][1]
+        self.assertEqual(filename, __file__.replace('.pyc', '.py'))
+        self.assertEqual(line, "mapping['Size']")
+
+        with self.assertRaises(exceptions.MissingOptionsError) as raised:
+            mapping.check_missing('TypeError: oops')
+        message = raised.exception.message.splitlines()
+        self.assertEqual(message[0], '2 options are missing from the options mapping:')
+        self.assertEqual(message[-1], 'The pyplate then failed with TypeError: oops')
+
+    def test_interactive(self):
+        # Prompting depends on stdin being a terminal, unless it's set
+        mapping = OptionsMapping()
+        with mock.patch('sys.stdin') as stdin:
+            stdin.isatty.return_value = False
+            self.assertFalse(mapping._is_interactive())
+            stdin.isatty.return_value = True
+            self.assertTrue(mapping._is_interactive())
+            mapping.interactive = False
+            self.assertFalse(mapping._is_interactive())
@@ -0,0 +1,168 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import unittest
+
+from cfn_pyplates import exceptions
+from cfn_pyplates.core import (CloudFormationTemplate, Condition, DependsOn, Output, Parameter,
+    Resource, Resources)
+from cfn_pyplates.functions import c_equals, c_if, c_ref, find_in_map, get_att, join, ref
+from cfn_pyplates.references import DanglingReference, Reference, find_references
+from cfn_pyplates.sharing import SharedDict
+
+
+class FindReferencesTestCase(unittest.TestCase):
+    def test_functions(self):
+        references = find_references({
+            'A': ref('One'),
+            'B': [get_att('Two', 'Arn'), {'Fn::GetAtt': 'Three.Arn'}],
+            'C': join('', 'x', c_if('Four', find_in_map('Five', ref('Six'), 'x'), c_ref('Seven'))),
+            'D': {'Fn::Sub': ['${Eight}-${Nine.Arn}-${Ten}', {'Ten': ref('Eleven')}]},
+            'E': {'Ref': 'Twelve', 'NotAFunction': True},
+        })
+        self.assertEqual(sorted(references), sorted([
+            Reference('Ref', 'One'),
+            Reference('Fn::GetAtt', 'Two'),
+            Reference('Fn::GetAtt', 'Three'),
+            Reference('Condition', 'Four'),
+            Reference('Fn::FindInMap', 'Five'),
+            Reference('Ref', 'Six'),
+            Reference('Condition', 'Seven'),
+            Reference('Ref', 'Eight'),
+            Reference('Fn::GetAtt', 'Nine'),
+            Reference('Ref', 'Eleven'),
+        ]))
+
+
+class ReferenceIndexTestCase(unittest.TestCase):
+    def test_references(self):
+        cft = CloudFormationTemplate('References test')
+        cft.conditions.add(Condition('IsProd', c_equals(ref('Environment'), 'prod')))
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+            'ImageId': find_in_map('AMIs', ref('AWS::Region'), 'HVM'),
+            'SubnetId': ref('Subnet'),
+            'InstanceType': c_if('IsProd', 'm3.large', 'm3.medium'),
+            'UserData': {'Fn::Sub': '${AWS::StackName} ${VPC.CidrBlock} ${!Literal} ${Local}'},
+        }, [DependsOn('VPC')]))
+        self.assertEqual(sorted(cft.references.references('Resources', 'Web')), [
+            Reference('Condition', 'IsProd'),
+            Reference('DependsOn', 'VPC'),
+            Reference('Fn::FindInMap', 'AMIs'),
+            Reference('Fn::GetAtt', 'VPC'),
+            Reference('Ref', 'AWS::Region'),
+            Reference('Ref', 'AWS::StackName'),
+            Reference('Ref', 'Local'),
+            Reference('Ref', 'Subnet'),
+        ])
+        self.assertEqual(cft.references.references('Conditions', 'IsProd'),
+            (Reference('Ref', 'Environment'),))
+
+    def test_referrers(self):
+        cft = CloudFormationTemplate('References test')
+        cft.resources.add(Resource('VPC', 'AWS::EC2::VPC'))
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': ref('VPC')}))
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {'SubnetId': ref('Subnet')},
+            [DependsOn('VPC')]))
+        cft.outputs.add(Output('Address', get_att('Web', 'PublicIp')))
+        self.assertEqual(cft.references.referrers('VPC'),
+            [('Resources', 'Subnet'), ('Resources', 'Web')])
+        self.assertEqual(cft.references.referrers('VPC', 'Ref'), [('Resources', 'Subnet')])
+        self.assertEqual(cft.references.referrers('Web'), [('Outputs', 'Address')])
+        self.assertEqual(cft.references.referrers('Address'), [])
+
+    def test_dangling(self):
+        cft = CloudFormationTemplate('References test')
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+            'UserData': {'Fn::Sub': '${AWS::StackName} ${!Literal} ${Local}'},
+        }))
+        # Local is only defined in the resource's Fn::Sub string
+        self.assertEqual(cft.references.dangling(),
+            [DanglingReference('Resources', 'Web', 'Ref', 'Local')])
+
+        with self.assertRaises(exceptions.DanglingReferenceError) as context:
+            cft.references.check()
+        self.assertEqual(context.exception.dangling, cft.references.dangling())
+        self.assertIn("Resources.Web refers to Local with Ref, which isn't a parameter or "
+            "resource", str(context.exception))
+
+        cft.parameters.add(Parameter('Local', 'String'))
+        self.assertEqual(cft.references.dangling(), [])
+        cft.references.check()
+
+    def test_suggestions(self):
+        cft = CloudFormationTemplate('References test')
+        cft.conditions.add(Condition('IsProd', c_equals(ref('AWS::Region'), 'us-east-1')))
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet'))
+        cft.resources.add(Resource('Other', 'AWS::EC2::Instance', {'SubnetId': ref('Subnett')}))
+        cft.outputs.add(Output('Prod', c_if('IsProdd', 'yes', 'no')))
+        with self.assertRaises(exceptions.DanglingReferenceError) as context:
+            cft.references.check()
+        self.assertIn('Subnett with Ref, which isn\'t a parameter or resource '
+            '(did you mean Subnet?)', str(context.exception))
+        self.assertIn('IsProdd with Condition, which isn\'t a condition '
+            '(did you mean IsProd?)', str(context.exception))
+
+    def test_maintained(self):
+        cft = CloudFormationTemplate('References test')
+        cft.resources.add(Resource('VPC', 'AWS::EC2::VPC'))
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': ref('VPC')}))
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {'SubnetId': ref('Subnet')}))
+        cft.outputs.add(Output('Address', get_att('Web', 'PublicIp')))
+        self.assertEqual(cft.references.referrers('Subnet'), [('Resources', 'Web')])
+
+        # Removing an entry forgets its references, and makes references to it dangle
+        cft.resources.remove(cft.resources['Web'])
+        self.assertEqual(cft.references.referrers('Subnet'), [])
+        del cft.resources['VPC']
+        self.assertEqual(cft.references.dangling(), [
+            DanglingReference('Outputs', 'Address', 'Fn::GetAtt', 'Web'),
+            DanglingReference('Resources', 'Subnet', 'Ref', 'VPC'),
+        ])
+        del cft.outputs['Address']
+
+        # Replacing an entry replaces its references
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': 'vpc-1234'}))
+        self.assertEqual(cft.references.dangling(), [])
+
+        # So does replacing a whole section
+        cft.resources = Resources()
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': ref('Nope')}))
+        self.assertEqual(cft.references.dangling(),
+            [DanglingReference('Resources', 'Subnet', 'Ref', 'Nope')])
+        cft.resources.clear()
+        self.assertEqual(cft.references.dangling(), [])
+
+    def test_changed_after_adding(self):
+        cft = CloudFormationTemplate('References test')
+        cft.resources.add(Resource('VPC', 'AWS::EC2::VPC'))
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': ref('VPC')}))
+        subnet = cft.resources['Subnet']
+        self.assertEqual(cft.references.referrers('VPC', 'Ref'), [('Resources', 'Subnet')])
+
+        # Changes made after the index has looked at an entry need a rescan
+        subnet['Properties']['VpcId'] = 'vpc-1234'
+        self.assertEqual(cft.references.referrers('VPC', 'Ref'), [('Resources', 'Subnet')])
+        cft.references.rescan()
+        self.assertEqual(cft.references.referrers('VPC', 'Ref'), [])
+
+    def test_shared(self):
+        # Sharing doesn't get in the way, and nothing shared is copied to scan it
+        cft = CloudFormationTemplate('References test', share=True)
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+            'UserData': {'Fn::Sub': '${AWS::StackName} ${Local}'},
+        }))
+        properties = dict.__getitem__(dict.__getitem__(cft.resources, 'Web'), 'Properties')
+        user_data = dict.__getitem__(properties, 'UserData')
+        self.assertIsInstance(user_data, SharedDict)
+        self.assertEqual(cft.references.dangling(),
+            [DanglingReference('Resources', 'Web', 'Ref', 'Local')])
+        self.assertIs(dict.__getitem__(properties, 'UserData'), user_data)
@@ -0,0 +1,205 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+import json
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+from textwrap import dedent
+
+import mock
+
+from cfn_pyplates import exceptions, serve
+
+
+class ServerTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        environ_patcher = mock.patch.dict('os.environ',
+            {'CFN_PYPLATES_CACHE_DIR': os.path.join(self.workdir, 'cache')})
+        environ_patcher.start()
+        self.addCleanup(environ_patcher.stop)
+
+        self.path = os.path.join(self.workdir, 'server.sock')
+        self.server = serve.Server(self.path, 2)
+        self.server.listen()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.close)
+
+        self._write('pyplate.py', u'''\
+        cft = CloudFormationTemplate(options['Description'])
+        ''')
+        self._write('options.yaml', 'Description: From a file\n')
+
+    def _write(self, name, contents):
+        with open(os.path.join(self.workdir, name), 'w') as f:
+            f.write(dedent(contents))
+
+    def test_template(self):
+        reply = serve.request(self.path, {
+            'pyplate': 'pyplate.py',
+            'options': '-',
+            'options_text': 'Description: From the client',
+            'cwd': self.workdir,
+            'minify': True,
+        })
+        self.assertTrue(reply['ok'])
+        self.assertEqual(json.loads(reply['template'])['Description'], 'From the client')
+        self.assertNotIn('\n', reply['template'])
+
+    def test_outfile(self):
+        outfile = os.path.join(self.workdir, 'out.json')
+        for i in range(2):
+            reply = serve.request(self.path, {
+                'pyplate': os.path.join(self.workdir, 'pyplate.py'),
+                'options': os.path.join(self.workdir, 'options.yaml'),
+                'outfile': outfile,
+            })
+            self.assertTrue(reply['ok'])
+            self.assertEqual(reply['outfile'], outfile)
+            with open(outfile) as f:
+                self.assertEqual(json.load(f)['Description'], 'From a file')
+
+    def test_errors(self):
+        self._write('broken.py', u'''\
+        cft = CloudFormationTemplate('Broken')
+        cft.resources.add(Resource('Subnet', 'AWS::EC2::Subnet', {'VpcId': ref('VCP')}))
+        ''')
+        reply = serve.request(self.path,
+            {'pyplate': 'broken.py', 'cwd': self.workdir, 'check_refs': True})
+        self.assertFalse(reply['ok'])
+        self.assertEqual(reply['error']['type'], 'DanglingReferenceError')
+        self.assertIn('refers to VCP with Ref', reply['error']['message'])
+        self.assertIn('Traceback', reply['error']['traceback'])
+
+        # Requests that aren't jobs get an error too, and don't stop the server
+        reply = serve.request(self.path, ['pyplate.py'])
+        self.assertEqual(reply['error']['message'], 'A request must be a JSON object')
+        reply = serve.request(self.path, {'options': 'options.yaml'})
+        self.assertEqual(reply['error']['type'], 'Error')
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(self.path)
+        connection.sendall('not json\n')
+        self.assertIn('ValueError', connection.recv(65536))
+        connection.close()
+
+    def test_changed_modules(self):
+        # Workers import a module again when it changes, and each job starts
+        # in the worker's own directory and sys.path
+        self._write('imports.py', u'''\
+        import os, sys
+        sys.path.insert(0, os.getcwd())
+        import base
+        cft = CloudFormationTemplate(base.DESCRIPTION)
+        ''')
+        base = os.path.join(self.workdir, 'base.py')
+        for i, description in enumerate(['First', 'Second']):
+            self._write('base.py', 'DESCRIPTION = {0!r}\n'.format(description))
+            os.utime(base, (1000000000 + i, 1000000000 + i))
+            for _ in range(3):
+                reply = serve.request(self.path,
+                    {'pyplate': 'imports.py', 'cwd': self.workdir, 'cache': False})
+                self.assertTrue(reply['ok'], reply.get('error'))
+                self.assertEqual(json.loads(reply['template'])['Description'], description)
+
+        cwd = os.getcwd()
+        path = list(sys.path)
+        reply = serve.run_request({'pyplate': 'imports.py', 'cwd': self.workdir})
+        self.assertTrue(reply['ok'], reply.get('error'))
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(sys.path, path)
+        sys.modules.pop('base', None)
+
+    def test_environ(self):
+        # Jobs run with the environment they're sent, and only that job does
+        self._write('environ.py', u'''\
+        import os
+        cft = CloudFormationTemplate(os.environ.get('STAGE', 'No stage'))
+        ''')
+        job = {'pyplate': 'environ.py', 'cwd': self.workdir, 'cache': False}
+        for environ, description in [({'STAGE': 'Production'}, 'Production'), (None, 'No stage')]:
+            reply = serve.request(self.path, dict(job, environ=environ))
+            self.assertTrue(reply['ok'], reply.get('error'))
+            self.assertEqual(json.loads(reply['template'])['Description'], description)
+
+        environ = dict(os.environ)
+        reply = serve.run_request(dict(job, environ={'STAGE': 'Testing'}))
+        self.assertEqual(json.loads(reply['template'])['Description'], 'Testing')
+        self.assertEqual(os.environ, environ)
+
+    def test_connections(self):
+        # Once a server's handling all the connections it can, the rest wait
+        # to be accepted
+        server = serve.Server(os.path.join(self.workdir, 'limited.sock'), 1, connections=1)
+        server.listen()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.close)
+
+        waiting = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        waiting.connect(server.path)
+        replies = []
+        client = threading.Thread(target=lambda: replies.append(serve.request(server.path,
+            {'pyplate': 'pyplate.py', 'options': 'options.yaml', 'cwd': self.workdir})))
+        client.start()
+        client.join(0.5)
+        self.assertEqual(replies, [])
+
+        waiting.sendall('{}\n')
+        self.assertIn('needs a pyplate', waiting.recv(65536))
+        waiting.close()
+        client.join()
+        self.assertTrue(replies[0]['ok'], replies[0].get('error'))
+
+    def test_batch(self):
+        self._write('manifest.yaml', json.dumps([
+            {'pyplate': 'pyplate.py', 'options': 'options.yaml', 'outfile': 'out.json'},
+            {'pyplate': 'missing.py', 'outfile': 'missing.json'},
+        ]))
+        reply = serve.request(self.path, {'batch': 'manifest.yaml', 'cwd': self.workdir})
+        self.assertFalse(reply['ok'])
+        self.assertEqual([result['ok'] for result in reply['results']], [True, False])
+        self.assertEqual(reply['results'][1]['error']['type'], 'IOError')
+        self.assertTrue(os.path.exists(os.path.join(self.workdir, 'out.json')))
+
+    def test_socket(self):
+        # Only the user running the server can connect, and a second server
+        # can't take over the socket
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0600)
+        with self.assertRaises(exceptions.Error):
+            serve.Server(self.path).listen()
+
+        # A socket left behind by a server that's gone is replaced
+        self.server.close()
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+        server = serve.Server(self.path, 1)
+        server.listen()
+        server.close()
+        self.assertFalse(os.path.exists(self.path))
+
+        # Anything else there is left alone
+        self._write('server.sock', 'not a socket')
+        with self.assertRaises(exceptions.Error) as context:
+            serve.Server(self.path).listen()
+        self.assertEqual(context.exception.message,
+            '{0} exists and isn\'t a socket'.format(self.path))
+        self.assertTrue(os.path.exists(self.path))
@@ -0,0 +1,96 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import copy
+import unittest
+
+from cfn_pyplates import sharing
+from cfn_pyplates.core import CloudFormationTemplate, Resource, ec2_tags
+from cfn_pyplates.functions import c_if, ref
+
+
+def make_bucket(name):
+    return Resource(name, 'AWS::S3::Bucket', {
+        'AccessControl': 'Private',
+        'CorsConfiguration': {'CorsRules': [
+            {'AllowedMethods': ['GET', 'HEAD'], 'AllowedOrigins': ['*'], 'MaxAge': 3600},
+        ]},
+        'Tags': ec2_tags({'Environment': ref('Environment'), 'Team': 'platform'}),
+    })
+
+
+def raw(value, *keys):
+    # Look up a value without copying anything shared on the way
+    for key in keys:
+        value = dict.__getitem__(value, key)
+    return value
+
+
+class SharingTestCase(unittest.TestCase):
+    def test_shared(self):
+        cft = CloudFormationTemplate('Sharing test', share=True)
+        cft.resources.add(make_bucket('First'))
+        cft.resources.add(make_bucket('Second'))
+        first = raw(cft.resources, 'First', 'Properties', 'CorsConfiguration')
+        self.assertIs(first, raw(cft.resources, 'Second', 'Properties', 'CorsConfiguration'))
+        self.assertIsInstance(first, sharing.SharedDict)
+
+    def test_same_output(self):
+        # Shared as they're added, not shared, and shared afterwards
+        templates = []
+        for share in (True, False, False):
+            cft = CloudFormationTemplate('Sharing test', share=share)
+            cft.resources.add(make_bucket('First'))
+            cft.resources.add(make_bucket('Second'))
+            templates.append(cft)
+        shared, plain, shared_later = templates
+        shared_later.share_subtrees()
+        self.assertEqual(shared.json, plain.json)
+        self.assertEqual(shared_later.json, plain.json)
+
+    def test_copy_on_write(self):
+        cft = CloudFormationTemplate('Sharing test', share=True)
+        expected = CloudFormationTemplate('Sharing test')
+        for template in (cft, expected):
+            template.resources.add(make_bucket('First'))
+            template.resources.add(make_bucket('Second'))
+            properties = template.resources['First']['Properties']
+            properties['Tags'][1]['Value'] = 'changed'
+            properties['CorsConfiguration']['CorsRules'][0]['AllowedMethods'].append('PUT')
+        self.assertEqual(cft.json, expected.json)
+        self.assertEqual(cft.resources['Second']['Properties']['Tags'][1]['Value'], 'platform')
+
+    def test_read_only(self):
+        cft = CloudFormationTemplate('Sharing test', share=True)
+        cft.resources.add(make_bucket('First'))
+        tags = raw(cft.resources, 'First', 'Properties', 'Tags')
+        with self.assertRaises(TypeError):
+            tags.append({'Key': 'New', 'Value': 'Tag'})
+        with self.assertRaises(TypeError):
+            tags[0]['Value'] = 'changed'
+
+    def test_unshareable(self):
+        # Dicts holding something that can still change are copied, not shared
+        unshareable = {'Value': c_if('Condition', {'Key': 'Value'}, 'x'), 'Other': ['a']}
+        shared = sharing.share(unshareable)
+        self.assertIsInstance(shared, sharing.CopyOnWriteDict)
+        self.assertEqual(shared.keys(), unshareable.keys())
+        self.assertIsInstance(dict.__getitem__(shared, 'Other'), sharing.SharedList)
+        self.assertIs(sharing.share(['a', 1]), sharing.share(['a', 1]))
+        # Equal in python, but they encode differently
+        self.assertIsNot(sharing.share([1]), sharing.share([True]))
+        self.assertIsNot(sharing.share([0.0]), sharing.share([-0.0]))
+
+    def test_copy(self):
+        shared = sharing.share({'Key': 'Value'})
+        self.assertIs(copy.deepcopy(shared), shared)
+        self.assertEqual(copy.deepcopy([shared]), [{'Key': 'Value'}])
@@ -0,0 +1,172 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from cfn_pyplates import exceptions, spec
+from cfn_pyplates.core import CloudFormationTemplate, Output, Properties, Resource, ec2_tags
+from cfn_pyplates.functions import get_att, ref
+
+# A small part of the resource specification
+SPEC = {
+    'ResourceSpecificationVersion': '1.0.0',
+    'PropertyTypes': {
+        'AWS::EC2::Instance.BlockDeviceMapping': {'Properties': {
+            'DeviceName': {'PrimitiveType': 'String', 'Required': True},
+            'NoDevice': {'PrimitiveType': 'Boolean'},
+        }},
+        'AWS::EC2::Instance.CpuOptions': {'Properties': {
+            'CoreCount': {'PrimitiveType': 'Integer'},
+        }},
+        'Tag': {'Properties': {
+            'Key': {'PrimitiveType': 'String', 'Required': True},
+            'Value': {'PrimitiveType': 'String', 'Required': True},
+        }},
+    },
+    'ResourceTypes': {
+        'AWS::EC2::Instance': {
+            'Attributes': {'PrivateIp': {'PrimitiveType': 'String'}},
+            'Properties': {
+                'BlockDeviceMappings': {'Type': 'List', 'ItemType': 'BlockDeviceMapping'},
+                'CpuOptions': {'Type': 'CpuOptions'},
+                'ImageId': {'PrimitiveType': 'String', 'Required': True},
+                'InstanceType': {'PrimitiveType': 'String'},
+                'SecurityGroups': {'Type': 'List', 'PrimitiveItemType': 'String'},
+                'Tags': {'Type': 'List', 'ItemType': 'Tag'},
+            },
+        },
+        'AWS::SNS::Topic': {'Attributes': {'TopicName': {'PrimitiveType': 'String'}},
+            'Properties': {'TopicName': {'PrimitiveType': 'String'}}},
+        'AWS::AutoScaling::AutoScalingGroup': {'Properties': {
+            'MaxSize': {'PrimitiveType': 'String', 'Required': True},
+            'DesiredCapacity': {'PrimitiveType': 'Integer'},
+        }},
+    },
+}
+
+
+class ResourceSpecTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.spec = spec.ResourceSpec.from_json(SPEC)
+
+    def test_valid(self):
+        cft = CloudFormationTemplate('Spec test')
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+            'ImageId': ref('ImageId'),
+            'InstanceType': 't2.micro',
+            'SecurityGroups': [ref('Group'), 'sg-1234'],
+            'BlockDeviceMappings': [{'DeviceName': '/dev/sdb', 'NoDevice': 'true'}],
+            'Tags': ec2_tags({'Name': 'web'}),
+        }))
+        cft.resources.add(Resource('Group', 'AWS::AutoScaling::AutoScalingGroup', {
+            'MaxSize': 4,
+            'DesiredCapacity': '2',
+        }))
+        cft.resources.add(Resource('Callback', 'Custom::Callback', {'Anything': [1, 2]}))
+        cft.outputs.add(Output('Address', get_att('Web', 'PrivateIp')))
+        self.assertEqual(self.spec.problems(cft), [])
+        self.spec.check(cft)
+
+    def test_problems(self):
+        cft = CloudFormationTemplate('Spec test')
+        cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+            'InstanceTyp': 't2.micro',
+            'SecurityGroups': 'sg-1234',
+            'BlockDeviceMappings': [{'DeviceName': '/dev/sdb', 'NoDevice': 'nope'}],
+        }))
+        cft.resources.add(Resource('Group', 'AWS::AutoScaling::AutoScalingGroup', {
+            'MaxSize': 4,
+            'DesiredCapacity': 2.5,
+        }))
+        cft.resources.add(Resource('Typo', 'AWS::EC2::Instanse'))
+        cft.outputs.add(Output('Name', get_att('Web', 'PrivateIP')))
+
+        # Properties are checked in the order they were added, which for a
+        # plain dict is arbitrary
+        self.assertEqual(sorted(self.spec.problems(cft)), sorted([
+            (('Resources', 'Web', 'Properties', 'SecurityGroups'), 'should be a list'),
+            (('Resources', 'Web', 'Properties', 'BlockDeviceMappings', 0, 'NoDevice'),
+                "should be a Boolean, not 'nope'"),
+            (('Resources', 'Web', 'Properties', 'InstanceTyp'),
+                "isn't a property of AWS::EC2::Instance (did you mean InstanceType?)"),
+            (('Resources', 'Web', 'Properties'),
+                'is missing ImageId, which AWS::EC2::Instance requires'),
+            (('Resources', 'Group', 'Properties', 'DesiredCapacity'),
+                'should be an Integer, not 2.5'),
+            (('Resources', 'Typo'),
+                "AWS::EC2::Instanse isn't a resource type (did you mean AWS::EC2::Instance?)"),
+            (('Outputs', 'Name'),
+                "gets Web.PrivateIP, which AWS::EC2::Instance doesn't have (did you mean "
+                "PrivateIp?)"),
+        ]))
+
+        with self.assertRaises(exceptions.SpecificationError) as context:
+            self.spec.check(cft)
+        message = context.exception.message
+        self.assertTrue(message.startswith('7 problem(s) with resources:\n'))
+        self.assertIn('\n  Resources.Typo: AWS::EC2::Instanse isn\'t a resource type', message)
+        self.assertIn('\n  Resources.Web.Properties.BlockDeviceMappings[0].NoDevice should be',
+            message)
+        self.assertEqual(len(context.exception.problems), 7)
+
+    def test_no_properties(self):
+        resource_spec = spec.ResourceSpec.from_json({'ResourceTypes': {
+            'AWS::CloudFormation::WaitConditionHandle': {}}})
+        cft = CloudFormationTemplate('No properties')
+        cft.resources.add(Resource('Handle', 'AWS::CloudFormation::WaitConditionHandle'))
+        self.assertEqual(resource_spec.problems(cft), [])
+        cft.resources['Handle'].add(Properties({'Timeout': 60}))
+        self.assertEqual(resource_spec.problems(cft), [
+            (('Resources', 'Handle', 'Properties', 'Timeout'),
+                'isn\'t a property of AWS::CloudFormation::WaitConditionHandle, which has none'),
+        ])
+
+    def test_load(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        path = os.path.join(workdir, 'spec.json')
+        with open(path, 'w') as spec_file:
+            json.dump(SPEC, spec_file)
+
+        with mock.patch.dict('os.environ', {'CFN_PYPLATES_CACHE_DIR': workdir}):
+            loaded = spec.ResourceSpec.load(path)
+            self.assertEqual(dict((name, loaded.resource_types[name])
+                for name in loaded.resource_types), self.spec.resource_types)
+            self.assertEqual(loaded.version, '1.0.0')
+            self.assertTrue(os.path.exists(spec._index_path(path)))
+
+            # The index is used without parsing the specification again
+            with mock.patch('cfn_pyplates.spec.json.loads') as loads:
+                cached = spec.ResourceSpec.load(path)
+            self.assertFalse(loads.called)
+            self.assertEqual(spec._marshal_each(cached.property_types),
+                spec._marshal_each(loaded.property_types))
+            cft = CloudFormationTemplate('Spec test')
+            cft.resources.add(Resource('Web', 'AWS::EC2::Instance', {
+                'ImageId': 'ami-12345',
+                'BlockDeviceMappings': [{'DeviceName': '/dev/sdb'}],
+            }))
+            self.assertEqual(cached.problems(cft), [])
+            self.assertEqual(cached.digest, loaded.digest)
+
+            # A changed specification is parsed again
+            changed = dict(SPEC, ResourceSpecificationVersion='1.1.0')
+            with open(path, 'w') as spec_file:
+                json.dump(changed, spec_file, indent=2)
+            self.assertEqual(spec.ResourceSpec.load(path).version, '1.1.0')
+            self.assertEqual(spec.ResourceSpec.load(path).version, '1.1.0')
@@ -0,0 +1,86 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+import gc
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from cfn_pyplates import core, timing
+
+
+class ProfileTestCase(unittest.TestCase):
+    def test_phases(self):
+        profile = timing.Profile()
+        for i in range(2):
+            with profile.phase('run'):
+                pass
+        with self.assertRaises(ValueError):
+            with profile.phase('serialize'):
+                raise ValueError
+        self.assertEqual(profile.phases.keys(), ['run', 'serialize'])
+        self.assertEqual(profile.phases['run']['calls'], 2)
+        self.assertNotIn('objects', profile.phases['run'])
+
+        # Without a profile, phases aren't timed
+        with timing.phase(None, 'run'):
+            pass
+
+    def test_count_objects(self):
+        profile = timing.Profile(count_objects=True)
+        # Collecting other garbage during the phase would throw the count off
+        gc.collect()
+        with profile.phase('run'):
+            kept = [[] for i in range(1000)]
+        self.assertGreaterEqual(profile.phases['run']['objects'], len(kept))
+
+    def test_merge(self):
+        profile, job_profile = timing.Profile(), timing.Profile()
+        profile.add('run', 1.0, 0.5)
+        job_profile.add('run', 2.0, 1.5, 10)
+        job_profile.add('compile', 0.25, 0.25)
+        profile.merge(job_profile, pyplate='web.py')
+        self.assertEqual(dict(profile.phases['run']),
+            {'calls': 2, 'wall': 3.0, 'cpu': 2.0, 'objects': 10})
+        self.assertEqual(profile.total(), (3.25, 2.25))
+        self.assertEqual(profile.jobs, [{'pyplate': 'web.py', 'phases': job_profile.phases}])
+
+    def test_report(self):
+        profile = timing.Profile()
+        profile.add('run', 1.0, 0.5)
+        profile.add('compile', 3.0, 2.5)
+        stream = StringIO()
+        profile.report(stream)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['phase', 'calls', 'wall', '%', 'cpu'])
+        # Slowest first
+        self.assertEqual(lines[1].split(), ['compile', '1', '3.000s', '75.0%', '2.500s'])
+        self.assertEqual(lines[3].split(), ['total', '4.000s', '3.000s'])
+
+    def test_generate_pyplate(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        pyplate = os.path.join(workdir, 'pyplate.py')
+        with open(pyplate, 'w') as f:
+            f.write("cft = CloudFormationTemplate('Profiled')\n")
+
+        profile = timing.Profile()
+        core.generate_pyplate(pyplate, {}, check_refs=True, profile=profile)
+        self.assertEqual(profile.phases.keys(),
+            ['compile', 'run', 'find template', 'check refs', 'serialize'])
+
+        path = os.path.join(workdir, 'profile.json')
+        profile.write_json(path)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['phases']['run']['calls'], 1)
@@ -0,0 +1,91 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from cStringIO import StringIO
+from textwrap import dedent
+
+from cfn_pyplates import core, tracing
+
+
+class TracerTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self._write('tracedhelpers.py', u'''\
+        from cfn_pyplates.core import Resource
+
+
+        def topic(i):
+            return Resource('Topic{0}'.format(i), 'AWS::SNS::Topic', {'DisplayName': str(i)})
+        ''')
+        self.pyplate = self._write('pyplate.py', u'''\
+        import tracedhelpers
+        cft = CloudFormationTemplate('Traced')
+        for i in range(5):
+            cft.resources.add(tracedhelpers.topic(i))
+        cft.resources.add(Resource('Queue', 'AWS::SQS::Queue'))
+        ''')
+        sys.path.insert(0, self.workdir)
+        self.addCleanup(sys.path.remove, self.workdir)
+        self.addCleanup(sys.modules.pop, 'tracedhelpers', None)
+
+        self.tracer = tracing.Tracer()
+        core.generate_pyplate(self.pyplate, {}, tracer=self.tracer)
+
+    def _write(self, name, contents):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'w') as f:
+            f.write(dedent(contents))
+        return path
+
+    def test_lines(self):
+        self.assertIsNone(sys.gettrace())
+        lines = dict(((os.path.basename(filename), lineno), (dicts, resources))
+            for filename, lineno, seconds, dicts, resources in self.tracer.lines())
+        # Resources are charged to the line adding them, and their dicts to
+        # the line making them, in this case in a helper module
+        self.assertEqual(lines['pyplate.py', 4], (0, 5))
+        self.assertEqual(lines['pyplate.py', 5], (1, 1))
+        self.assertEqual(lines['tracedhelpers.py', 5], (10, 0))
+        # cfn_pyplates itself isn't traced
+        self.assertFalse([line for line in lines if line[0] == 'core.py'])
+
+    def test_functions(self):
+        functions = dict(((name, os.path.basename(filename)), (dicts, resources))
+            for name, filename, seconds, dicts, resources in self.tracer.functions())
+        self.assertEqual(functions['topic', 'tracedhelpers.py'], (10, 0))
+        # A function's totals include the functions it called, and the template's
+        # sections are dicts too
+        self.assertEqual(functions['<module>', 'pyplate.py'], (18, 6))
+
+    def test_write_collapsed(self):
+        stacks = StringIO()
+        self.tracer.write_collapsed(stacks, 'dicts')
+        self.assertIn(';topic (', stacks.getvalue())
+        for line in stacks.getvalue().splitlines():
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('<module> ('))
+            self.assertGreater(int(count), 0)
+        with self.assertRaises(ValueError):
+            self.tracer.write_collapsed(stacks, 'lines')
+
+    def test_report(self):
+        report = StringIO()
+        self.tracer.report(report, limit=3)
+        lines = report.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['self', '%', 'dicts', 'resources', 'line'])
+        self.assertEqual(lines[4], '')
+        self.assertEqual(lines[5].split(), ['total', '%', 'dicts', 'resources', 'function'])
@@ -0,0 +1,137 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+
+from cfn_pyplates import exceptions, spec, typed
+from cfn_pyplates.core import CloudFormationTemplate, DependsOn
+from cfn_pyplates.functions import ref
+
+from tests.test_spec import SPEC
+
+
+class TypedTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        self.spec = spec.ResourceSpec.from_json(SPEC)
+        self.written = typed.write_package(self.spec, os.path.join(workdir, 'typed_resources'))
+
+        sys.path.insert(0, workdir)
+        self.addCleanup(sys.path.remove, workdir)
+        self.addCleanup(self._unload)
+        import typed_resources
+        self.package = typed_resources
+
+    def _unload(self):
+        for name in list(sys.modules):
+            if name.split('.')[0] == 'typed_resources':
+                del sys.modules[name]
+
+    def test_write_package(self):
+        self.assertEqual(sorted(os.path.basename(path) for path in self.written), [
+            '__init__.py', 'aws_autoscaling.py', 'aws_ec2.py', 'aws_sns.py', 'common.py'])
+        self.assertEqual(dir(self.package)[:3], ['AutoScaling', 'EC2', 'SNS'])
+
+    def test_lazy_loading(self):
+        self.assertNotIn('typed_resources.aws_ec2', sys.modules)
+        from typed_resources import EC2
+        self.assertIn('typed_resources.aws_ec2', sys.modules)
+        self.assertNotIn('typed_resources.aws_sns', sys.modules)
+        self.assertIs(EC2, self.package.aws_ec2)
+        self.assertIs(EC2.Instance.Tag, self.package.common.Tag)
+        self.assertRaises(AttributeError, getattr, self.package, 'EC3')
+
+    def test_resource(self):
+        EC2 = self.package.EC2
+        cft = CloudFormationTemplate('Typed test')
+        web = cft.resources.add(EC2.Instance('Web', {'ImageId': ref('ImageId')},
+            DependsOn('Group'), InstanceType='t2.micro',
+            BlockDeviceMappings=[EC2.Instance.BlockDeviceMapping(DeviceName='/dev/sdb')]))
+        web.Tags = [EC2.Instance.Tag(Key='Name', Value='web')]
+        web['Properties'].SecurityGroups = ['sg-1234']
+
+        self.assertEqual(web.InstanceType, 't2.micro')
+        self.assertEqual(web['Properties'].Tags, [{'Key': 'Name', 'Value': 'web'}])
+        self.assertEqual(list(web), ['Type', 'Properties', 'DependsOn'])
+        self.assertEqual(list(web['Properties']), ['ImageId', 'BlockDeviceMappings',
+            'InstanceType', 'Tags', 'SecurityGroups'])
+        self.assertEqual(web['Type'], 'AWS::EC2::Instance')
+        self.assertEqual(self.spec.problems(cft), [])
+
+        # Plain properties set by key are made typed
+        topic = self.package.SNS.Topic('Topic')
+        self.assertNotIn('Properties', topic)
+        topic['Properties'] = {'TopicName': 'alerts'}
+        self.assertIsInstance(topic['Properties'], typed.TypedProperties)
+        self.assertRaises(exceptions.SpecificationError, topic.__setitem__, 'Properties',
+            {'TopicNam': 'alerts'})
+
+        copied = pickle.loads(pickle.dumps(web['Properties'], 2))
+        self.assertEqual(copied, web['Properties'])
+        self.assertRaises(exceptions.SpecificationError, copied.__setitem__, 'ImageId', [])
+
+    def test_checks(self):
+        EC2 = self.package.EC2
+        web = EC2.Instance('Web', ImageId='ami-12345')
+        with self.assertRaises(exceptions.SpecificationError) as context:
+            web.InstanceTyp = 't2.micro'
+        self.assertEqual(context.exception.message,
+            'InstanceTyp isn\'t a property of AWS::EC2::Instance (did you mean InstanceType?)')
+
+        with self.assertRaises(exceptions.SpecificationError) as context:
+            web['Properties']['BlockDeviceMappings'] = [{'NoDevice': 'nope'}]
+        self.assertEqual(context.exception.message,
+            'BlockDeviceMappings[0].NoDevice should be a Boolean, not \'nope\'; '
+            'BlockDeviceMappings[0] is missing DeviceName, which '
+            'AWS::EC2::Instance.BlockDeviceMapping requires')
+        self.assertEqual(len(context.exception.problems), 2)
+        self.assertNotIn('BlockDeviceMappings', web['Properties'])
+
+        self.assertRaises(exceptions.SpecificationError, EC2.Instance, 'Web',
+            SecurityGroups='sg-1234')
+        self.assertRaises(exceptions.SpecificationError, self.package.AutoScaling.AutoScalingGroup,
+            'Group', DesiredCapacity=2.5)
+        # Intrinsic functions can go anywhere
+        web.SecurityGroups = ref('Groups')
+
+        # Properties named after their property types are properties on resources
+        self.assertRaises(AttributeError, getattr, web, 'CpuOptions')
+        web.CpuOptions = EC2.Instance.CpuOptions(CoreCount=2)
+        self.assertEqual(web.CpuOptions, {'CoreCount': 2})
+        self.assertEqual(web['Properties']['CpuOptions'], {'CoreCount': 2})
+        self.assertRaises(exceptions.SpecificationError, setattr, web, 'CpuOptions',
+            {'CoreCount': 'two'})
+        self.assertIs(EC2.Instance.CpuOptions, self.package.aws_ec2.Instance_CpuOptions)
+        self.assertIs(web.Tag, self.package.common.Tag)
+
+        mapping = EC2.Instance.BlockDeviceMapping()
+        self.assertRaises(exceptions.SpecificationError, setattr, mapping, 'NoDevice', 'nope')
+        self.assertRaises(exceptions.SpecificationError, mapping.update, Device='/dev/sdb')
+        self.assertRaises(AttributeError, getattr, mapping, 'DeviceName')
+        mapping.setdefault('DeviceName', '/dev/sdb')
+        self.assertEqual(mapping.DeviceName, '/dev/sdb')
+        self.assertFalse(hasattr(mapping, '__dict__'))
+
+    def test_from_rows(self):
+        Topic = self.package.SNS.Topic
+        topics = Topic.from_rows([{'TopicName': 'alerts'}, {'TopicName': 'builds'}],
+            lambda row: row['TopicName'].capitalize())
+        self.assertEqual([topic.name for topic in topics], ['Alerts', 'Builds'])
+        self.assertEqual(topics[1].TopicName, 'builds')
+        self.assertRaises(exceptions.SpecificationError, Topic.from_rows, [{'TopicNam': 'a'}],
+            lambda row: 'Topic')
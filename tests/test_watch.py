@@ -0,0 +1,183 @@
+# Copyright (c) 2013 MetaMetrics, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from cStringIO import StringIO
+from textwrap import dedent
+
+import mock
+
+from cfn_pyplates import watch
+
+
+class WatchTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        stdout_patcher = mock.patch('sys.stdout', new=StringIO())
+        stdout_patcher.start()
+        self.addCleanup(stdout_patcher.stop)
+        # The pyplates in these tests import modules from the workdir
+        self.addCleanup(self._unload_modules)
+
+    def _unload_modules(self):
+        for name in ('watchbase', 'watchhelper'):
+            sys.modules.pop(name, None)
+        if self.workdir in sys.path:
+            sys.path.remove(self.workdir)
+
+    def _write(self, name, contents):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'w') as f:
+            f.write(dedent(contents))
+        # Make sure the change is visible, even within the mtime resolution
+        os.utime(path, (0, os.path.getmtime(path) + 1))
+        return path
+
+    def _output(self, name):
+        with open(os.path.join(self.workdir, name)) as f:
+            return json.load(f)['Description']
+
+    def _make_jobs(self):
+        self._write('watchhelper.py', "DESCRIPTION = 'one'\n")
+        self._write('watchbase.py', '''\
+        from watchhelper import DESCRIPTION
+        ''')
+        self._write('importing.py', '''\
+        import sys
+        sys.path.append({0!r})
+        import watchbase
+        cft = CloudFormationTemplate(watchbase.DESCRIPTION)
+        '''.format(self.workdir))
+        self._write('standalone.py', '''\
+        cft = CloudFormationTemplate('standalone')
+        ''')
+        return [
+            {'pyplate': os.path.join(self.workdir, 'importing.py'),
+             'outfile': os.path.join(self.workdir, 'importing.json')},
+            {'pyplate': os.path.join(self.workdir, 'standalone.py'),
+             'outfile': os.path.join(self.workdir, 'standalone.json')},
+        ]
+
+    def test_dependencies(self):
+        jobs = self._make_jobs()
+        w = watch.Watch(jobs, watcher=watch.PollingWatcher())
+        w.generate(jobs)
+        self.assertEqual(w.dependencies[id(jobs[0])], set([
+            os.path.join(self.workdir, 'importing.py'),
+            os.path.join(self.workdir, 'watchbase.py'),
+            os.path.join(self.workdir, 'watchhelper.py'),
+        ]))
+        self.assertEqual(w.dependencies[id(jobs[1])],
+            set([os.path.join(self.workdir, 'standalone.py')]))
+
+    def test_update_changed_module(self):
+        jobs = self._make_jobs()
+        w = watch.Watch(jobs, watcher=watch.PollingWatcher())
+        w.generate(jobs)
+        self.assertEqual(self._output('importing.json'), 'one')
+
+        # Changing the helper module reloads it, and the base module that uses it
+        changed = self._write('watchhelper.py', "DESCRIPTION = 'two'\n")
+        affected = w.update([changed])
+        self.assertEqual(affected, [jobs[0]])
+        self.assertEqual(self._output('importing.json'), 'two')
+
+    def test_update_failure_recovers(self):
+        jobs = self._make_jobs()
+        w = watch.Watch(jobs, watcher=watch.PollingWatcher())
+        w.generate(jobs)
+
+        broken = self._write('standalone.py', 'I am a broken pyplate.\n')
+        w.update([broken])
+        self.assertIn('SyntaxError', sys.stdout.getvalue())
+
+        fixed = self._write('standalone.py', "cft = CloudFormationTemplate('fixed')\n")
+        self.assertEqual(w.update([fixed]), [jobs[1]])
+        self.assertEqual(self._output('standalone.json'), 'fixed')
+
+    def test_changed_while_generating(self):
+        # A change made after a job read a file, but before the file was
+        # watched, is still seen
+        jobs = self._make_jobs()
+        w = watch.Watch(jobs, watcher=watch.PollingWatcher(interval=0.01), debounce=0.01)
+        w.generate(jobs)
+        changed = self._write('watchhelper.py', "DESCRIPTION = 'two'\n")
+        self.assertEqual(w.wait(), set([changed]))
+        self.assertEqual(w.update([changed]), [jobs[0]])
+        self.assertEqual(self._output('importing.json'), 'two')
+
+    def test_job_environment(self):
+        # Each job runs in the directory and sys.path the watch had before it
+        self._write('moving.py', '''\
+        import os, sys
+        sys.path.insert(0, 'nowhere')
+        os.chdir({0!r})
+        cft = CloudFormationTemplate('moving')
+        '''.format(self.workdir))
+        job = {'pyplate': os.path.join(self.workdir, 'moving.py'),
+            'outfile': os.path.join(self.workdir, 'moving.json')}
+        cwd = os.getcwd()
+        path = list(sys.path)
+        watch.Watch([job], watcher=watch.PollingWatcher()).generate([job])
+        self.assertEqual(self._output('moving.json'), 'moving')
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual(sys.path, path)
+
+    def test_drop_stale_modules(self):
+        self._make_jobs()
+        sys.path.append(self.workdir)
+        import watchbase  # NOQA
+        helper = os.path.join(self.workdir, 'watchhelper.py')
+        base = os.path.join(self.workdir, 'watchbase.py')
+        dropped = watch._drop_stale_modules(set([helper]), set([helper, base]))
+        self.assertEqual(dropped, set(['watchbase', 'watchhelper']))
+        self.assertNotIn('watchbase', sys.modules)
+
+
+class WatcherTestCase(unittest.TestCase):
+    def setUp(self):  # NOQA
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.path = os.path.join(self.workdir, 'watched.py')
+        with open(self.path, 'w') as f:
+            f.write('original')
+
+    def _check_watcher(self, watcher):
+        self.addCleanup(watcher.close)
+        watcher.watch([self.path])
+        self.assertEqual(watcher.wait(0.05), set())
+
+        with open(self.path, 'w') as f:
+            f.write('changed!')
+        os.utime(self.path, (0, 0))
+        self.assertEqual(watcher.wait(1), set([self.path]))
+
+    def test_polling_watcher(self):
+        self._check_watcher(watch.PollingWatcher(interval=0.01))
+
+    def test_inotify_watcher(self):
+        try:
+            watcher = watch.InotifyWatcher()
+        except OSError:
+            raise unittest.SkipTest('inotify is not available')
+        self._check_watcher(watcher)
+
+    def test_debounce(self):
+        watcher = mock.Mock()
+        watcher.wait.side_effect = [set(['a']), set(['b']), set()]
+        w = watch.Watch([], watcher=watcher, debounce=0.01)
+        self.assertEqual(w.wait(), set(['a', 'b']))